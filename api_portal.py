@@ -0,0 +1,236 @@
+"""API JSON de sólo lectura para los portales de las empresas del grupo (AUTOSOL, AUTOLUX, CIEL).
+
+Lee el mismo snapshot Arrow que mapean los procesos de Streamlit (datos_taller.asegurar_snapshot_arrow),
+así un concesionario ve sus unidades sin correr el pipeline de todas las pestañas:
+
+    python api_portal.py servir --puerto 8600
+    python api_portal.py carga --url http://127.0.0.1:8600/empresas/autosol/vehiculos --pedidos 5000 --hilos 16
+
+Rutas:
+    GET /empresas                          -> contadores de cada empresa
+    GET /empresas/<empresa>/contadores     -> en_proceso, detenidos, terminados
+    GET /empresas/<empresa>/vehiculos?estado=pendientes|entregados|todos&pagina=1&por_pagina=50
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from datos_taller import (
+    RUTA_NOTAS_PORTAL, NotasPortal, abrir_snapshot_arrow, asegurar_snapshot_arrow, cargar_maestro,
+    contadores_portal, vehiculos_empresa
+)
+
+log_api = logging.getLogger("taller.api")
+
+EMPRESAS_API = {'autosol': 'AUTOSOL', 'autolux': 'AUTOLUX', 'ciel': 'CIEL / AUTOCIEL', 'todas': 'TODAS'}
+ESTADOS_API = ('pendientes', 'entregados', 'todos')
+POR_PAGINA_DEFECTO, POR_PAGINA_MAXIMO = 50, 500
+SEGUNDOS_REVISION_SNAPSHOT = 2
+MAX_RESPUESTAS_CACHEADAS = 512
+
+class ErrorPedido(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+def texto_iso(serie):
+    fechas = pd.to_datetime(serie, errors='coerce')
+    return fechas.dt.strftime('%Y-%m-%d').astype(object).where(fechas.notna(), None)
+
+def registros_portal(df_vista, notas):
+    # Mismas columnas que la tabla del portal en app.py, con fechas ISO y nulos como null
+    n = notas.reindex(df_vista['Patente'])
+    promesa, ticket = pd.to_datetime(df_vista['Fecha_Promesa_Disp'], errors='coerce'), pd.to_datetime(df_vista['Fecha_Ticket'], errors='coerce')
+    d = pd.DataFrame({
+        'patente': df_vista['Patente'], 'cliente': df_vista['Cliente'], 'vehiculo': df_vista['Vehiculo'], 'estado': df_vista['Estado_Taller'],
+        'fecha_ingreso': texto_iso(df_vista['Fecha_Ingreso']), 'primera_promesa': texto_iso(df_vista['Fecha_Ticket']),
+        'fecha_entrega': texto_iso(df_vista['Fecha_Promesa_Disp']), 'demorado': (promesa > ticket), 'asesor': df_vista['Asesor'],
+        'fecha_ingreso_concesionario': texto_iso(n['Fecha Ingreso Concesionario']).to_numpy(),
+        'asesor_concesionario': n['Asesor Concesionario'].to_numpy(),
+        'observaciones': np.where(n['Observaciones'].notna(), n['Observaciones'], df_vista['Observaciones']),
+    }).astype(object)
+    return d.where(d.notna(), None).to_dict('records')
+
+class DatosPortal:
+    """Vistas del portal por (versión del maestro, mtime de las notas) y respuestas ya serializadas con su ETag.
+
+    El estado publicado es una tupla (clave, vistas, respuestas) que se reemplaza entera: los pedidos toman la
+    referencia y siguen con ella aunque llegue otra. La revisión del snapshot (que puede bajar y normalizar todo
+    el maestro) corre en un hilo aparte, uno a la vez, y mientras tanto se sirve la versión anterior; sólo el
+    primer pedido espera la carga inicial."""
+    def __init__(self, notas):
+        self.notas = notas
+        self._lock = threading.Lock()  # Sólo para el LRU de respuestas
+        self._refresco = threading.Lock()  # Una sola actualización a la vez
+        self._estado = None
+        self._revisado = 0.0
+        self._frame = (None, None)
+
+    def _maestro(self):
+        puntero, df_local = asegurar_snapshot_arrow('vehiculos', cargar_maestro)
+        if puntero is None: return df_local.attrs.get('version', ''), df_local
+        if self._frame[0] != puntero['version']: self._frame = (puntero['version'], abrir_snapshot_arrow('vehiculos', puntero['version']))
+        return self._frame
+
+    def _actualizar(self):
+        # Corre con self._refresco tomado y fuera de self._lock: arma las vistas nuevas y publica la tupla de una vez
+        self._revisado = time.monotonic()
+        version, df_maestro = self._maestro()
+        notas = self.notas.notas()
+        clave = (version, os.path.getmtime(self.notas.ruta))
+        if self._estado is not None and clave == self._estado[0]: return
+        vistas = {}
+        for slug, empresa in EMPRESAS_API.items():
+            d = vehiculos_empresa(df_maestro, empresa)
+            if d.empty: vistas[slug] = {'contadores': {'en_proceso': 0, 'detenidos': 0, 'terminados': 0}, 'pendientes': [], 'entregados': []}; continue
+            entregado = d['Estado_Taller'].str.contains('ENTREGADO', na=False).to_numpy()
+            vistas[slug] = {'contadores': contadores_portal(d), 'pendientes': registros_portal(d[~entregado], notas), 'entregados': registros_portal(d[entregado], notas)}
+        self._estado = (clave, vistas, OrderedDict())
+        log_api.info("Portal actualizado a la versión %s", version)
+
+    def _actualizar_en_fondo(self):
+        try: self._actualizar()
+        except Exception: log_api.exception("No se pudo actualizar el portal; se sigue sirviendo la versión %s", self._estado[0][0])
+        finally: self._refresco.release()
+
+    def _vigente(self):
+        # El puntero del snapshot y el archivo de notas se revisan como mucho cada SEGUNDOS_REVISION_SNAPSHOT
+        if self._estado is None:
+            with self._refresco:
+                if self._estado is None: self._actualizar()
+        elif time.monotonic() - self._revisado >= SEGUNDOS_REVISION_SNAPSHOT and self._refresco.acquire(blocking=False):
+            self._revisado = time.monotonic()
+            threading.Thread(target=self._actualizar_en_fondo, name="portal-refresco", daemon=True).start()
+        return self._estado
+
+    @staticmethod
+    def _armar(estado_portal, partes, consulta):
+        (version, _), vistas, _ = estado_portal
+        if not partes or partes[0] != 'empresas': raise ErrorPedido(404, "Ruta desconocida")
+        if len(partes) == 1: return {'version': version, 'empresas': {slug: v['contadores'] for slug, v in vistas.items()}}
+        vista = vistas.get(partes[1])
+        if vista is None: raise ErrorPedido(404, f"Empresa desconocida: {partes[1]} (opciones: {', '.join(EMPRESAS_API)})")
+        if partes[2:] == ['contadores']: return {'version': version, 'empresa': partes[1], **vista['contadores']}
+        if partes[2:] != ['vehiculos']: raise ErrorPedido(404, "Ruta desconocida")
+
+        estado = consulta.get('estado', 'pendientes')
+        if estado not in ESTADOS_API: raise ErrorPedido(400, f"estado debe ser uno de: {', '.join(ESTADOS_API)}")
+        try: pagina, por_pagina = int(consulta.get('pagina', 1)), int(consulta.get('por_pagina', POR_PAGINA_DEFECTO))
+        except ValueError: raise ErrorPedido(400, "pagina y por_pagina deben ser enteros")
+        if pagina < 1 or not 1 <= por_pagina <= POR_PAGINA_MAXIMO: raise ErrorPedido(400, f"pagina >= 1 y 1 <= por_pagina <= {POR_PAGINA_MAXIMO}")
+        registros = vista['pendientes'] + vista['entregados'] if estado == 'todos' else vista[estado]
+        inicio = (pagina - 1) * por_pagina
+        return {'version': version, 'empresa': partes[1], 'estado': estado, 'pagina': pagina, 'por_pagina': por_pagina,
+                'total': len(registros), 'paginas': -(-len(registros) // por_pagina), 'vehiculos': registros[inicio:inicio + por_pagina]}
+
+    def responder(self, ruta):
+        """Devuelve (estado HTTP, cuerpo, etag) para un GET."""
+        url = urllib.parse.urlsplit(ruta)
+        consulta = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        estado_portal = self._vigente()
+        respuestas = estado_portal[2]
+        clave = (url.path.rstrip('/'), tuple(sorted(consulta.items())))
+        with self._lock:
+            if clave in respuestas:
+                respuestas.move_to_end(clave)
+                return respuestas[clave]
+        try: estado, datos = 200, self._armar(estado_portal, [p for p in url.path.split('/') if p], consulta)
+        except ErrorPedido as e: estado, datos = e.estado, {'error': str(e)}
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode()
+        respuesta = (estado, cuerpo, f'"{hashlib.sha1(cuerpo).hexdigest()[:16]}"')
+        with self._lock:
+            respuestas[clave] = respuesta
+            while len(respuestas) > MAX_RESPUESTAS_CACHEADAS: respuestas.popitem(last=False)
+        return respuesta
+
+class ManejadorPortal(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive: un cliente reutiliza la conexión entre pedidos
+    disable_nagle_algorithm = True  # cabecera y cuerpo van en dos write(); sin esto cada 200 espera el ACK diferido (~40 ms)
+    datos = None
+
+    def do_GET(self):
+        try: estado, cuerpo, etag = self.datos.responder(self.path)
+        except Exception:
+            log_api.exception("Error armando %s", self.path)
+            estado, cuerpo, etag = 503, b'{"error": "Datos no disponibles"}', None
+        if etag and estado == 200 and self.headers.get('If-None-Match') == etag: estado, cuerpo = 304, b''
+        self.send_response(estado)
+        if etag and estado in (200, 304): self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')  # el cliente revalida con If-None-Match
+        if cuerpo: self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        log_api.debug(formato, *args)
+
+def servir(host, puerto):
+    ManejadorPortal.datos = DatosPortal(NotasPortal(RUTA_NOTAS_PORTAL))
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorPortal)
+    servidor.daemon_threads = True
+    print(f"API del portal en http://{host}:{servidor.server_port}/empresas")
+    try: servidor.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: servidor.server_close()
+    return 0
+
+# --- PRUEBA DE CARGA LOCAL ---
+def prueba_carga(url, pedidos, hilos, revalidar):
+    partes = urllib.parse.urlsplit(url)
+    destino = partes.path + (f"?{partes.query}" if partes.query else "")
+    por_hilo = [pedidos // hilos + (1 if i < pedidos % hilos else 0) for i in range(hilos)]
+
+    def cliente(cantidad):
+        conexion = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+        latencias, estados, etag = [], Counter(), None
+        for _ in range(cantidad):
+            t0 = time.perf_counter()
+            conexion.request('GET', destino, headers={'If-None-Match': etag} if revalidar and etag else {})
+            respuesta = conexion.getresponse(); respuesta.read()
+            latencias.append((time.perf_counter() - t0) * 1000)
+            estados[respuesta.status] += 1
+            etag = respuesta.getheader('ETag') or etag
+        conexion.close()
+        return latencias, estados
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(hilos) as ejecutor: resultados = list(ejecutor.map(cliente, por_hilo))
+    total_s = time.perf_counter() - t0
+    latencias = np.array([l for r in resultados for l in r[0]])
+    estados = sum((r[1] for r in resultados), Counter())
+    print(f"{len(latencias)} pedidos en {total_s:.2f} s -> {len(latencias) / total_s:.0f} pedidos/s | "
+          f"p50 {np.percentile(latencias, 50):.1f} ms, p95 {np.percentile(latencias, 95):.1f} ms, p99 {np.percentile(latencias, 99):.1f} ms | "
+          f"respuestas: {dict(estados)}")
+    return 0 if set(estados) <= {200, 304} else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API JSON de sólo lectura del portal de empresas.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_servir = sub.add_parser("servir", help="Levanta la API (stdlib, multihilo)")
+    p_servir.add_argument("--host", default="127.0.0.1")
+    p_servir.add_argument("--puerto", type=int, default=8600)
+    p_carga = sub.add_parser("carga", help="Prueba de carga contra una API ya levantada")
+    p_carga.add_argument("--url", default="http://127.0.0.1:8600/empresas/todas/vehiculos")
+    p_carga.add_argument("--pedidos", type=int, default=2000)
+    p_carga.add_argument("--hilos", type=int, default=16)
+    p_carga.add_argument("--revalidar", action="store_true", help="Manda If-None-Match con el último ETag (respuestas 304)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.comando == "servir": return servir(args.host, args.puerto)
+    return prueba_carga(args.url, args.pedidos, args.hilos, args.revalidar)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,25 +1,116 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 from datetime import datetime, timedelta, date
 import calendar
 import re
 import time
 import json
-import gspread
-
-# --- CONEXIÓN A GOOGLE SHEETS (GSPREAD) ---
-try:
-    creds_dict = json.loads(st.secrets["google_credentials"])
-    gc = gspread.service_account_from_dict(creds_dict)
-    ID_PLANILLA = "1yoJk6hD6YianjGHUofs7q-RvEBJOZg51tFMZx-GVxNg"
-    planilla = gc.open_by_key(ID_PLANILLA)
-    hoja = planilla.worksheet("TURNOS")
-except Exception as e:
-    st.error(f"Error de conexión a Google Sheets: {e}")
-    hoja = None
-    
+import logging
+import os
+import threading
+import cProfile
+import pstats
+import io
+import importlib
+from collections import OrderedDict
+from contextlib import ExitStack
+from datos_taller import (
+    ID_NUEVO_SHEET, ASESORES_LISTA, RUTA_DATOS_LOCALES, CONTADORES_DESCARGA, MedicionRerun, activar_medicion, contar_llamada_api, medir,
+    huella_frame, COMPARACION_TURNOS, diferenciar_ediciones, cargar_turnos, cargar_maestro,
+    asegurar_snapshot_arrow, abrir_snapshot_arrow, invalidar_snapshot_arrow,
+    seleccionar_maestro, seleccionar_turnos, kpi_por, resumen_facturacion,
+    reiniciar_historicos, agregar_historicos,
+    NotasPortal, RUTA_NOTAS_PORTAL, COMPARACION_PORTAL, vehiculos_empresa, contadores_portal,
+    normalizar_patente, mascara_turno_recibido, indice_turnos_taller, metricas_turnos,
+    registrar_estado_diario, leer_historial, analizar_historial,
+    LibroEntregas, RUTA_LIBRO_ENTREGAS, candado_turnos, escribir_turnos, AlmacenTurnos, avisos_cambio_layout, aceptar_layout
+)
+
+# --- IMPORTS DIFERIDOS ---
+# plotly.express y gspread suman ~0,5 s al arranque en frío; se importan recién al primer uso
+# (el primer gráfico o el primer guardado). Ver `python datos_taller.py importtime`.
+class ModuloDiferido:
+    def __init__(self, nombre):
+        self._nombre = nombre
+
+    def __getattr__(self, atributo):
+        return getattr(importlib.import_module(self._nombre), atributo)
+
+px = ModuloDiferido("plotly.express")
+go = ModuloDiferido("plotly.graph_objects")
+
+# --- INSTRUMENTACIÓN DE RENDIMIENTO ---
+# Cada rerun arma una MedicionRerun (ver datos_taller) y la vuelca como JSON-lines al final.
+@st.cache_data(ttl=60)
+def resumen_rendimiento(ruta, marca_archivo, max_lineas=20000):
+    # marca_archivo (mtime) invalida el caché cuando el log crece
+    if not os.path.exists(ruta): return pd.DataFrame()
+    with open(ruta, encoding='utf-8') as f: lineas = f.readlines()[-max_lineas:]
+    registros = pd.DataFrame([json.loads(l) for l in lineas if l.strip()])
+    if registros.empty: return registros
+    resumen = registros.groupby('etapa')['ms'].agg(n='count', p50=lambda s: s.quantile(0.5), p95=lambda s: s.quantile(0.95))
+    return resumen.join(registros.groupby('etapa')['llamadas_api'].mean().rename('api_prom')).sort_values('p95', ascending=False).round(1)
+
+log_taller = logging.getLogger("taller")
+MEDICION = MedicionRerun()
+activar_medicion(MEDICION)
+
+# --- MODO CAPTURA DE PERFILES (cProfile) ---
+# ?perfil=N en la URL o el botón de "⚙️ Sistema" perfilan los próximos N reruns completos de esta sesión.
+MAX_PERFILES_GUARDADOS = 20
+
+if 'perfil' in st.query_params:
+    try: st.session_state.perfiles_pendientes = max(0, min(int(st.query_params['perfil']), MAX_PERFILES_GUARDADOS))
+    except ValueError: pass
+    del st.query_params['perfil']
+
+perfil_interrumpido = st.session_state.pop('perfil_activo', None)
+if perfil_interrumpido is not None: perfil_interrumpido.disable()  # Un st.rerun() cortó el rerun anterior antes de guardar
+
+PERFIL_RERUN = None
+if st.session_state.get('perfiles_pendientes', 0) > 0:
+    PERFIL_RERUN = cProfile.Profile()
+    try:
+        PERFIL_RERUN.enable()
+        st.session_state.perfil_activo = PERFIL_RERUN
+    except ValueError:  # Otro perfilador ya está activo en el intérprete
+        PERFIL_RERUN = None
+
+def guardar_perfil(perfil, directorio, seccion):
+    perfil.disable()
+    os.makedirs(directorio, exist_ok=True)
+    sufijo = re.sub(r'\W+', '_', seccion).strip('_').lower()
+    nombre = f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{sufijo}.prof"
+    perfil.dump_stats(os.path.join(directorio, nombre))
+    for viejo in sorted(os.listdir(directorio))[:-MAX_PERFILES_GUARDADOS]: os.remove(os.path.join(directorio, viejo))
+    return nombre
+
+@st.cache_data(max_entries=MAX_PERFILES_GUARDADOS)
+def resumen_perfil(ruta, top=30):
+    salida = io.StringIO()
+    pstats.Stats(ruta, stream=salida).strip_dirs().sort_stats('cumulative').print_stats(top)
+    return salida.getvalue()
+
+# --- CONEXIÓN A GOOGLE SHEETS (GSPREAD, DIFERIDA) ---
+# La lectura va por el export CSV; gspread sólo hace falta para escribir. La conexión se abre en el
+# primer guardado y queda compartida por el proceso (un fallo no se cachea: se reintenta al próximo).
+@st.cache_resource
+def conectar_hoja_turnos():
+    gspread = importlib.import_module("gspread")
+    with medir("conexion_sheets"):
+        creds_dict = json.loads(st.secrets["google_credentials"])
+        gc = gspread.service_account_from_dict(creds_dict)
+        planilla = gc.open_by_key(ID_NUEVO_SHEET); contar_llamada_api('gspread')
+        hoja = planilla.worksheet("TURNOS"); contar_llamada_api('gspread')
+    return hoja
+
+def hoja_turnos():
+    try: return conectar_hoja_turnos()
+    except Exception as e:
+        st.error(f"Error de conexión a Google Sheets: {e}")
+        return None
+
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(page_title="Gestión Taller CENOA - Jujuy", layout="wide", initial_sidebar_state="expanded")
 
@@ -44,22 +135,25 @@ st.markdown("""<style>
 st.title("🚀 Sistema de Gestión Taller CENOA - Jujuy")
 
 # --- CONFIGURACIÓN DE GIDS Y VARIABLES ---
-ID_NUEVO_SHEET = "1yoJk6hD6YianjGHUofs7q-RvEBJOZg51tFMZx-GVxNg"
-URL_BASE = f"https://docs.google.com/spreadsheets/d/{ID_NUEVO_SHEET}/export?format=csv&gid="
-GID_TURNOS = "109364752" 
-
-GIDS = {"GRUPO UNO": "609774337", "GRUPO DOS": "1212138688", "GRUPO TRES": "527300176", "TERCEROS": "431495457", "PARABRISAS": "37356499"}
-MESES_ES = {'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8, 'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12}
 DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-ASESORES_LISTA = ["SIN ASIGNAR", "CESAR OLIVA", "JAVIER GUTIERREZ", "ANDREA MARTINS"]
 CLIENTES_LISTA = ["CENOA", "CENOA SEGURO", "CIEL", "CIEL SEGURO", "CIEL OKM", "CIEL USADO", "AUTOSOL", "AUTOSOL SEGURO", "AUTOSOL OKM", "AUTOSOL USADO", "AUTOLUX", "AUTOLUX SEGURO", "AUTOLUX OKM", "AUTOLUX USADO", "PARTICULAR"]
 
 OBJETIVO_MENSUAL_PANOS = 505.0
+SECCIONES = ["📋 Turnero y Entregas", "🛠️ Programación del Taller", "🏢 Seguimiento Empresas", "💰 Facturación", "📊 KPIs", "📅 Históricos"]
+
+# --- ALMACENAMIENTO LOCAL ---
+RUTA_LOG_RENDIMIENTO = os.path.join(RUTA_DATOS_LOCALES, "rendimiento.jsonl")
+RUTA_PERFILES = os.path.join(RUTA_DATOS_LOCALES, "perfiles")
 
 # --- HELPERS DE FORMATO ---
 formato_pesos = lambda x: f"$ {x:,.0f}".replace(',', '.')
 formato_panos = lambda x: f"{x:.1f}"
 
+def texto_fechas(serie, formato='%d/%m', vacio=""):
+    # strftime sólo sobre las fechas distintas; el resto es un take de numpy (NaT/None -> código -1 -> vacio)
+    codigos, unicas = pd.factorize(pd.to_datetime(serie, errors='coerce'))
+    return pd.Series(np.append(np.asarray(unicas.strftime(formato), dtype=object), vacio)[codigos], index=serie.index, dtype=object)
+
 # --- LÓGICA DE DÍAS HÁBILES ---
 anio_actual = datetime.now().year
 FERIADOS_ARG = [
@@ -80,6 +174,7 @@ FERIADOS_ARG = [
     date(anio_actual, 12, 8),  # Inmaculada Concepción
     date(anio_actual, 12, 25)  # Navidad
 ]
+FERIADOS_NP = np.array(FERIADOS_ARG, dtype='datetime64[D]')
 
 def dias_habiles_del_mes(anio, mes):
     _, ult_dia = calendar.monthrange(anio, mes)
@@ -108,45 +203,6 @@ def dias_habiles_restantes_mes(anio, mes):
     return dias_restantes
 
 # --- FUNCIONES ---
-def parsear_fecha_español(texto):
-    if pd.isna(texto) or str(texto).strip() == "": return None 
-    texto = str(texto).lower().strip()
-    
-    # 1. Buscar formato con letras DD-MMM o DD/MMM (ej: 25-mar o 25/mar)
-    meses_abrev = {'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6,
-                   'jul': 7, 'ago': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dic': 12}
-    
-    match_abrev = re.search(r'(\d{1,2})[-/]([a-z]{3})', texto)
-    if match_abrev:
-        dia = int(match_abrev.groups()[0])
-        mes_str = match_abrev.groups()[1]
-        mes_num = meses_abrev.get(mes_str)
-        if mes_num:
-            return datetime(datetime.now().year, mes_num, dia)
-
-    # 2. Buscar formato normal DD/MM o DD-MM (ej: 25/03)
-    match_dm = re.match(r'^(\d{1,2})[-/](\d{1,2})$', texto)
-    if match_dm: return datetime(datetime.now().year, int(match_dm.groups()[1]), int(match_dm.groups()[0]))
-    
-    # 3. Intentar lectura automática
-    try:
-        res = pd.to_datetime(texto, dayfirst=True)
-        if pd.notna(res): return res.to_pydatetime()
-    except: pass
-    
-    # 4. Formato largo (ej: 25 de marzo de 2026)
-    try:
-        match = re.search(r'(\d+)\s+de\s+([a-z]+)\s+de\s+(\d+)', texto)
-        if match: return datetime(int(match.groups()[2]), MESES_ES.get(match.groups()[1], 1), int(match.groups()[0]))
-    except: pass
-    
-    return None
-
-def clasificar_abc(panos):
-    if panos <= 3: return 'A (1-3 paños)'
-    elif panos <= 7: return 'B (4-7 paños)'
-    else: return 'C (8+ paños)'
-
 def obtener_proxima_fecha_libre(dias_carga):
     fecha = datetime.today()
     dias_agregados = 0
@@ -156,238 +212,342 @@ def obtener_proxima_fecha_libre(dias_carga):
             dias_agregados += 1
     return f"{DIAS_SEMANA[fecha.weekday()]} {fecha.strftime('%d/%m')}"
 
-@st.cache_data(ttl=300)
+# --- CARGA COMPARTIDA (PIPELINE EN datos_taller.py, SNAPSHOTS ARROW ENTRE PROCESOS) ---
+# Un solo proceso del host descarga y publica; cada proceso mapea el archivo una vez por versión
+# y las sesiones reciben copias superficiales (copy-on-write) del frame mapeado.
+@st.cache_resource(max_entries=4)
+def frame_mapeado(tipo, version):
+    return abrir_snapshot_arrow(tipo, version)
+
+def obtener_compartido(tipo, cargador):
+    puntero, df_local = asegurar_snapshot_arrow(tipo, cargador)
+    if puntero is None: return df_local
+    return frame_mapeado(tipo, puntero['version']).copy(deep=False)
+
 def obtener_turnos():
-    columnas_base = ['Tipo', 'Fecha', 'Hora', 'Vehiculo', 'Patente', 'Asesor', 'Precio', 'Paños', 'Observaciones', 'Tiempo_Entrega', 'Cliente', 'Seguro', 'Ticket', 'Recibido', 'Fotos', 'Referencia', 'Cancelado', 'Motivo_Cancelacion', 'Eliminar']
-    if GID_TURNOS == "PONER_AQUI_GID_TURNOS": return pd.DataFrame(columns=columnas_base)
-    try:
-        d = pd.read_csv(f"{URL_BASE}{GID_TURNOS}", dtype=str)
-        d.columns = d.columns.str.strip().str.upper()
-        if 'PATENTE' in d.columns: d = d.dropna(subset=['PATENTE']); d = d[d['PATENTE'].str.strip() != ""]
-        filas = []
-        
-        col_recibido = next((c for c in d.columns if 'RECIBID' in c), None)
-        col_fotos = next((c for c in d.columns if 'FOTO' in c), None)
-        col_turno = next((c for c in d.columns if 'TURNO' in c), 'TURNO')
-        
-        # Identificar la columna Q (Motivo). Puede que no tenga header
-        col_motivo = next((c for c in d.columns if 'MOTIVO' in c or 'CANCELACION' in c), None)
-        if not col_motivo and len(d.columns) >= 17:
-            col_motivo = d.columns[16] # 0-indexed, 16 es la Q
-            
-        for _, row in d.iterrows():
-            col_fecha = next((c for c in d.columns if 'FECH' in c), None)
-            fecha_turno = parsear_fecha_español(row.get(col_fecha, '')) or datetime.now()
-            asesor_raw = str(row.get('ASESOR', 'SIN ASIGNAR')).strip().upper()
-            if asesor_raw not in ASESORES_LISTA: asesor_raw = "SIN ASIGNAR"
-            col_tiempo = next((c for c in d.columns if 'TIEMPO' in c), None)
-            
-            val_recibido = str(row.get(col_recibido, '')).strip().upper() if col_recibido else ""
-            bool_recibido = val_recibido in ['SI', 'SÍ', 'TRUE', '1', 'X']
-            
-            val_fotos = str(row.get(col_fotos, '')).strip().upper() if col_fotos else ""
-            bool_fotos = val_fotos in ['SI', 'SÍ', 'TRUE', '1', 'X']
-            
-            val_ticket = str(row.get('N° TICKET', '')).strip()
-            if val_ticket == 'nan': val_ticket = ""
-            val_referencia = str(row.get('N° REFERENCIA', '')).strip()
-            if val_referencia == 'nan': val_referencia = ""
-            
-            val_motivo_str = str(row.get(col_motivo, '')).replace('nan', '').strip() if col_motivo else ""
-            
-            val_turno_str = str(row.get(col_turno, '')).strip().upper()
-            
-            # Lógica de estados en columna A (Reconoce 'C' o 'CANCELADO')
-            es_cancelado = val_turno_str in ["CANCELADO", "C"]
-            if val_turno_str == "N" or val_turno_str == "NO":
-                tipo_turno = '🚶‍♂️ SIN TURNO'
-            else:
-                tipo_turno = '📅 PROGRAMADO'
-            
-            filas.append({
-                'Tipo': tipo_turno, 'Fecha': fecha_turno.date(), 'Hora': str(row.get('HORA TURNO', row.get('HORAS', ''))).strip(),
-                'Vehiculo': str(row.get('VEHICULO', '')).upper(), 'Patente': str(row.get('PATENTE', '')).upper(),
-                'Asesor': asesor_raw, 'Precio': str(row.get('PRECIO', '')).strip(), 'Paños': str(row.get('PAÑOS', '')).strip(),
-                'Observaciones': str(row.get('OBSERVACIONES', '')).strip(), 'Tiempo_Entrega': str(row.get(col_tiempo, '')) if col_tiempo else "",
-                'Cliente': str(row.get('CLIENTE', '')).upper(), 'Seguro': str(row.get('SEGURO', '')).upper(),
-                'Ticket': val_ticket, 'Referencia': val_referencia,
-                'Recibido': bool_recibido, 'Fotos': bool_fotos, 
-                'Cancelado': es_cancelado, 'Motivo_Cancelacion': val_motivo_str, 'Eliminar': False
-            })
-        return pd.DataFrame(filas)
-    except: return pd.DataFrame(columns=columnas_base)
+    return obtener_compartido('turnos', cargar_turnos)
 
-@st.cache_data(ttl=300)
 def obtener_datos_maestros():
-    dfs = []
-    for n, gid in GIDS.items():
-        try:
-            d_raw = pd.read_csv(f"{URL_BASE}{gid}", dtype=str, header=None)
-            
-            idx_header = 0
-            for i in range(min(15, len(d_raw))):
-                fila_str = " ".join(d_raw.iloc[i].fillna("").astype(str).str.upper())
-                if 'ESTADO' in fila_str or 'DOMINIO' in fila_str or 'PATENTE' in fila_str or 'CLIENTE' in fila_str or 'COMPAÑIA' in fila_str or 'PRECIO' in fila_str or 'MANO DE OBRA' in fila_str:
-                    idx_header = i
-                    break
-                    
-            cols = []
-            for j, val in enumerate(d_raw.iloc[idx_header]):
-                val_str = str(val).strip().upper()
-                if val_str == 'NAN' or val_str == 'NONE' or not val_str:
-                    cols.append(f"VACIA_{j}")
-                else:
-                    cols.append(val_str)
-                    
-            d_raw.columns = cols
-            d = d_raw.iloc[idx_header + 1:].reset_index(drop=True)
-
-            if n in ["GRUPO UNO", "GRUPO DOS", "GRUPO TRES"]:
-                cols = list(d.columns)
-                while len(cols) < 22: cols.append(f"VACIA_EXTRA_{len(cols)}")
-                if len(cols) > 21: cols[21] = 'ESTADO_FAC'            
-                if len(cols) > 20: cols[20] = 'FASE_TALLER'            
-                if len(cols) > 19: cols[19] = 'ESTADO_TALLER'         
-                if len(cols) > 15: cols[15] = 'EMPRESA_TALLER'        
-                if len(cols) > 11: cols[11] = 'OBSERVACIONES_TALLER'  
-                if len(cols) > 9: cols[9] = 'HORA_ENTREGA'            
-                if len(cols) > 8: cols[8] = 'FECHA_PROMESA_I'         
-                if len(cols) > 7: cols[7] = 'FECHA_TICKET'            
-                if len(cols) > 6: cols[6] = 'DIAS_TRABAJO'            
-                if len(cols) > 0: cols[0] = 'FECHA_INGRESO_TALLER'    
-                d.columns = cols
-            else: 
-                renames = {}
-                for c in d.columns:
-                    c_str = str(c).upper().strip()
-                    if 'ESTADO FAC' in c_str or 'ESTADOFAC' in c_str or c_str == 'FAC': 
-                        renames[c] = 'ESTADO_FAC'
-                    elif 'ESTADO TALLER' in c_str or 'ESTADOTALLER' in c_str or c_str == 'ESTADO': 
-                        renames[c] = 'ESTADO_TALLER'
-                    elif 'FASE' in c_str: 
-                        renames[c] = 'FASE_TALLER'
-                    elif 'COMPAÑIA' in c_str or 'SEGURO' in c_str or 'EMPRESA' in c_str or 'CLIENTE' in c_str: 
-                        if 'EMPRESA_TALLER' not in renames.values(): renames[c] = 'EMPRESA_TALLER'
-                    elif 'OBSERVACION' in c_str: 
-                        renames[c] = 'OBSERVACIONES_TALLER'
-                    elif 'PROMESA' in c_str or 'FECH/PROM' in c_str: 
-                        renames[c] = 'FECHA_PROMESA_I'
-                    elif 'TICKET' in c_str: 
-                        renames[c] = 'FECHA_TICKET'
-                    elif 'INGRESO' in c_str or c_str == 'FECHA': 
-                        renames[c] = 'FECHA_INGRESO_TALLER'
-                    elif 'HORA' in c_str: 
-                        renames[c] = 'HORA_ENTREGA'
-                    elif 'DOMINIO' in c_str or 'PATENTE' in c_str: 
-                        renames[c] = 'PATENTE'
-                    elif 'PRECIO' in c_str or 'MONTO' in c_str or 'TOTAL' in c_str or 'FRANQUICIA' in c_str or 'MANO DE OBRA' in c_str: 
-                        if 'PRECIO' not in renames.values(): renames[c] = 'PRECIO' 
-                    elif 'COSTO' in c_str or 'REPUESTO' in c_str: 
-                        if 'COSTO' not in renames.values(): renames[c] = 'COSTO'
-                    elif 'TERCERO' in c_str or 'ASESOR' in c_str: 
-                        if 'ASESOR' not in renames.values(): renames[c] = 'ASESOR'
-                    elif c_str == 'MES': 
-                        renames[c] = 'MES'
-                    elif 'MARCA' in c_str or 'VEHIC' in c_str: 
-                        renames[c] = 'VEHICULO'
-                    elif 'PAÑO' in c_str:
-                        if 'PAÑOS' not in renames.values(): renames[c] = 'PAÑOS'
-
-                d = d.rename(columns=renames)
-                
-                if 'MES' in d.columns:
-                    d['MES'] = d['MES'].replace(r'^\s*$', pd.NA, regex=True).ffill()
-
-            d = d.loc[:, ~d.columns.duplicated()]
-
-            if 'PATENTE' in d.columns: 
-                d = d.dropna(subset=['PATENTE'])
-                d = d[d['PATENTE'].str.strip() != ""]
-                d['GRUPO_ORIGEN'] = n
-                dfs.append(d)
-        except Exception as e: 
-            print(f"Error en pestaña {n}: {e}")
-            pass
-        
-    if not dfs: return pd.DataFrame()
-    df_raw = pd.concat(dfs, ignore_index=True)
-    filas = []
+    return obtener_compartido('vehiculos', cargar_maestro)
+
+def refrescar_datos(*tipos):
+    st.cache_data.clear()
+    for tipo in tipos: invalidar_snapshot_arrow(tipo)
+
+@st.cache_data(ttl=300)
+def obtener_agregados_historicos(_df_maestro, version_datos, mes_actual):
+    return agregar_historicos(_df_maestro, mes_actual)
+
+# --- FORMATO DE TABLAS (VECTORIZADO, POR VERSIÓN) ---
+# Las columnas de texto que muestran las pestañas se arman una vez por versión del maestro sobre datetime64.
+# Las vistas son filtros/ordenamientos de df_completo y conservan sus etiquetas: cada una toma sus filas por índice.
+COLUMNAS_FECHA_MAESTRO = ['Fecha_Ingreso', 'Fecha_Ticket', 'Fecha_Promesa_Disp']
+
+@st.cache_data(ttl=300, max_entries=4)
+def formato_maestro(_df_maestro, version_datos):
+    formato = pd.DataFrame(index=_df_maestro.index)
+    if _df_maestro.empty: return formato
+    for col in COLUMNAS_FECHA_MAESTRO:
+        formato[f"{col}_dm"] = texto_fechas(_df_maestro[col])
+        formato[f"{col}_dmy"] = texto_fechas(_df_maestro[col], '%d/%m/%Y', "Sin Fecha")
+    formato['Promesa_Dt'] = pd.to_datetime(_df_maestro['Fecha_Promesa_Disp'], errors='coerce')
+    demorado = formato['Promesa_Dt'] > pd.to_datetime(_df_maestro['Fecha_Ticket'], errors='coerce')
+    formato['Entrega_Empresa'] = np.where(demorado, formato['Fecha_Promesa_Disp_dmy'] + " 🟡 (Demorado)", formato['Fecha_Promesa_Disp_dmy'])
+    estado = _df_maestro['Estado_Taller'].astype(str).str.upper()
+    formato['Estado_Empresa'] = np.where(estado.str.contains("DETENIDO", regex=False), "🔴 " + estado, estado)
+    return formato
+
+def columna_formateada(df_vista, nombre):
+    return FORMATO_MAESTRO[nombre].reindex(df_vista.index)
+
+def dias_de_demora(df_vista, dia):
+    return (np.datetime64(dia, 'D') - columna_formateada(df_vista, 'Promesa_Dt')).dt.days.fillna(0).astype(int)
+
+# --- CURVA DE PRODUCCIÓN ---
+@st.cache_data(ttl=300, max_entries=24)
+def construir_curva_produccion(_df_propios, version_datos, anio, mes, hoy_d, capacidad_diaria, busqueda=""):
+    # El cálculo depende sólo de (mes, versión de datos, día de hoy, búsqueda): cambiar de mes en el
+    # sidebar y volver lee la curva ya armada. Días hábiles como ordinales para agrupar con bincount.
+    primer_dia = np.datetime64(date(anio, mes, 1), 'D')
+    _, ult_dia = calendar.monthrange(anio, mes)
+    ultimo_dia = np.datetime64(date(anio, mes, ult_dia), 'D')
+    dias_mes = np.arange(primer_dia, ultimo_dia + 1)
+    habiles = dias_mes[np.is_busday(dias_mes, holidays=FERIADOS_NP)]
+    n_habiles = len(habiles)
+
+    df_proyeccion = _df_propios[_df_propios['Estado_Resumen'].isin(['Facturado (FAC)', 'Aprobado (SI)'])]
+    f_promesa = pd.to_datetime(df_proyeccion['Fecha_Promesa_Disp'], errors='coerce').values.astype('datetime64[D]')
+    fecha_defecto = np.datetime64(hoy_d, 'D') if hoy_d.month == mes else primer_dia
+    fecha_curva = np.where((f_promesa >= primer_dia) & (f_promesa <= ultimo_dia), f_promesa, fecha_defecto)
+
+    # Las fechas que caen en fin de semana o feriado no tienen ordinal y quedan fuera (igual que el merge anterior)
+    ordinal = np.searchsorted(habiles, fecha_curva)
+    valido = (ordinal < n_habiles) & (habiles[np.minimum(ordinal, max(n_habiles - 1, 0))] == fecha_curva) if n_habiles else np.zeros(len(fecha_curva), dtype=bool)
+    es_hecho = (df_proyeccion['Estado_Taller'].str.contains('ENTREGADO|TERM', na=False) | (df_proyeccion['Estado_Resumen'] == 'Facturado (FAC)')).to_numpy()
+    panos = df_proyeccion['Paños'].to_numpy(dtype=float)
+    pesos = df_proyeccion['Precio'].to_numpy(dtype=float)
+
+    idx = ordinal[valido]
+    panos_esperados = np.bincount(idx, weights=panos[valido], minlength=n_habiles)
+    pesos_esperados = np.bincount(idx, weights=pesos[valido], minlength=n_habiles)
+    panos_hechos = np.bincount(ordinal[valido & es_hecho], weights=panos[valido & es_hecho], minlength=n_habiles)
+
+    avance_real = np.cumsum(panos_hechos)
+    avance_real = np.where(habiles > np.datetime64(hoy_d, 'D'), np.nan, avance_real)
+
+    return pd.DataFrame({
+        'Fecha': habiles,
+        'Meta Lineal (Paños)': np.arange(1, n_habiles + 1) * capacidad_diaria,
+        '1. Proyección Esperada (SI+FAC)': np.cumsum(panos_esperados),
+        'Acumulado Pesos ($)': np.cumsum(pesos_esperados),
+        '2. Avance Real Hecho': avance_real
+    })
+
+# --- AUDITORÍA DE CARGA: REGLAS DE CALIDAD DE DATOS ---
+PATRON_ASESORES = "|".join(a.split()[0] for a in ASESORES_LISTA if a != "SIN ASIGNAR")
+
+def _patente_duplicada_entre_grupos(d):
+    patente = normalizar_patente(d['Patente'])
+    return (patente != "") & (d.groupby(patente)['Grupo'].transform('nunique') > 1)
+
+# (Tipo de error, campo de la planilla a señalar, predicado vectorizado sobre el maestro normalizado)
+REGLAS_AUDITORIA = [
+    ("💰 Falta Precio (o tiene letras)", 'PRECIO', lambda d: d['Estado_Fac'].isin(['FAC', 'SI']) & (d['Precio'] == 0)),
+    ("📦 Faltan Paños (o tiene letras)", 'PAÑOS', lambda d: ~d['Estado_Taller'].str.contains("ENTREGADO", na=False) & (d['Paños'] == 0)),
+    ("📅 Fecha Promesa ilegible", 'FECHA_PROMESA_I', lambda d: (d['Promesa_Txt'] != "") & d['Fecha_Promesa_Disp'].isna()),
+    ("📅 Fecha Ingreso ilegible", 'FECHA_INGRESO_TALLER', lambda d: (d['Ingreso_Txt'] != "") & d['Fecha_Ingreso'].isna()),
+    ("⏪ Promesa anterior al Ingreso", 'FECHA_PROMESA_I', lambda d: (pd.to_datetime(d['Fecha_Promesa_Disp'], errors='coerce') < pd.to_datetime(d['Fecha_Ingreso'], errors='coerce')).fillna(False)),
+    ("🔁 Patente repetida en otro grupo", 'PATENTE', _patente_duplicada_entre_grupos),
+    ("👔 Asesor desconocido", 'ASESOR', lambda d: (d['Grupo'] != 'TERCEROS') & (d['Asesor'] != 'SIN ASIGNAR') & ~d['Asesor'].str.contains(PATRON_ASESORES, na=False)),
+]
+
+def auditar_maestro(df_maestro):
+    columnas = ["Dominio", "Error", "Grupo", "Asesor", "Fila", "Celda"]
+    if df_maestro.empty: return pd.DataFrame(columns=columnas)
     
-    col_chasis_global = next((c for c in df_raw.columns if 'CHASIS' in c or 'VIN' in c), None)
+    # Una columna booleana por regla, evaluadas todas sobre el mismo frame
+    marcas = np.column_stack([np.asarray(regla(df_maestro), dtype=bool) for _, _, regla in REGLAS_AUDITORIA])
+    idx_reglas, idx_filas = np.nonzero(marcas.T)
+    if len(idx_filas) == 0: return pd.DataFrame(columns=columnas)
     
-    for _, row in df_raw.iterrows():
-        f_fin = parsear_fecha_español(row.get('FECHA_PROMESA_I', ''))
-        f_fin_disp = f_fin.date() if f_fin else None
-        if not f_fin: f_fin = datetime.now() + timedelta(days=3650) 
-        
-        mes_hist = f_fin.strftime('%Y-%m') if f_fin.year < 2030 else "SIN FECHA"
-        if row.get('GRUPO_ORIGEN') in ['PARABRISAS', 'TERCEROS']:
-            mes_str = str(row.get('MES', '')).strip().lower()
-            for m_name, m_num in MESES_ES.items():
-                if m_name in mes_str:
-                    mes_hist = f"{datetime.now().year}-{m_num:02d}"
-                    break
-
-        f_ingreso = parsear_fecha_español(row.get('FECHA_INGRESO_TALLER', ''))
-        f_ticket = parsear_fecha_español(row.get('FECHA_TICKET', ''))
-        
-        try:
-            t_panos = str(row.get('PAÑOS', '0')).replace(',', '.')
-            if t_panos.lower() == 'nan' or not t_panos.strip(): t_panos = '0'
-            panos = float(re.findall(r"[-+]?\d*\.\d+|\d+", t_panos)[0]) if re.findall(r"[-+]?\d*\.\d+|\d+", t_panos) else 0.0
-        except: panos = 0.0
-        
-        try:
-            t_dias = str(row.get('DIAS_TRABAJO', '0')).replace(',', '.')
-            if t_dias.lower() == 'nan' or not t_dias.strip() or 'VACIA' in t_dias: t_dias = '0'
-            dias_rep = float(re.findall(r"[-+]?\d*\.\d+|\d+", t_dias)[0]) if re.findall(r"[-+]?\d*\.\d+|\d+", t_dias) else 0.0
-        except: dias_rep = 0.0
-
-        precio_raw = str(row.get('PRECIO', '0')).replace('$', '').replace('.', '').replace(',', '.').strip()
-        try: precio_val = float(precio_raw) if precio_raw else 0.0
-        except: precio_val = 0.0
-
-        costo_raw = str(row.get('COSTO', '0')).replace('$', '').replace('.', '').replace(',', '.').strip()
-        try: costo_val = float(costo_raw) if costo_raw else 0.0
-        except: costo_val = 0.0
-        
-        estado_fac_raw = str(row.get('ESTADO_FAC', '')).replace('.', '').strip().upper()
-        
-        estado = str(row.get('ESTADO_TALLER', '')).replace('nan', '').strip().upper() or "SIN ESTADO"
-        cliente = str(row.get('EMPRESA_TALLER', 'PARTICULAR')).replace('nan', '').strip().upper() or "PARTICULAR"
-        asesor = str(row.get('ASESOR', '')).strip().upper()
-        if asesor == 'NAN' or not asesor: asesor = "SIN ASIGNAR"
-        fase = str(row.get('FASE_TALLER', '')).replace('nan', '').strip().upper()
-        if not fase or fase == 'VACIA_20': fase = "SIN FASE ASIGNADA"
-        hora_entrega = str(row.get('HORA_ENTREGA', '')).replace('nan', '').strip()
-        chasis_val = str(row.get(col_chasis_global, '')).strip().upper() if col_chasis_global else ""
-
-        filas.append({
-            'Grupo': row.get('GRUPO_ORIGEN'), 'Asesor': asesor, 'Cliente': cliente,
-            'Patente': str(row.get('PATENTE', '')), 'Vehiculo': str(row.get('VEHICULO', '')), 'Chasis': chasis_val,
-            'Inicio': f_fin - timedelta(days=max(1, int(panos))), 'Fin': f_fin, 'Fecha_Promesa_Disp': f_fin_disp, 
-            'Fecha_Ingreso': f_ingreso.date() if f_ingreso else None, 'Fecha_Ticket': f_ticket.date() if f_ticket else None,
-            'Hora_Entrega': hora_entrega,
-            'Mes_Hist': mes_hist, 'Paños': panos, 'Dias_Reparacion': dias_rep, 'Tipo_ABC': clasificar_abc(panos),
-            'Estado_Fac': estado_fac_raw, 
-            'Estado_Taller': estado, 'Fase_Taller': fase, 
-            'Precio': precio_val, 'Costo': costo_val,
-            'Observaciones': str(row.get('OBSERVACIONES_TALLER', '')).replace('nan', '').strip()
-        })
-    return pd.DataFrame(filas)
+    base = df_maestro.iloc[idx_filas]
+    campos = np.array([campo for _, campo, _ in REGLAS_AUDITORIA])[idx_reglas]
+    columnas_hoja = df_maestro.attrs.get('columnas_hoja', {})
+    letras = [columnas_hoja.get(g, {}).get(c, "") for g, c in zip(base['Grupo'], campos)]
+    filas_hoja = base['Fila_Hoja'].to_numpy()
+    
+    return pd.DataFrame({
+        "Dominio": base['Patente'].to_numpy(),
+        "Error": np.array([error for error, _, _ in REGLAS_AUDITORIA])[idx_reglas],
+        "Grupo": base['Grupo'].to_numpy(),
+        "Asesor": base['Asesor'].to_numpy(),
+        "Fila": filas_hoja,
+        "Celda": [f"{l}{f}" if l else "" for l, f in zip(letras, filas_hoja)]
+    })
+
+# --- CACHÉ DE GRÁFICOS PLOTLY ---
+class CacheFiguras:
+    # LRU de figuras ya armadas, compartido por todas las sesiones del proceso. Las figuras son de sólo lectura
+    # (st.plotly_chart sólo las serializa): no modificar lo que devuelve obtener().
+    # La clave es el nombre del gráfico + la huella del DataFrame de entrada + los parámetros extra.
+    def __init__(self, max_entradas=96):
+        self.max_entradas = max_entradas
+        self._figuras = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, nombre, df_origen, constructor, *params):
+        clave = (nombre, tuple(map(str, df_origen.columns)), huella_frame(df_origen), repr(params))
+        with self._lock:
+            figura = self._figuras.get(clave)
+            if figura is not None:
+                self._figuras.move_to_end(clave)
+                self.aciertos += 1
+        if figura is None:
+            with medir(f"figura:{nombre}"):
+                figura = constructor(df_origen, *params)
+            with self._lock:
+                self.fallos += 1
+                self._figuras[clave] = figura
+                while len(self._figuras) > self.max_entradas:
+                    self._figuras.popitem(last=False)
+        return figura
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {'aciertos': self.aciertos, 'fallos': self.fallos, 'entradas': len(self._figuras), 'tasa_aciertos': self.aciertos / total if total else 0.0}
+
+@st.cache_resource
+def cache_figuras():
+    return CacheFiguras()
+
+FIGURAS = cache_figuras()
+
+# --- CAPTURA DE CAMBIOS ENTRE SNAPSHOTS (CDC) ---
+# Cada fila se reduce a dos digests de 64 bits: uno de su clave (+ nº de ocurrencia, por si la clave se repite)
+# y otro de su contenido. El cruce de claves es un hash join, así que el diff es lineal en filas.
+CLAVES_CDC = {'vehiculos': ['Grupo', 'Patente'], 'turnos': ['Patente', 'Fecha']}
+COLUMNAS_FUERA_DE_CDC = ['Fila_Hoja', 'Firma_Fila', 'Eliminar']  # Mover una fila en la hoja no es un cambio de contenido
+ETIQUETAS_CDC = {'insertados': '➕ Nuevo', 'actualizados': '✏️ Modificado', 'eliminados': '➖ Eliminado'}
+
+def digerir_filas(df_origen, clave):
+    if df_origen.empty or not set(clave) <= set(df_origen.columns): return np.empty(0, np.uint64), np.empty(0, np.uint64)
+    ocurrencia = df_origen.groupby(clave, sort=False, dropna=False).cumcount().to_numpy()
+    digest_clave = pd.util.hash_pandas_object(df_origen[clave].assign(_ocurrencia=ocurrencia), index=False).to_numpy()
+    columnas = [c for c in df_origen.columns if c not in COLUMNAS_FUERA_DE_CDC]
+    digest_fila = pd.util.hash_pandas_object(df_origen[columnas], index=False).to_numpy()
+    return digest_clave, digest_fila
+
+def diferenciar_snapshots(df_previo, df_nuevo, clave):
+    clave_prev, fila_prev = digerir_filas(df_previo, clave)
+    clave_nueva, fila_nueva = digerir_filas(df_nuevo, clave)
+    pos_previa = pd.Index(clave_prev).get_indexer(clave_nueva)
+    existia = pos_previa >= 0
+    modificada = existia.copy()
+    modificada[existia] = fila_prev[pos_previa[existia]] != fila_nueva[existia]
+    sigue = np.zeros(len(clave_prev), dtype=bool)
+    sigue[pos_previa[existia]] = True
+    return {
+        'insertados': df_nuevo.iloc[np.flatnonzero(~existia)],
+        'actualizados': df_nuevo.iloc[np.flatnonzero(modificada)],
+        'eliminados': df_previo.iloc[np.flatnonzero(~sigue)] if len(clave_prev) else df_previo.iloc[0:0]
+    }
+
+class RegistroSnapshots:
+    """Últimas versiones de cada frame normalizado, compartidas entre sesiones, y los diffs ya calculados."""
+    def __init__(self, maximo_versiones=4):
+        self.maximo_versiones = maximo_versiones
+        self._snapshots = OrderedDict()
+        self._diffs = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, tipo, df_origen):
+        version = df_origen.attrs.get('version') or huella_frame(df_origen)
+        with self._lock:
+            if (tipo, version) not in self._snapshots:
+                # Vista sin copiar datos: los frames publicados no se modifican y copy-on-write protege al registro
+                self._snapshots[(tipo, version)] = df_origen.copy(deep=False)
+                while len(self._snapshots) > self.maximo_versiones * len(CLAVES_CDC):
+                    (tipo_viejo, version_vieja), _ = self._snapshots.popitem(last=False)
+                    self._diffs = {k: v for k, v in self._diffs.items() if version_vieja not in k[1:]}
+        return version
+
+    def cambios(self, tipo, version_previa, version_nueva):
+        clave_diff = (tipo, version_previa, version_nueva)
+        with self._lock:
+            if clave_diff in self._diffs: return self._diffs[clave_diff]
+            df_previo, df_nuevo = self._snapshots.get((tipo, version_previa)), self._snapshots.get((tipo, version_nueva))
+        if df_previo is None or df_nuevo is None: return None
+        diff = diferenciar_snapshots(df_previo, df_nuevo, CLAVES_CDC[tipo])
+        with self._lock: self._diffs[clave_diff] = diff
+        return diff
+
+@st.cache_resource
+def registro_snapshots():
+    return RegistroSnapshots()
+
+SNAPSHOTS = registro_snapshots()
+
+def actualizar_cambios_sesion(tipo, df_origen):
+    # Compara contra la última versión que vio esta sesión; el resultado queda hasta la próxima recarga.
+    version = SNAPSHOTS.registrar(tipo, df_origen)
+    vistas = st.session_state.setdefault('versiones_vistas', {})
+    version_previa = vistas.get(tipo)
+    if version_previa and version_previa != version:
+        diff = SNAPSHOTS.cambios(tipo, version_previa, version)
+        if diff is not None: st.session_state.setdefault('cambios_ultima_actualizacion', {})[tipo] = diff
+    vistas[tipo] = version
+
+# --- LIBRO DE ENTREGAS CONFIRMADAS (LibroEntregas EN datos_taller.py, COMPARTIDO ENTRE PROCESOS) ---
+@st.cache_resource
+def libro_entregas():
+    return LibroEntregas(RUTA_LIBRO_ENTREGAS)
+
+ENTREGAS = libro_entregas()
+
+# --- NOTAS DEL PORTAL DE EMPRESAS (NotasPortal EN datos_taller.py) ---
+@st.cache_resource
+def notas_portal():
+    return NotasPortal(RUTA_NOTAS_PORTAL)
+
+NOTAS_PORTAL = notas_portal()
+
+# --- CAMBIOS DE LOS EDITORES DE TURNOS (LA ESCRITURA VERIFICADA ESTÁ EN datos_taller.py) ---
+texto_celda = lambda v: str(v) if pd.notna(v) else ""
+fecha_celda = lambda v: v.strftime('%d/%m/%Y') if pd.notna(v) else ""  # Fecha borrada en el editor (None/NaT): celda vacía
+CELDAS_TURNO = {'Fecha': ('B', fecha_celda), 'Asesor': ('F', texto_celda), 'Observaciones': ('I', texto_celda),
+                'Ticket': ('M', texto_celda), 'Recibido': ('N', lambda v: "SI" if v else ""), 'Fotos': ('O', lambda v: "SI" if v else ""),
+                'Referencia': ('P', texto_celda)}
+
+def celdas_turno(columnas_cambiadas, row, row_orig):
+    # Sólo las celdas que cambiaron; la cancelación arrastra la columna A y el motivo (Q)
+    celdas = {CELDAS_TURNO[c][0]: CELDAS_TURNO[c][1](row[c]) for c in columnas_cambiadas if c in CELDAS_TURNO}
+    if row.get('Cancelado', False):
+        if {'Cancelado', 'Motivo_Cancelacion'} & set(columnas_cambiadas): celdas.update({'A': "C", 'Q': texto_celda(row['Motivo_Cancelacion'])})
+    elif row_orig['Cancelado'] and 'Cancelado' in columnas_cambiadas:
+        celdas.update({'A': "N" if row_orig['Tipo'] == '🚶‍♂️ SIN TURNO' else "SI", 'Q': ""})
+    return celdas
+
+def cambio_turno(row_orig, celdas=None, eliminar=False):
+    return {'fila': int(row_orig['Fila_Hoja']), 'firma': row_orig['Firma_Fila'], 'patente': row_orig['Patente'], 'celdas': celdas or {}, 'eliminar': eliminar}
+
+def cambios_turnos(df_original, df_editado, columnas=None):
+    # Diff vectorizado del editor contra el original; el bucle recorre sólo las filas que cambiaron
+    comparacion = {c: t for c, t in COMPARACION_TURNOS.items() if columnas is None or c in columnas}
+    cambios = []
+    for idx, columnas_cambiadas in diferenciar_ediciones(df_original, df_editado, comparacion).groupby('idx', sort=False)['columna']:
+        row, row_orig = df_editado.loc[idx], df_original.loc[idx]
+        if row.get('Eliminar', False): cambios.append(cambio_turno(row_orig, eliminar=True)); continue
+        celdas = celdas_turno(list(columnas_cambiadas), row, row_orig)
+        if celdas: cambios.append(cambio_turno(row_orig, celdas))
+    return cambios
+
+# --- ALMACÉN DE TURNOS COMPARTIDO (AlmacenTurnos EN datos_taller.py) ---
+@st.cache_resource
+def almacen_turnos():
+    return AlmacenTurnos()
+
+ALMACEN_TURNOS = almacen_turnos()
+
+# --- ÍNDICE TURNOS ↔ TALLER (POR PAR DE VERSIONES, EN datos_taller.py) ---
+# Se arma una vez por (versión de turnos, versión del maestro, día) y lo comparten todas las sesiones; de sólo lectura
+ETIQUETAS_ETAPA = {'cancelado': "❌ Cancelado", 'no_show': "👻 No se presentó", 'reservado': "📅 Reservado", 'recibido': "📥 Recibido",
+                   'en_taller': "🛠️ En taller", 'terminado': "✅ Terminado", 'entregado': "🏁 Entregado"}
+
+@st.cache_resource(max_entries=4)
+def vinculos_turnos_taller(_df_turnos, _df_maestro, version_turnos, version_maestro, dia):
+    return indice_turnos_taller(_df_turnos, _df_maestro, dia)
+
+# --- HISTORIAL DIARIO DE ESTADOS (DELTAS EN datos_taller.py) ---
+# Cada versión nueva del maestro actualiza el delta del día (una vez por proceso; entre procesos decide el candado)
+@st.cache_resource(max_entries=4)
+def registrar_historial_diario(_df_maestro, version_maestro, dia):
+    return registrar_estado_diario(_df_maestro, dia)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def analisis_historial(ultimo_dia, actualizado, dia):
+    return analizar_historial(leer_historial(), dia)
 
 # --- MEMORIA Y CARGA DE DATOS ---
-if 'memoria_turnos_v12' not in st.session_state: 
-    st.session_state.memoria_turnos_v12 = obtener_turnos()
-
-if 'entregas_confirmadas' not in st.session_state:
-    st.session_state.entregas_confirmadas = []
-
-df = obtener_datos_maestros()
-df_turnos_display = st.session_state.memoria_turnos_v12.copy()
-df_completo = df.copy() 
+# La sesión sigue en su versión hasta que guarda o fuerza la actualización (se borra 'memoria_turnos_version')
+df_turnos_sesion = ALMACEN_TURNOS.obtener(st.session_state.get('memoria_turnos_version'))
+if df_turnos_sesion is None:
+    with medir("carga_turnos"): st.session_state.memoria_turnos_version, df_turnos_sesion = ALMACEN_TURNOS.publicar(obtener_turnos())
+
+with medir("carga_maestro"): df = obtener_datos_maestros()
+VERSION_MAESTRO = df.attrs.get('version', '')
+with medir("cambios_cdc"):
+    actualizar_cambios_sesion('vehiculos', df)
+    actualizar_cambios_sesion('turnos', df_turnos_sesion)
+df_turnos_display = df_turnos_sesion
+df_completo = df.copy(deep=False)  # Sin copiar datos: df es el snapshot Arrow mapeado que comparten todos los workers
+with medir("formato_maestro"): FORMATO_MAESTRO = formato_maestro(df_completo, VERSION_MAESTRO)
 
 hoy = datetime.today()
+with medir("indice_turnos"): VINCULOS = vinculos_turnos_taller(df_turnos_sesion, df_completo, st.session_state.memoria_turnos_version, VERSION_MAESTRO, hoy.date())
+with medir("historial_estados"): PUNTERO_HISTORIAL = registrar_historial_diario(df_completo, VERSION_MAESTRO, hoy.date()) if not df_completo.empty else None
 hoy_ym = hoy.strftime('%Y-%m')
 
 # --- BARRA LATERAL (SIDEBAR) Y BUSCADOR ---
@@ -404,7 +564,7 @@ with st.sidebar:
     
     meses_nombres = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
     m1 = df[df['Mes_Hist'] != 'SIN FECHA']['Mes_Hist'].dropna().unique().tolist()
-    m2 = df_turnos_display['Fecha'].dropna().apply(lambda x: x.strftime('%Y-%m') if pd.notna(x) else None).dropna().unique().tolist()
+    m2 = [m for m in texto_fechas(df_turnos_display['Fecha'], '%Y-%m').unique() if m]
     todos_meses_disp = sorted(list(set(m1 + m2)), reverse=True)
     
     opciones_meses = ["🗓️ MES ACTUAL", "♾️ TODOS"]
@@ -431,15 +591,54 @@ with st.sidebar:
     st.divider()
     st.markdown("### ⚙️ Sistema")
     if st.button("🔄 Forzar Actualización", use_container_width=True):
-        st.cache_data.clear()
-        if 'memoria_turnos_v11' in st.session_state:
-            del st.session_state['memoria_turnos_v11']
+        refrescar_datos('turnos', 'vehiculos')
+        reiniciar_historicos()
+        st.session_state.pop('memoria_turnos_version', None)
         st.success("¡Datos actualizados y memoria limpia!"); time.sleep(0.5); st.rerun()
     st.caption("Datos extraídos de Google Sheets.")
+    # Los cambios de estructura se leen del registro compartido: siguen a la vista en todos los workers hasta aceptarlos
+    avisos_estructura = avisos_cambio_layout()
+    for aviso in avisos_estructura + df_completo.attrs.get('avisos_layout', []): st.warning(aviso, icon="🧩")
+    if avisos_estructura and st.button("✅ Aceptar estructura nueva", use_container_width=True):
+        aceptar_layout(); st.rerun()
+    cambios_sesion = st.session_state.get('cambios_ultima_actualizacion', {})
+    if cambios_sesion:
+        with st.expander("🔁 Cambios desde la última actualización"):
+            for tipo, diff in cambios_sesion.items():
+                st.caption(f"**{tipo.capitalize()}**: {len(diff['insertados'])} nuevos · {len(diff['actualizados'])} modificados · {len(diff['eliminados'])} eliminados")
+                detalle = pd.concat([diff[k][CLAVES_CDC[tipo]].assign(Cambio=etiqueta) for k, etiqueta in ETIQUETAS_CDC.items()])
+                if not detalle.empty: st.dataframe(detalle, hide_index=True, use_container_width=True)
+    if 'ultima_medicion' in st.session_state:
+        seccion_previa, etapas_previas, llamadas_previas = st.session_state.ultima_medicion
+        with st.expander("⏱️ Rendimiento"):
+            st.caption(f"Último rerun ({seccion_previa}): {etapas_previas[-1]['ms']:.0f} ms · llamadas a Sheets: {', '.join(f'{k} {v}' for k, v in llamadas_previas.items()) or 'ninguna'}")
+            st.dataframe(pd.DataFrame(etapas_previas).set_index('etapa'), use_container_width=True)
+            st.caption(f"Pestañas (este proceso): {CONTADORES_DESCARGA['bytes'] / 1024:.0f} KB descargados · {CONTADORES_DESCARGA['no_modificadas']} sin cambios (304) · {CONTADORES_DESCARGA['cuerpo_igual']} con el mismo contenido · {CONTADORES_DESCARGA['parseos_omitidos']} parseos omitidos")
+            if os.path.exists(RUTA_LOG_RENDIMIENTO):
+                st.caption("Histórico por etapa (ms)")
+                st.dataframe(resumen_rendimiento(RUTA_LOG_RENDIMIENTO, os.path.getmtime(RUTA_LOG_RENDIMIENTO)), use_container_width=True)
+    with st.expander("🔬 Perfilado (cProfile)"):
+        reruns_a_perfilar = st.number_input("Reruns a perfilar", min_value=1, max_value=MAX_PERFILES_GUARDADOS, value=3)
+        if st.button("▶️ Capturar", use_container_width=True):
+            st.session_state.perfiles_pendientes = int(reruns_a_perfilar); st.rerun()
+        if st.session_state.get('perfiles_pendientes', 0) > 0:
+            st.caption(f"🔴 Capturando: faltan {st.session_state.perfiles_pendientes} reruns.")
+        perfiles_guardados = sorted(os.listdir(RUTA_PERFILES), reverse=True) if os.path.isdir(RUTA_PERFILES) else []
+        if perfiles_guardados:
+            perfil_elegido = st.selectbox("Perfil", perfiles_guardados)
+            ruta_perfil = os.path.join(RUTA_PERFILES, perfil_elegido)
+            texto_perfil = resumen_perfil(ruta_perfil)
+            st.code(texto_perfil[texto_perfil.find('ncalls'):][:3000] if 'ncalls' in texto_perfil else texto_perfil, language=None)
+            with open(ruta_perfil, 'rb') as f:
+                st.download_button("⬇️ .prof (snakeviz / flameprof)", f.read(), file_name=perfil_elegido, use_container_width=True)
+            st.download_button("⬇️ Top por tiempo acumulado", texto_perfil, file_name=perfil_elegido.replace('.prof', '.txt'), use_container_width=True)
+    stats_fig = FIGURAS.estadisticas()
+    st.caption(f"📊 Caché de gráficos: {stats_fig['tasa_aciertos']:.0%} aciertos ({stats_fig['aciertos']}/{stats_fig['aciertos'] + stats_fig['fallos']}, {stats_fig['entradas']} en memoria)")
 
 # --- APLICAR FILTRO MENSUSAL GLOBAL A MAESTRO ---
+termino_busqueda = busqueda_global.upper().strip() if busqueda_global else ""
 if mes_filtro != "TODOS":
-    df = df[(df['Mes_Hist'] == mes_filtro) | (df['Mes_Hist'] == 'SIN FECHA')]
+    with medir("filtro_mensual"): df = seleccionar_maestro(df_completo, mes_filtro)
     año_filtro, mes_num_filtro = map(int, mes_filtro.split('-'))
     DIAS_HABILES_MES = dias_habiles_del_mes(año_filtro, mes_num_filtro)
 else:
@@ -452,24 +651,23 @@ dias_restantes_calc = dias_habiles_restantes_mes(año_filtro, mes_num_filtro)
 
 # --- APLICAR BUSCADOR GLOBAL ---
 if busqueda_global:
-    termino = busqueda_global.upper().strip()
+    termino = termino_busqueda
     
     if not df.empty:
-        if 'Chasis' not in df.columns: df['Chasis'] = ""
-        df = df[(df['Patente'].str.contains(termino, na=False)) | 
-                (df['Chasis'].str.contains(termino, na=False))]
+        with medir("buscador"): df = seleccionar_maestro(df_completo, mes_filtro, termino)
                 
     if not df_turnos_display.empty:
-        if 'Chasis' not in df_turnos_display.columns: df_turnos_display['Chasis'] = ""
+        if 'Chasis' not in df_turnos_display.columns: df_turnos_display = df_turnos_display.assign(Chasis="")
         df_turnos_display = df_turnos_display[(df_turnos_display['Patente'].str.contains(termino, na=False)) | 
                                               (df_turnos_display['Chasis'].str.contains(termino, na=False))]
     
     with contenedor_resultados_busqueda:
         st.markdown("### 📋 Resumen del Vehículo")
         if not df.empty:
-            for _, row in df.head(5).iterrows():
+            for idx, row in df.head(5).iterrows():
                 f_prom = row.get('Fecha_Promesa_Disp')
                 fecha_str = f_prom.strftime('%d/%m/%Y') if pd.notna(f_prom) else "Sin Fecha"
+                linea_turno = f"<strong>📝 Turno:</strong> {VINCULOS['taller'].at[idx, 'Fecha_Turno'].strftime('%d/%m/%Y')}<br>" if idx in VINCULOS['taller'].index else ""
                 estado_taller = str(row.get('Estado_Taller', ''))
                 
                 if "ENTREGADO" in estado_taller: color_borde = "#28a745"
@@ -484,19 +682,26 @@ if busqueda_global:
                     <strong>🏷️ Estado:</strong> {estado_taller}<br>
                     <strong>🏭 Grupo:</strong> {row['Grupo']}<br>
                     <strong>👔 Asesor:</strong> {row['Asesor']}<br>
-                    <strong>📅 Entrega:</strong> <span style='color: #d32f2f; font-weight: bold;'>{fecha_str}</span>
+                    {linea_turno}<strong>📅 Entrega:</strong> <span style='color: #d32f2f; font-weight: bold;'>{fecha_str}</span>
                 </div>
                 """, unsafe_allow_html=True)
                 
         elif not df_turnos_display.empty:
-            for _, row in df_turnos_display.head(3).iterrows():
+            for idx, row in df_turnos_display.head(3).iterrows():
                 fecha_turno = row['Fecha'].strftime('%d/%m/%Y') if pd.notna(row['Fecha']) else "Sin Fecha"
+                vinculo = VINCULOS['turnos'].loc[idx]
+                linea_taller = ""
+                if pd.notna(vinculo['Idx_Taller']):
+                    orden = df_completo.loc[vinculo['Idx_Taller']]
+                    f_ing = orden['Fecha_Ingreso'].strftime('%d/%m/%Y') if pd.notna(orden['Fecha_Ingreso']) else "Sin Fecha"
+                    linea_taller = f"<br><strong>🚗 Ingresó:</strong> {f_ing} ({orden['Grupo']}) · {orden['Estado_Taller']}"
                 st.markdown(f"""
                 <div style='background-color: white; border: 1px solid #dee2e6; padding: 10px; border-radius: 8px; border-left: 6px solid #6f42c1; margin-bottom: 10px; font-size: 0.85em; box-shadow: 0 1px 2px rgba(0,0,0,0.05);'>
                     <div style='font-size: 1.1em; font-weight: bold; color: #00235d; margin-bottom: 5px; border-bottom: 1px solid #eee; padding-bottom: 3px;'>📝 TURNO: {row['Patente']}</div>
                     <strong>🏷️ Tipo:</strong> {row['Tipo']}<br>
                     <strong>📅 Día Asignado:</strong> {fecha_turno}<br>
-                    <strong>👔 Asesor:</strong> {row['Asesor']}
+                    <strong>👔 Asesor:</strong> {row['Asesor']}<br>
+                    <strong>🔗 Etapa:</strong> {ETIQUETAS_ETAPA[vinculo['Etapa']]}{linea_taller}
                 </div>
                 """, unsafe_allow_html=True)
         else:
@@ -513,44 +718,23 @@ if not df.empty:
             fecha_recomendada = obtener_proxima_fecha_libre(dias_reales)
             recomendaciones_grupos[row['Grupo']] = fecha_recomendada
 
-tab_turnos, tab_prog, tab_portal, tab_fac, tab_kpi, tab_hist = st.tabs([
-    "📋 Turnero y Entregas", "🛠️ Programación del Taller", "🏢 Seguimiento Empresas", "💰 Facturación", "📊 KPIs", "📅 Históricos"
-])
+# --- ENRUTADOR DE SECCIONES ---
+# A diferencia de st.tabs (que ejecuta las seis pestañas en cada rerun), sólo corre la sección elegida.
+SECCION_ACTIVA = st.radio("Sección", SECCIONES, horizontal=True, label_visibility="collapsed", key="seccion_activa")
+pila_seccion = ExitStack()
+pila_seccion.enter_context(medir(f"seccion:{SECCION_ACTIVA}"))
 
 # ==========================================
 # PESTAÑA 1: TURNERO Y ENTREGAS
 # ==========================================
-with tab_turnos:
+if SECCION_ACTIVA == SECCIONES[0]:
     if recomendaciones_grupos and not busqueda_global:
         st.info("**📅 Asistente de Turnos (Disponibilidad Estimada por Grupo):**\n" + 
                 " | ".join([f"**{g}**: libre desde el {f}" for g, f in recomendaciones_grupos.items()]))
     
-    st.markdown("<h4 style='color: #00235d; margin-top: 10px;'>🔍 Filtros de Visualización (Aplican a Ingresos y Salidas)</h4>", unsafe_allow_html=True)
-    col_fecha, col_asesor, col_add = st.columns([1, 1, 2])
-    
-    with col_fecha:
-        if mes_filtro != "TODOS":
-            primer_dia = date(año_filtro, mes_num_filtro, 1)
-            _, ult_dia_int = calendar.monthrange(año_filtro, mes_num_filtro)
-            ultimo_dia = date(año_filtro, mes_num_filtro, ult_dia_int)
-            
-            if mes_seleccionado_label == "🗓️ MES ACTUAL":
-                rango_default = (hoy.date(), hoy.date()) 
-            else:
-                rango_default = (primer_dia, ultimo_dia) 
-        else:
-            rango_default = (hoy.date(), hoy.date())
-            
-        fechas_seleccionadas = st.date_input("📅 Rango de Fechas", value=rango_default, format="DD/MM/YYYY")
-        if isinstance(fechas_seleccionadas, tuple):
-            f_inicio = f_fin = fechas_seleccionadas[0] if len(fechas_seleccionadas) < 2 else fechas_seleccionadas[0]
-            if len(fechas_seleccionadas) == 2: f_fin = fechas_seleccionadas[1]
-        else: f_inicio = f_fin = fechas_seleccionadas
-        
-    with col_asesor: 
-        asesor_filtro = st.selectbox("👔 Filtrar por Asesor", ["TODOS"] + ASESORES_LISTA)
-        
-    with col_add:
+    # --- FRAGMENTOS: editar una tabla o el formulario re-ejecuta sólo su bloque, no todo el tablero ---
+    @st.fragment
+    def formulario_sin_turno(f_inicio):
         with st.expander("➕ Ingresar vehículo SIN TURNO (Walk-in)"):
             if "procesando_envio" not in st.session_state:
                 st.session_state.procesando_envio = False
@@ -592,7 +776,9 @@ with tab_turnos:
                     if not st.session_state.procesando_envio:
                         if nueva_patente and nuevo_vehiculo:
                             st.session_state.procesando_envio = True
-                            if hoja is not None:
+                            hoja = hoja_turnos()
+                            if hoja is None: st.session_state.procesando_envio = False
+                            else:
                                 try:
                                     val_recibido = "SI" if val_recibido_bool else ""
                                     val_foto = "SI" if val_foto_bool else ""
@@ -619,12 +805,11 @@ with tab_turnos:
                                         ""                              # Q: MOTIVO CANCELACION
                                     ]
                                     
-                                    hoja.append_row(nueva_fila)
+                                    with candado_turnos(): hoja.append_row(nueva_fila); contar_llamada_api('gspread')
                                     
                                     # Forzamos limpieza de memoria (Truco de la versión)
-                                    st.cache_data.clear()
-                                    if 'memoria_turnos_v12' in st.session_state:
-                                        del st.session_state['memoria_turnos_v12']
+                                    refrescar_datos('turnos')
+                                    st.session_state.pop('memoria_turnos_version', None)
                                     
                                     st.success(f"¡Vehículo {nueva_patente.upper()} guardado exitosamente!")
                                     
@@ -639,24 +824,18 @@ with tab_turnos:
                     else:
                         st.error("Aguardá un momento, se está procesando el envío anterior.")
 
-    st.markdown("<br>", unsafe_allow_html=True)
-    
-    with st.container(border=True):
-        st.markdown("<h2 style='color: #00235d; margin-top: 0;'>📥 1. INGRESOS: Recepción de Vehículos</h2>", unsafe_allow_html=True)
-        st.write("Administración de turnos y vehículos programados para **entrar** al taller en las fechas seleccionadas.")
-        
-        mask = (df_turnos_display['Fecha'] >= f_inicio) & (df_turnos_display['Fecha'] <= f_fin)
-        df_rango = df_turnos_display[mask].copy()
-        if asesor_filtro != "TODOS": df_rango = df_rango[df_rango['Asesor'] == asesor_filtro]
-
+    @st.fragment
+    def bloque_ingresos(df_rango):
+        # Conflictos del último guardado: se muestran después del rerun que recarga la planilla
+        conflictos_previos = st.session_state.pop('conflictos_turnos', [])
+        if conflictos_previos: st.warning(f"⚠️ No se guardaron los cambios de {', '.join(conflictos_previos)}: otro usuario modificó esas filas en la planilla. Revisalos y volvé a aplicarlos.")
         if df_rango.empty: 
             st.info("No hay turnos para los filtros seleccionados o la búsqueda actual.")
         else:
             # Los activos son los NO cancelados
             df_activos = df_rango[df_rango['Cancelado'] == False]
             
-            # Recibido se considera cuando tiene Ticket o Ref y checkboxes OK
-            mascara_recibidos = ((df_activos['Ticket'].str.strip() != "") | (df_activos['Referencia'].str.strip() != "")) & (df_activos['Recibido'] == True) & (df_activos['Fotos'] == True)
+            mascara_recibidos = mascara_turno_recibido(df_activos)
             
             df_pendientes = df_activos[~mascara_recibidos].sort_values(['Fecha', 'Hora', 'Asesor'])
             df_recibidos = df_activos[mascara_recibidos].sort_values(['Fecha', 'Hora', 'Asesor'])
@@ -693,56 +872,14 @@ with tab_turnos:
 
             if st.button("💾 Guardar Cambios e Ingresos"):
                     with st.spinner("Sincronizando con la base de datos..."):
-                        # SUPER LIMPIEZA: Cargamos patentes del Sheet borrando TODO espacio y pasando a Mayúsculas
-                        patentes_sheet_raw = hoja.col_values(5) if hoja else []
-                        patentes_limpias = ["".join(str(p).split()).upper() for p in patentes_sheet_raw]
-                        
-                        def procesar_guardado_fila(row, row_orig):
-                            if (row['Fecha'] != row_orig['Fecha'] or row['Recibido'] != row_orig['Recibido'] or 
-                                row['Fotos'] != row_orig['Fotos'] or str(row['Ticket']).strip() != str(row_orig['Ticket']).strip() or 
-                                str(row['Referencia']).strip() != str(row_orig['Referencia']).strip() or row['Asesor'] != row_orig['Asesor'] or 
-                                row['Cancelado'] != row_orig['Cancelado'] or 
-                                str(row.get('Motivo_Cancelacion','')) != str(row_orig.get('Motivo_Cancelacion','')) or
-                                str(row.get('Observaciones','')) != str(row_orig.get('Observaciones',''))):
-                                
-                                patente_buscada = "".join(str(row['Patente']).split()).upper()
-                                
-                                if hoja and patente_buscada in patentes_limpias:
-                                    # --- BÚSQUEDA INVERTIDA (De abajo hacia arriba) ---
-                                    fila_sheet = len(patentes_limpias) - patentes_limpias[::-1].index(patente_buscada)
-                                    try:
-                                        hoja.update_acell(f'B{fila_sheet}', row['Fecha'].strftime('%d/%m/%Y'))
-                                        hoja.update_acell(f'F{fila_sheet}', row['Asesor'])
-                                        hoja.update_acell(f'I{fila_sheet}', str(row['Observaciones']) if pd.notna(row['Observaciones']) else "")
-                                        hoja.update_acell(f'M{fila_sheet}', str(row['Ticket']) if pd.notna(row['Ticket']) else "")
-                                        hoja.update_acell(f'N{fila_sheet}', "SI" if row['Recibido'] else "")
-                                        hoja.update_acell(f'O{fila_sheet}', "SI" if row['Fotos'] else "")
-                                        hoja.update_acell(f'P{fila_sheet}', str(row['Referencia']) if pd.notna(row['Referencia']) else "")
-                                        
-                                        if row['Cancelado']:
-                                            hoja.update_acell(f'A{fila_sheet}', "C")
-                                            hoja.update_acell(f'Q{fila_sheet}', str(row['Motivo_Cancelacion']) if pd.notna(row['Motivo_Cancelacion']) else "")
-                                        elif row_orig['Cancelado'] and not row['Cancelado']:
-                                            hoja.update_acell(f'A{fila_sheet}', "N" if row_orig['Tipo'] == '🚶‍♂️ SIN TURNO' else "SI") 
-                                            hoja.update_acell(f'Q{fila_sheet}', "")
-                                    except Exception as e: st.error(f"Error guardando {row['Patente']}: {e}")
-
-                        if not edited_prog.empty:
-                            for idx, row in edited_prog.iterrows():
-                                procesar_guardado_fila(row, df_prog.loc[idx])
-                                        
-                        if not edited_sin.empty:
-                            for idx, row in edited_sin.iterrows():
-                                if row.get('Eliminar', False): 
-                                    patente_buscada = "".join(str(row['Patente']).split()).upper()
-                                    if hoja and patente_buscada in patentes_limpias:
-                                        fila_invertida = len(patentes_limpias) - patentes_limpias[::-1].index(patente_buscada)
-                                        try: hoja.delete_rows(fila_invertida)
-                                        except: pass
-                                else:
-                                    procesar_guardado_fila(row, df_sin.loc[idx])
+                        try:
+                            with medir("diff_editores"):
+                                cambios = [c for original, editado in ((df_prog, edited_prog), (df_sin, edited_sin)) if not editado.empty for c in cambios_turnos(original, editado)]
+                            hoja = hoja_turnos() if cambios else None
+                            if hoja is not None: _, st.session_state.conflictos_turnos = escribir_turnos(hoja, cambios, df_rango.attrs.get('version', ''))
+                        except Exception as e: st.error(f"Error guardando en Sheets: {e}")
                                             
-                        st.cache_data.clear()
+                        refrescar_datos('turnos')
                         claves_a_borrar = [k for k in st.session_state.keys() if k.startswith('memoria_turnos')]
                         for k in claves_a_borrar: del st.session_state[k]
                             
@@ -761,37 +898,17 @@ with tab_turnos:
                 
                 if st.button("💾 Guardar Correcciones (Completados)"):
                     with st.spinner("Actualizando planilla en la nube..."):
-                        
-                        patentes_sheet_raw = hoja.col_values(5) if hoja else []
-                        patentes_limpias = ["".join(str(p).split()).upper() for p in patentes_sheet_raw]
-                        
-                        cambios_detectados = False
-                        
-                        for idx, row in edited_recibidos.iterrows():
-                            row_orig = df_recibidos.loc[idx]
-                            
-                            if (row['Recibido'] != row_orig['Recibido'] or 
-                                row['Fotos'] != row_orig['Fotos'] or 
-                                str(row['Ticket']).strip() != str(row_orig['Ticket']).strip() or 
-                                str(row['Referencia']).strip() != str(row_orig['Referencia']).strip()):
-                                
-                                patente_buscada = "".join(str(row['Patente']).split()).upper()
-                                cambios_detectados = True
-                                
-                                if hoja and patente_buscada in patentes_limpias:
-                                    fila_sheet = len(patentes_limpias) - patentes_limpias[::-1].index(patente_buscada)
-                                    try:
-                                        hoja.update_acell(f'N{fila_sheet}', "SI" if row['Recibido'] else "")
-                                        hoja.update_acell(f'O{fila_sheet}', "SI" if row['Fotos'] else "")
-                                        hoja.update_acell(f'M{fila_sheet}', str(row['Ticket']) if pd.notna(row['Ticket']) else "")
-                                        hoja.update_acell(f'P{fila_sheet}', str(row['Referencia']) if pd.notna(row['Referencia']) else "")
-                                    except Exception as e:
-                                        st.error(f"Error guardando la patente {patente_buscada}: {e}")
-                                else:
-                                    st.warning(f"Atención: La patente {patente_buscada} no se encontró en el Google Sheets.")
+                        cambios = []
+                        try:
+                            with medir("diff_editores"): cambios = cambios_turnos(df_recibidos, edited_recibidos, ['Recibido', 'Fotos', 'Ticket', 'Referencia'])
+                            hoja = hoja_turnos() if cambios else None
+                            if hoja is not None: _, st.session_state.conflictos_turnos = escribir_turnos(hoja, cambios, df_rango.attrs.get('version', ''))
+                        except Exception as e:
+                            st.error(f"Error guardando en Sheets: {e}")
+                        cambios_detectados = bool(cambios)
                         
                         if cambios_detectados:
-                            st.cache_data.clear()
+                            refrescar_datos('turnos')
                             claves_a_borrar = [k for k in st.session_state.keys() if k.startswith('memoria_turnos')]
                             for k in claves_a_borrar: del st.session_state[k]
                                 
@@ -799,13 +916,11 @@ with tab_turnos:
                         else:
                             st.info("No detecté cambios nuevos para guardar.")
 
-    with st.container(border=True):
-        st.markdown("<h2 style='color: #1e7e34; margin-top: 0;'>📤 2. SALIDAS: Agenda de Entregas</h2>", unsafe_allow_html=True)
-        st.write("Vehículos listos para entregar al cliente en las fechas seleccionadas.")
-        
+    @st.fragment
+    def bloque_salidas(df, f_inicio, f_fin, asesor_filtro):
         if not df.empty:
             df_no_entregados = df[~df['Estado_Taller'].str.contains("ENTREGADO", na=False)].copy()
-            df_no_entregados = df_no_entregados[~df_no_entregados['Patente'].isin(st.session_state.entregas_confirmadas)]
+            df_no_entregados = df_no_entregados[~df_no_entregados['Patente'].isin(ENTREGAS.patentes())]
             df_no_entregados['Entregado_OK'] = False
             
             entregas_rango = df_no_entregados[(df_no_entregados['Fecha_Promesa_Disp'] >= f_inicio) & (df_no_entregados['Fecha_Promesa_Disp'] <= f_fin)].copy()
@@ -821,9 +936,9 @@ with tab_turnos:
             st.markdown("#### 🔴 Entregas Atrasadas (Vencidas)")
             if not entregas_atrasadas.empty:
                 entregas_atrasadas = entregas_atrasadas.sort_values(by='Fecha_Promesa_Disp', ascending=True)
-                entregas_atrasadas['Fecha Prom.'] = entregas_atrasadas['Fecha_Promesa_Disp'].apply(lambda x: x.strftime('%d/%m/%Y'))
+                entregas_atrasadas['Fecha Prom.'] = columna_formateada(entregas_atrasadas, 'Fecha_Promesa_Disp_dmy')
                 # Calculamos los días de demora exactos
-                entregas_atrasadas['Demora (Días)'] = entregas_atrasadas['Fecha_Promesa_Disp'].apply(lambda x: (hoy.date() - x).days if pd.notna(x) else 0)
+                entregas_atrasadas['Demora (Días)'] = dias_de_demora(entregas_atrasadas, hoy.date())
                 
                 edit_atra = st.data_editor(
                     entregas_atrasadas[['Entregado_OK', 'Demora (Días)', 'Fecha Prom.', 'Patente', 'Vehiculo', 'Asesor', 'Estado_Taller', 'Grupo', 'Precio', 'Observaciones']], 
@@ -855,7 +970,7 @@ with tab_turnos:
                 
             st.markdown(f"#### 🟢 Entregas Programadas {titulo_rango}")
             if not entregas_rango.empty:
-                entregas_rango['Fecha Prom.'] = entregas_rango['Fecha_Promesa_Disp'].apply(lambda x: x.strftime('%d/%m') if pd.notna(x) else "")
+                entregas_rango['Fecha Prom.'] = columna_formateada(entregas_rango, 'Fecha_Promesa_Disp_dm')
                 
                 orden_grupos_maestro = ["GRUPO UNO", "GRUPO DOS", "GRUPO TRES", "PARABRISAS", "TERCEROS"]
                 grupos_rango_unicos = [g for g in orden_grupos_maestro if g in entregas_rango['Grupo'].unique()]
@@ -896,13 +1011,57 @@ with tab_turnos:
                     if not edit_atra.empty: nuevas_confirmadas.extend(edit_atra[edit_atra['Entregado_OK'] == True]['Patente'].tolist())
                     
                     if nuevas_confirmadas:
-                        st.session_state.entregas_confirmadas.extend(nuevas_confirmadas)
+                        ENTREGAS.registrar(nuevas_confirmadas)
                         st.success(f"Se registraron {len(nuevas_confirmadas)} entregas. ¡A seguir facturando!")
                         time.sleep(1)
                         st.rerun()
                     else:
                         st.warning("No marcaste ningún vehículo como entregado.")
-                        
+
+    st.markdown("<h4 style='color: #00235d; margin-top: 10px;'>🔍 Filtros de Visualización (Aplican a Ingresos y Salidas)</h4>", unsafe_allow_html=True)
+    col_fecha, col_asesor, col_add = st.columns([1, 1, 2])
+    
+    with col_fecha:
+        if mes_filtro != "TODOS":
+            primer_dia = date(año_filtro, mes_num_filtro, 1)
+            _, ult_dia_int = calendar.monthrange(año_filtro, mes_num_filtro)
+            ultimo_dia = date(año_filtro, mes_num_filtro, ult_dia_int)
+            
+            if mes_seleccionado_label == "🗓️ MES ACTUAL":
+                rango_default = (hoy.date(), hoy.date()) 
+            else:
+                rango_default = (primer_dia, ultimo_dia) 
+        else:
+            rango_default = (hoy.date(), hoy.date())
+            
+        fechas_seleccionadas = st.date_input("📅 Rango de Fechas", value=rango_default, format="DD/MM/YYYY")
+        if isinstance(fechas_seleccionadas, tuple):
+            f_inicio = f_fin = fechas_seleccionadas[0] if len(fechas_seleccionadas) < 2 else fechas_seleccionadas[0]
+            if len(fechas_seleccionadas) == 2: f_fin = fechas_seleccionadas[1]
+        else: f_inicio = f_fin = fechas_seleccionadas
+        
+    with col_asesor: 
+        asesor_filtro = st.selectbox("👔 Filtrar por Asesor", ["TODOS"] + ASESORES_LISTA)
+        
+    with col_add:
+        formulario_sin_turno(f_inicio)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    
+    with st.container(border=True):
+        st.markdown("<h2 style='color: #00235d; margin-top: 0;'>📥 1. INGRESOS: Recepción de Vehículos</h2>", unsafe_allow_html=True)
+        st.write("Administración de turnos y vehículos programados para **entrar** al taller en las fechas seleccionadas.")
+        
+        df_rango = seleccionar_turnos(df_turnos_sesion, f_inicio, f_fin, asesor_filtro, termino_busqueda)
+
+        bloque_ingresos(df_rango)
+
+    with st.container(border=True):
+        st.markdown("<h2 style='color: #1e7e34; margin-top: 0;'>📤 2. SALIDAS: Agenda de Entregas</h2>", unsafe_allow_html=True)
+        st.write("Vehículos listos para entregar al cliente en las fechas seleccionadas.")
+        
+        bloque_salidas(df, f_inicio, f_fin, asesor_filtro)
+
             # --- NUEVO BLOQUE: BALANCEO DE CARGA ---
         st.divider()
         st.markdown("### ⚖️ Balanceo de Carga Operativa (Cuellos de Botella)")
@@ -936,10 +1095,13 @@ with tab_turnos:
             # Dejamos solo las tres letras del día para el gráfico
             df_semana['Día'] = df_semana['Día'].apply(lambda x: x.split('-')[1] if isinstance(x, str) else x)
             
-            fig_sem = px.bar(df_semana, x='Día', y='Cantidad', color='Movimiento', barmode='group', 
-                             title="Saturación por Día de la Semana",
-                             color_discrete_map={'📥 Recepciones': '#00235d', '📤 Entregas': '#28a745'}, text_auto=True)
-            fig_sem.update_layout(xaxis_title="", yaxis_title="Cant. de Vehículos", legend_title_text="")
+            def armar_fig_sem(d):
+                fig_sem = px.bar(d, x='Día', y='Cantidad', color='Movimiento', barmode='group', 
+                                 title="Saturación por Día de la Semana",
+                                 color_discrete_map={'📥 Recepciones': '#00235d', '📤 Entregas': '#28a745'}, text_auto=True)
+                fig_sem.update_layout(xaxis_title="", yaxis_title="Cant. de Vehículos", legend_title_text="")
+                return fig_sem
+            fig_sem = FIGURAS.obtener("saturacion_semana", df_semana, armar_fig_sem)
             
             # Key única para que no choque con la de Facturación
             st.plotly_chart(fig_sem, use_container_width=True, key="grafico_saturacion_semana_turnos")
@@ -951,15 +1113,18 @@ with tab_turnos:
             if mes_filtro != "TODOS":
                  entregas_diarias = entregas_diarias[entregas_diarias['Fecha_Promesa_Dt'].dt.month == mes_num_filtro]
                  
-            fig_dia = px.bar(entregas_diarias, x='Fecha_Promesa_Dt', y='Cantidad', 
-                             title="Calendario de Entregas (Pico de Fin de Mes)",
-                             color_discrete_sequence=['#28a745'], text_auto=True)
-            fig_dia.update_layout(xaxis_title="Fecha de Entrega", yaxis_title="Cant. de Vehículos")
-            
-            # Le clavamos una línea roja de promedio para escrachar los días saturados
-            if not entregas_diarias.empty:
-                promedio_entregas = entregas_diarias['Cantidad'].mean()
-                fig_dia.add_hline(y=promedio_entregas, line_dash="dash", line_color="#dc3545", annotation_text=f"Promedio Ideal: {promedio_entregas:.1f}/día", annotation_position="top left")
+            def armar_fig_dia(d):
+                fig_dia = px.bar(d, x='Fecha_Promesa_Dt', y='Cantidad', 
+                                 title="Calendario de Entregas (Pico de Fin de Mes)",
+                                 color_discrete_sequence=['#28a745'], text_auto=True)
+                fig_dia.update_layout(xaxis_title="Fecha de Entrega", yaxis_title="Cant. de Vehículos")
+                
+                # Le clavamos una línea roja de promedio para escrachar los días saturados
+                if not d.empty:
+                    promedio_entregas = d['Cantidad'].mean()
+                    fig_dia.add_hline(y=promedio_entregas, line_dash="dash", line_color="#dc3545", annotation_text=f"Promedio Ideal: {promedio_entregas:.1f}/día", annotation_position="top left")
+                return fig_dia
+            fig_dia = FIGURAS.obtener("calendario_entregas", entregas_diarias, armar_fig_dia)
                 
             # Key única para que no choque con la de Facturación
             st.plotly_chart(fig_dia, use_container_width=True, key="grafico_calendario_entregas_turnos")
@@ -968,7 +1133,7 @@ with tab_turnos:
 # ==========================================
 # PESTAÑA 2: PROGRAMACIÓN Y KANBAN
 # ==========================================
-with tab_prog:
+if SECCION_ACTIVA == SECCIONES[1]:
     st.subheader("🛠️ Programación y Flujo de Trabajo")
     if not df.empty:
         col_filtro, _ = st.columns([1, 2])
@@ -1044,9 +1209,9 @@ with tab_prog:
                     if not d_e.empty:
                         d_e = d_e.sort_values(by='Fin', ascending=True, na_position='last')
                         
-                        d_e['F. Ingreso'] = d_e['Fecha_Ingreso'].apply(lambda x: x.strftime('%d/%m') if pd.notna(x) else "")
-                        d_e['1ra Promesa'] = d_e['Fecha_Ticket'].apply(lambda x: x.strftime('%d/%m') if pd.notna(x) else "")
-                        d_e['F. Entrega'] = d_e['Fecha_Promesa_Disp'].apply(lambda x: x.strftime('%d/%m') if pd.notna(x) else "")
+                        d_e['F. Ingreso'] = columna_formateada(d_e, 'Fecha_Ingreso_dm')
+                        d_e['1ra Promesa'] = columna_formateada(d_e, 'Fecha_Ticket_dm')
+                        d_e['F. Entrega'] = columna_formateada(d_e, 'Fecha_Promesa_Disp_dm')
                         
                         if "TERM" in m_key or "ENTREGADO" in m_key:
                             cols_to_show = ['F. Ingreso', '1ra Promesa', 'F. Entrega', 'Hora_Entrega', 'Patente', 'Vehiculo', 'Asesor', 'Paños', 'Precio', 'Observaciones']
@@ -1156,29 +1321,21 @@ with tab_prog:
                 resumen_abc = df_en_proceso.groupby('Tipo_ABC')['Patente'].count().reset_index().rename(columns={'Patente': 'Cant. Vehículos'})
                 st.dataframe(resumen_abc, hide_index=True, use_container_width=True)
             with c_abc2:
-                fig_abc = px.pie(resumen_abc, values='Cant. Vehículos', names='Tipo_ABC', hole=0.4, title="Vehículos EN PROCESO por Clasificación ABC", color_discrete_sequence=['#28a745', '#ffc107', '#dc3545'])
+                fig_abc = FIGURAS.obtener("abc_en_proceso", resumen_abc, lambda d: px.pie(d, values='Cant. Vehículos', names='Tipo_ABC', hole=0.4, title="Vehículos EN PROCESO por Clasificación ABC", color_discrete_sequence=['#28a745', '#ffc107', '#dc3545']))
                 st.plotly_chart(fig_abc, use_container_width=True)
 
 # ==========================================
 # PESTAÑA 3: PORTAL EMPRESAS 
 # ==========================================
-with tab_portal:
+if SECCION_ACTIVA == SECCIONES[2]:
     if not df.empty:
         st.subheader("🏢 Seguimiento de Unidades: Empresas del Grupo")
-        df_grupo = df[df['Cliente'].str.contains('SOL|LUX|CIEL', case=False, na=False)].copy()
+        df_grupo = vehiculos_empresa(df)
         if not df_grupo.empty:
             c_filtro, _ = st.columns([1, 2])
             with c_filtro: empresa_filtro = st.selectbox("Seleccionar Empresa", ["TODAS", "AUTOSOL", "AUTOLUX", "CIEL / AUTOCIEL"])
-            df_vista_emp = df_grupo.copy()
-            if empresa_filtro == "AUTOSOL": df_vista_emp = df_vista_emp[df_vista_emp['Cliente'].str.contains('SOL', case=False, na=False)]
-            elif empresa_filtro == "AUTOLUX": df_vista_emp = df_vista_emp[df_vista_emp['Cliente'].str.contains('LUX', case=False, na=False)]
-            elif empresa_filtro == "CIEL / AUTOCIEL": df_vista_emp = df_vista_emp[df_vista_emp['Cliente'].str.contains('CIEL', case=False, na=False)]
-            
-            df_vista_emp = df_vista_emp.sort_values(by='Fecha_Promesa_Disp', ascending=True, na_position='last')
-            
-            en_proceso = len(df_vista_emp[df_vista_emp['Estado_Taller'].str.contains("PROCESO", na=False)])
-            detenidos = len(df_vista_emp[df_vista_emp['Estado_Taller'].str.contains("DETENIDO", na=False)])
-            terminados = len(df_vista_emp[df_vista_emp['Estado_Taller'].str.contains("TERM", na=False)])
+            df_vista_emp = vehiculos_empresa(df_grupo, empresa_filtro).copy()
+            en_proceso, detenidos, terminados = contadores_portal(df_vista_emp).values()
             
             ce1, ce2, ce3 = st.columns(3)
             ce1.markdown(f'<div class="metric-card"><div class="metric-title">En Proceso</div><div class="metric-value-number">{en_proceso}</div><div class="metric-subtitle-blue">Vehículos en Taller</div></div>', unsafe_allow_html=True)
@@ -1186,24 +1343,15 @@ with tab_portal:
             ce3.markdown(f'<div class="metric-card"><div class="metric-title">Terminados (Pte. Entregar)</div><div class="metric-value-number" style="color:#28a745;">{terminados}</div><div class="metric-subtitle-green">Listos / Facturando</div></div>', unsafe_allow_html=True)
             st.divider()
             
-            def calcular_fecha_entrega(row):
-                f_prom = row['Fecha_Promesa_Disp']
-                f_tick = row['Fecha_Ticket']
-                if pd.isna(f_prom): return "Sin Fecha"
-                texto_fecha = f_prom.strftime('%d/%m/%Y')
-                if pd.notna(f_tick) and f_prom > f_tick: return f"{texto_fecha} 🟡 (Demorado)"
-                return texto_fecha
-            df_vista_emp['Fecha Entrega'] = df_vista_emp.apply(calcular_fecha_entrega, axis=1)
-            
-            def calcular_estado(estado):
-                estado_str = str(estado).upper()
-                if "DETENIDO" in estado_str: return f"🔴 {estado_str}"
-                return estado_str
-            df_vista_emp['Estado_Taller'] = df_vista_emp['Estado_Taller'].apply(calcular_estado)
-            df_vista_emp['Fecha Ingreso'] = df_vista_emp['Fecha_Ingreso'].apply(lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else "Sin Fecha")
-            df_vista_emp['Fecha Ticket'] = df_vista_emp['Fecha_Ticket'].apply(lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else "Sin Fecha")
-            df_vista_emp['Fecha Ingreso Concesionario'] = None
-            df_vista_emp['Asesor Concesionario'] = ""
+            df_vista_emp['Fecha Entrega'] = columna_formateada(df_vista_emp, 'Entrega_Empresa')
+            df_vista_emp['Estado_Taller'] = columna_formateada(df_vista_emp, 'Estado_Empresa')
+            df_vista_emp['Fecha Ingreso'] = columna_formateada(df_vista_emp, 'Fecha_Ingreso_dmy')
+            df_vista_emp['Fecha Ticket'] = columna_formateada(df_vista_emp, 'Fecha_Ticket_dmy')
+            # Notas del portal unidas por patente; las observaciones del concesionario reemplazan a las de la planilla
+            notas = NOTAS_PORTAL.notas().reindex(df_vista_emp['Patente'])
+            df_vista_emp['Fecha Ingreso Concesionario'] = notas['Fecha Ingreso Concesionario'].to_numpy()
+            df_vista_emp['Asesor Concesionario'] = notas['Asesor Concesionario'].fillna("").to_numpy()
+            df_vista_emp['Observaciones'] = np.where(notas['Observaciones'].notna(), notas['Observaciones'], df_vista_emp['Observaciones'])
 
             vista_columnas = ['Cliente', 'Vehiculo', 'Patente', 'Fecha Ingreso', 'Fecha Ticket', 'Estado_Taller', 'Fecha Entrega', 'Asesor', 'Fecha Ingreso Concesionario', 'Asesor Concesionario', 'Observaciones']
             mask_entregados = df_vista_emp['Estado_Taller'].str.contains('ENTREGADO', na=False)
@@ -1211,7 +1359,13 @@ with tab_portal:
             df_entregados = df_vista_emp[mask_entregados][vista_columnas].rename(columns={'Estado_Taller': 'Estado Actual'})
             
             st.write("#### ⏳ Vehículos en Taller (Prioridad por Fecha Promesa)")
-            st.data_editor(df_pendientes, hide_index=True, use_container_width=True, column_config={"Cliente": st.column_config.TextColumn("Cliente", disabled=True), "Vehiculo": st.column_config.TextColumn("Vehículo", disabled=True), "Patente": st.column_config.TextColumn("Patente", disabled=True), "Fecha Ingreso": st.column_config.TextColumn("Ingreso Taller", disabled=True), "Fecha Ticket": st.column_config.TextColumn("1ra Fecha Prom.", disabled=True), "Estado Actual": st.column_config.TextColumn("Estado Actual", disabled=True), "Fecha Entrega": st.column_config.TextColumn("Fecha Entrega", disabled=True), "Asesor": st.column_config.TextColumn("Asesor Taller", disabled=True), "Fecha Ingreso Concesionario": st.column_config.DateColumn("🗓️ Ingreso Conces.", format="DD/MM/YYYY"), "Asesor Concesionario": st.column_config.TextColumn("👤 Asesor Conces."), "Observaciones": st.column_config.TextColumn("📝 Observaciones (Doble Clic)", width="large", max_chars=1000)}, key="editor_observaciones_pendientes")
+            edit_portal = st.data_editor(df_pendientes, hide_index=True, use_container_width=True, column_config={"Cliente": st.column_config.TextColumn("Cliente", disabled=True), "Vehiculo": st.column_config.TextColumn("Vehículo", disabled=True), "Patente": st.column_config.TextColumn("Patente", disabled=True), "Fecha Ingreso": st.column_config.TextColumn("Ingreso Taller", disabled=True), "Fecha Ticket": st.column_config.TextColumn("1ra Fecha Prom.", disabled=True), "Estado Actual": st.column_config.TextColumn("Estado Actual", disabled=True), "Fecha Entrega": st.column_config.TextColumn("Fecha Entrega", disabled=True), "Asesor": st.column_config.TextColumn("Asesor Taller", disabled=True), "Fecha Ingreso Concesionario": st.column_config.DateColumn("🗓️ Ingreso Conces.", format="DD/MM/YYYY"), "Asesor Concesionario": st.column_config.TextColumn("👤 Asesor Conces."), "Observaciones": st.column_config.TextColumn("📝 Observaciones (Doble Clic)", width="large", max_chars=1000)}, key="editor_observaciones_pendientes")
+            if st.button("💾 Guardar Cambios del Portal"):
+                with medir("diff_editores"): cambios = diferenciar_ediciones(df_pendientes, edit_portal, COMPARACION_PORTAL)
+                if cambios.empty: st.info("No detecté cambios nuevos para guardar.")
+                else:
+                    cambios['patente'] = df_pendientes.loc[cambios['idx'], 'Patente'].to_numpy()
+                    st.success(f"¡{NOTAS_PORTAL.guardar(cambios)} cambios guardados!"); time.sleep(1); st.rerun()
             st.write("#### 🚚 Vehículos Entregados (Historial Reciente)")
             st.dataframe(df_entregados, hide_index=True, use_container_width=True, column_config={"Observaciones": st.column_config.TextColumn("Observaciones", width="large")})
         else: st.info("No hay vehículos registrados para las empresas del grupo en este momento.")
@@ -1219,39 +1373,35 @@ with tab_portal:
 # ==========================================
 # PESTAÑA 4: FACTURACIÓN Y OBJETIVOS
 # ==========================================
-with tab_fac:
+if SECCION_ACTIVA == SECCIONES[3]:
     if not df.empty:
         st.subheader("🎯 Análisis de Facturación, Paños y Objetivos")
         
         df_analisis = df.copy()
         
-        def clasificar_estado(row):
-            est_taller = str(row['Estado_Taller']).upper()
-            est_fac = str(row['Estado_Fac']).upper()
-            
-            if 'DETENIDO' in est_taller: return 'En Taller (Otros)' 
-            if est_fac == 'FAC': return 'Facturado (FAC)'
-            if est_fac == 'SI': return 'Aprobado (SI)'
-            return 'En Taller (Otros)'
-            
-        df_analisis['Estado_Resumen'] = df_analisis.apply(clasificar_estado, axis=1)
+        # Misma regla que SQL_ESTADO_RESUMEN: un DETENIDO nunca cuenta como FAC/SI
+        est_fac = df_analisis['Estado_Fac'].astype(str).str.upper()
+        detenido = df_analisis['Estado_Taller'].astype(str).str.upper().str.contains('DETENIDO', regex=False)
+        df_analisis['Estado_Resumen'] = np.select([detenido, est_fac == 'FAC', est_fac == 'SI'], ['En Taller (Otros)', 'Facturado (FAC)', 'Aprobado (SI)'], default='En Taller (Otros)')
+        
+        totales_fac = resumen_facturacion(df_completo, mes_filtro, termino_busqueda)
+        total_fac = lambda origen, estado, campo: float(totales_fac[campo].get((origen, estado), 0.0))
 
         # ==========================================
         # 🚨 CIRUGÍA MAYOR: SEPARAMOS PROPIOS DE TERCEROS
         # ==========================================
         df_propios = df_analisis[df_analisis['Grupo'] != 'TERCEROS'].copy()
-        df_terceros = df_analisis[df_analisis['Grupo'] == 'TERCEROS'].copy()
 
         # Todo el análisis principal ahora se hace SOLO sobre los Propios
         df_fac_prop = df_propios[df_propios['Estado_Resumen'] == 'Facturado (FAC)']
         df_si_prop = df_propios[df_propios['Estado_Resumen'] == 'Aprobado (SI)']
         
-        pesos_fac = df_fac_prop['Precio'].sum()
-        pesos_si = df_si_prop['Precio'].sum()
+        pesos_fac = total_fac('PROPIOS', 'Facturado (FAC)', 'Precio')
+        pesos_si = total_fac('PROPIOS', 'Aprobado (SI)', 'Precio')
         pesos_est = pesos_fac + pesos_si
 
-        panos_fac_prop = df_fac_prop['Paños'].sum()
-        panos_si_prop = df_si_prop['Paños'].sum()
+        panos_fac_prop = total_fac('PROPIOS', 'Facturado (FAC)', 'Paños')
+        panos_si_prop = total_fac('PROPIOS', 'Aprobado (SI)', 'Paños')
         panos_est_prop = panos_fac_prop + panos_si_prop
         
         # --- CÁLCULOS DE OBJETIVOS (SOLO CON PAÑOS PROPIOS) ---
@@ -1314,17 +1464,14 @@ with tab_fac:
         st.divider()
         st.markdown("<h3 style='margin-top: -15px;'>🤝 Gestión Financiera de Terceros</h3>", unsafe_allow_html=True)
         
-        df_ter_fac = df_terceros[df_terceros['Estado_Resumen'] == 'Facturado (FAC)']
-        df_ter_si = df_terceros[df_terceros['Estado_Resumen'] == 'Aprobado (SI)']
-        
-        v_fac_ter = df_ter_fac['Precio'].sum()
-        v_si_ter = df_ter_si['Precio'].sum()
+        v_fac_ter = total_fac('TERCEROS', 'Facturado (FAC)', 'Precio')
+        v_si_ter = total_fac('TERCEROS', 'Aprobado (SI)', 'Precio')
         
-        c_fac_ter = df_ter_fac['Costo'].sum()
-        c_si_ter = df_ter_si['Costo'].sum()
+        c_fac_ter = total_fac('TERCEROS', 'Facturado (FAC)', 'Costo')
+        c_si_ter = total_fac('TERCEROS', 'Aprobado (SI)', 'Costo')
         
-        p_fac_ter = df_ter_fac['Paños'].sum()
-        p_si_ter = df_ter_si['Paños'].sum()
+        p_fac_ter = total_fac('TERCEROS', 'Facturado (FAC)', 'Paños')
+        p_si_ter = total_fac('TERCEROS', 'Aprobado (SI)', 'Paños')
 
         tot_ter_fac = v_fac_ter + v_si_ter
         tot_ter_costo = c_fac_ter + c_si_ter
@@ -1489,7 +1636,7 @@ with tab_fac:
         if cant_autos_no > 0:
             with st.expander(" > Ver detalle de los autos marcados con 'NO'"):
                 df_no_show = df_radar_no.copy()
-                df_no_show['Fecha Promesa'] = df_no_show['Fecha_Promesa_Disp'].apply(lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else "Sin Fecha")
+                df_no_show['Fecha Promesa'] = columna_formateada(df_no_show, 'Fecha_Promesa_Disp_dmy')
                 
                 st.dataframe(df_no_show[['Fecha Promesa', 'Patente', 'Vehiculo', 'Cliente', 'Asesor', 'Grupo', 'Paños', 'Precio']], hide_index=True, use_container_width=True, column_config={"Precio": st.column_config.NumberColumn("Precio ($)", format="$ %d")})
         else:
@@ -1501,46 +1648,17 @@ with tab_fac:
             st.markdown("### 📈 Curva de Producción y Facturación del Mes (Producción Propia)")
             st.write("Muestra cómo se acumula la plata. **Línea Gris:** Lo que la gerencia pide por día de forma lineal. **Línea Celeste:** Lo que *deberíamos* facturar si cumplimos con las Fechas Prometidas. **Línea Verde:** Lo que *realmente* ya terminamos o entregamos hasta hoy.")
             
-            primer_dia = date(año_filtro, mes_num_filtro, 1)
-            _, ult_dia = calendar.monthrange(año_filtro, mes_num_filtro)
-            fechas_mes = [date(año_filtro, mes_num_filtro, d) for d in range(1, ult_dia + 1)]
-
-            df_dias = pd.DataFrame({'Fecha': fechas_mes})
-            df_dias['Es_Habil'] = df_dias['Fecha'].apply(lambda x: x.weekday() < 5 and x not in FERIADOS_ARG)
-            df_habiles = df_dias[df_dias['Es_Habil']].copy()
-            df_habiles['Dia_Habil_Num'] = range(1, len(df_habiles) + 1)
-            
-            df_habiles['Meta Lineal (Paños)'] = df_habiles['Dia_Habil_Num'] * CAPACIDAD_DIARIA_TALLER
+            df_habiles = construir_curva_produccion(df_propios, VERSION_MAESTRO, año_filtro, mes_num_filtro, hoy.date(), CAPACIDAD_DIARIA_TALLER, busqueda_global)
 
-            df_proyeccion = df_propios[df_propios['Estado_Resumen'].isin(['Facturado (FAC)', 'Aprobado (SI)'])].copy()
-            
-            def asignar_fecha_curva(row):
-                f = row['Fecha_Promesa_Disp']
-                if pd.isna(f) or f.month != mes_num_filtro or f.year != año_filtro:
-                    return hoy.date() if hoy.month == mes_num_filtro else primer_dia
-                return f
-
-            df_proyeccion['Fecha_Curva'] = df_proyeccion.apply(asignar_fecha_curva, axis=1)
-            df_proyeccion['Es_Hecho'] = df_proyeccion['Estado_Taller'].str.contains('ENTREGADO|TERM', na=False) | (df_proyeccion['Estado_Resumen'] == 'Facturado (FAC)')
-
-            agrupado = df_proyeccion.groupby('Fecha_Curva').agg(Paños_Esperados=('Paños', 'sum'), Pesos_Esperados=('Precio', 'sum')).reset_index()
-            agrupado_hecho = df_proyeccion[df_proyeccion['Es_Hecho']].groupby('Fecha_Curva').agg(Paños_Hechos=('Paños', 'sum')).reset_index()
-
-            df_habiles = df_habiles.merge(agrupado, left_on='Fecha', right_on='Fecha_Curva', how='left').fillna(0)
-            df_habiles = df_habiles.merge(agrupado_hecho, left_on='Fecha', right_on='Fecha_Curva', how='left').fillna(0)
-
-            df_habiles['1. Proyección Esperada (SI+FAC)'] = df_habiles['Paños_Esperados'].cumsum()
-            df_habiles['Acumulado Pesos ($)'] = df_habiles['Pesos_Esperados'].cumsum()
-            df_habiles['2. Avance Real Hecho'] = df_habiles['Paños_Hechos'].cumsum()
-            
-            df_habiles.loc[df_habiles['Fecha'] > hoy.date(), '2. Avance Real Hecho'] = None
-
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=df_habiles['Fecha'], y=df_habiles['Meta Lineal (Paños)'], name='Meta Exigida (Lineal)', mode='lines', line=dict(color='gray', dash='dash', width=2)))
-            fig.add_trace(go.Scatter(x=df_habiles['Fecha'], y=df_habiles['1. Proyección Esperada (SI+FAC)'], name='Proyección según Fechas (Ideal)', mode='lines+markers', line=dict(color='#00A8E8', width=2), marker=dict(size=6, color='#00A8E8')))
-            fig.add_trace(go.Scatter(x=df_habiles['Fecha'], y=df_habiles['2. Avance Real Hecho'], name='Avance Real al Día de Hoy (Term/Entr)', mode='lines+markers', line=dict(color='#28a745', width=4), marker=dict(size=8, color='#1e7e34')))
-            
-            fig.update_layout(title="Curva de Acumulación de Trabajo (Solo Propios)", xaxis_title="Días Hábiles", yaxis_title="Cantidad de Paños Acumulados", legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), hovermode="x unified")
+            def armar_curva(d):
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=d['Fecha'], y=d['Meta Lineal (Paños)'], name='Meta Exigida (Lineal)', mode='lines', line=dict(color='gray', dash='dash', width=2)))
+                fig.add_trace(go.Scatter(x=d['Fecha'], y=d['1. Proyección Esperada (SI+FAC)'], name='Proyección según Fechas (Ideal)', mode='lines+markers', line=dict(color='#00A8E8', width=2), marker=dict(size=6, color='#00A8E8')))
+                fig.add_trace(go.Scatter(x=d['Fecha'], y=d['2. Avance Real Hecho'], name='Avance Real al Día de Hoy (Term/Entr)', mode='lines+markers', line=dict(color='#28a745', width=4), marker=dict(size=8, color='#1e7e34')))
+                
+                fig.update_layout(title="Curva de Acumulación de Trabajo (Solo Propios)", xaxis_title="Días Hábiles", yaxis_title="Cantidad de Paños Acumulados", legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), hovermode="x unified")
+                return fig
+            fig = FIGURAS.obtener("curva_produccion", df_habiles, armar_curva)
             st.plotly_chart(fig, use_container_width=True)
                 
         else:
@@ -1550,7 +1668,8 @@ with tab_fac:
 
         st.write("### 📊 Análisis de Producción Detallado")
         def crear_tabla_resumen(df_origen, columna_indice):
-            pivot = df_origen.pivot_table(index=columna_indice, columns='Estado_Resumen', values=['Paños', 'Precio'], aggfunc='sum', fill_value=0)
+            with medir(f"pivot_facturacion:{columna_indice}"):
+                pivot = df_origen.pivot_table(index=columna_indice, columns='Estado_Resumen', values=['Paños', 'Precio'], aggfunc='sum', fill_value=0)
             for est in ['Facturado (FAC)', 'Aprobado (SI)', 'En Taller (Otros)']:
                 if ('Paños', est) not in pivot.columns: pivot[('Paños', est)] = 0
                 if ('Precio', est) not in pivot.columns: pivot[('Precio', est)] = 0
@@ -1584,22 +1703,28 @@ with tab_fac:
 
             col_g_g1, col_g_g2 = st.columns(2)
             with col_g_g1:
-                fig_g_panos = px.bar(df_g_panos_chart, x='Grupo', y='Paños', color='Métrica', barmode='group', text_auto='.1f', title='📦 Paños Propios por Grupo', color_discrete_map=colores_grafico)
-                fig_g_panos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                def armar_fig_g_panos(d):
+                    fig_g_panos = px.bar(d, x='Grupo', y='Paños', color='Métrica', barmode='group', text_auto='.1f', title='📦 Paños Propios por Grupo', color_discrete_map=colores_grafico)
+                    fig_g_panos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                    return fig_g_panos
+                fig_g_panos = FIGURAS.obtener("barras_panos_grupo", df_g_panos_chart, armar_fig_g_panos)
                 st.plotly_chart(fig_g_panos, use_container_width=True)
             with col_g_g2:
-                fig_g_pesos = px.bar(df_g_pesos_chart, x='Grupo', y='Precio', color='Métrica', barmode='group', text_auto='$.2s', title='💰 Montos Propios por Grupo', color_discrete_map=colores_grafico)
-                fig_g_pesos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                def armar_fig_g_pesos(d):
+                    fig_g_pesos = px.bar(d, x='Grupo', y='Precio', color='Métrica', barmode='group', text_auto='$.2s', title='💰 Montos Propios por Grupo', color_discrete_map=colores_grafico)
+                    fig_g_pesos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                    return fig_g_pesos
+                fig_g_pesos = FIGURAS.obtener("barras_pesos_grupo", df_g_pesos_chart, armar_fig_g_pesos)
                 st.plotly_chart(fig_g_pesos, use_container_width=True)
 
             col_g_p1, col_g_p2 = st.columns(2)
             df_pie_g = tabla_grupo.reset_index()
             with col_g_p1:
                 df_panos_pie = df_pie_g[df_pie_g['📦 EST. CIERRE (FAC+SI)'] > 0]
-                if not df_panos_pie.empty: st.plotly_chart(px.pie(df_panos_pie, values='📦 EST. CIERRE (FAC+SI)', names='Grupo', hole=0.4, title='Distribución de Paños Propios Totales'), use_container_width=True)
+                if not df_panos_pie.empty: st.plotly_chart(FIGURAS.obtener("torta_panos_grupo", df_panos_pie, lambda d: px.pie(d, values='📦 EST. CIERRE (FAC+SI)', names='Grupo', hole=0.4, title='Distribución de Paños Propios Totales')), use_container_width=True)
             with col_g_p2:
                 df_pesos_pie = df_pie_g[df_pie_g['💰 EST. CIERRE (FAC+SI)'] > 0]
-                if not df_pesos_pie.empty: st.plotly_chart(px.pie(df_pesos_pie, values='💰 EST. CIERRE (FAC+SI)', names='Grupo', hole=0.4, title='Distribución de Ingresos Propios Totales ($)'), use_container_width=True)
+                if not df_pesos_pie.empty: st.plotly_chart(FIGURAS.obtener("torta_pesos_grupo", df_pesos_pie, lambda d: px.pie(d, values='💰 EST. CIERRE (FAC+SI)', names='Grupo', hole=0.4, title='Distribución de Ingresos Propios Totales ($)')), use_container_width=True)
             
             st.dataframe(tabla_grupo.style.format(dict_formato_tablas), use_container_width=True)
 
@@ -1614,22 +1739,28 @@ with tab_fac:
 
             col_a_g1, col_a_g2 = st.columns(2)
             with col_a_g1:
-                fig_a_panos = px.bar(df_a_panos_chart, x='Asesor', y='Paños', color='Métrica', barmode='group', text_auto='.1f', title='📦 Paños Propios por Asesor', color_discrete_map=colores_grafico)
-                fig_a_panos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                def armar_fig_a_panos(d):
+                    fig_a_panos = px.bar(d, x='Asesor', y='Paños', color='Métrica', barmode='group', text_auto='.1f', title='📦 Paños Propios por Asesor', color_discrete_map=colores_grafico)
+                    fig_a_panos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                    return fig_a_panos
+                fig_a_panos = FIGURAS.obtener("barras_panos_asesor", df_a_panos_chart, armar_fig_a_panos)
                 st.plotly_chart(fig_a_panos, use_container_width=True)
             with col_a_g2:
-                fig_a_pesos = px.bar(df_a_pesos_chart, x='Asesor', y='Precio', color='Métrica', barmode='group', text_auto='$.2s', title='💰 Montos Propios por Asesor', color_discrete_map=colores_grafico)
-                fig_a_pesos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                def armar_fig_a_pesos(d):
+                    fig_a_pesos = px.bar(d, x='Asesor', y='Precio', color='Métrica', barmode='group', text_auto='$.2s', title='💰 Montos Propios por Asesor', color_discrete_map=colores_grafico)
+                    fig_a_pesos.update_layout(legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), legend_title_text='')
+                    return fig_a_pesos
+                fig_a_pesos = FIGURAS.obtener("barras_pesos_asesor", df_a_pesos_chart, armar_fig_a_pesos)
                 st.plotly_chart(fig_a_pesos, use_container_width=True)
 
             col_a_p1, col_a_p2 = st.columns(2)
             df_pie_a = tabla_asesor.reset_index()
             with col_a_p1:
                 df_panos_pie_a = df_pie_a[df_pie_a['📦 EST. CIERRE (FAC+SI)'] > 0]
-                if not df_panos_pie_a.empty: st.plotly_chart(px.pie(df_panos_pie_a, values='📦 EST. CIERRE (FAC+SI)', names='Asesor', hole=0.4, title='Distribución de Paños Propios Totales'), use_container_width=True)
+                if not df_panos_pie_a.empty: st.plotly_chart(FIGURAS.obtener("torta_panos_asesor", df_panos_pie_a, lambda d: px.pie(d, values='📦 EST. CIERRE (FAC+SI)', names='Asesor', hole=0.4, title='Distribución de Paños Propios Totales')), use_container_width=True)
             with col_a_p2:
                 df_pesos_pie_a = df_pie_a[df_pie_a['💰 EST. CIERRE (FAC+SI)'] > 0]
-                if not df_pesos_pie_a.empty: st.plotly_chart(px.pie(df_pesos_pie_a, values='💰 EST. CIERRE (FAC+SI)', names='Asesor', hole=0.4, title='Distribución de Ingresos Propios Totales ($)'), use_container_width=True)
+                if not df_pesos_pie_a.empty: st.plotly_chart(FIGURAS.obtener("torta_pesos_asesor", df_pesos_pie_a, lambda d: px.pie(d, values='💰 EST. CIERRE (FAC+SI)', names='Asesor', hole=0.4, title='Distribución de Ingresos Propios Totales ($)')), use_container_width=True)
 
             st.dataframe(tabla_asesor.style.format(dict_formato_tablas), use_container_width=True)
 
@@ -1642,25 +1773,16 @@ with tab_fac:
                 df_cierre = df_propios[df_propios['Estado_Resumen'].isin(['Facturado (FAC)', 'Aprobado (SI)'])]
                 if not df_cierre.empty:
                     res_empresa_pie = df_cierre.groupby('Cliente')[['Precio']].sum().reset_index()
-                    st.plotly_chart(px.pie(res_empresa_pie, values='Precio', names='Cliente', hole=0.4, title="Participación en el Cierre Estimado ($) - Propios"), use_container_width=True)
+                    st.plotly_chart(FIGURAS.obtener("torta_cierre_empresa", res_empresa_pie, lambda d: px.pie(d, values='Precio', names='Cliente', hole=0.4, title="Participación en el Cierre Estimado ($) - Propios")), use_container_width=True)
 
         # --- MÓDULO DE AUDITORÍA ---
         st.divider()
         st.markdown("### 🚨 Auditoría de Carga (Detectores de Errores)")
         st.write("Vehículos que requieren corrección manual en el Google Sheets por datos faltantes o mal cargados.")
         
-        errores_precio = df[(df['Estado_Fac'].isin(['FAC', 'SI'])) & (df['Precio'] == 0)]
-        errores_panos = df[(~df['Estado_Taller'].str.contains("ENTREGADO", na=False)) & (df['Paños'] == 0)]
-
-        alertas = []
-        for _, row in errores_precio.iterrows():
-            alertas.append({"Dominio": row['Patente'], "Error": "💰 Falta Precio (o tiene letras)", "Grupo": row['Grupo'], "Asesor": row['Asesor']})
-        
-        for _, row in errores_panos.iterrows():
-            alertas.append({"Dominio": row['Patente'], "Error": "📦 Faltan Paños (o tiene letras)", "Grupo": row['Grupo'], "Asesor": row['Asesor']})
+        df_alertas = auditar_maestro(df)
             
-        if alertas:
-            df_alertas = pd.DataFrame(alertas)
+        if not df_alertas.empty:
             st.error(f"⚠️ Se detectaron {len(df_alertas)} errores de carga en la planilla.")
             
             st.dataframe(
@@ -1671,16 +1793,18 @@ with tab_fac:
                     "Dominio": st.column_config.TextColumn("Patente", width="small"),
                     "Error": st.column_config.TextColumn("Tipo de Error", width="large"),
                     "Grupo": st.column_config.TextColumn("Sector"),
-                    "Asesor": st.column_config.TextColumn("Responsable")
+                    "Asesor": st.column_config.TextColumn("Responsable"),
+                    "Fila": st.column_config.NumberColumn("Fila", format="%d"),
+                    "Celda": st.column_config.TextColumn("Celda a corregir", width="small")
                 }
             )
         else:
-            st.success("✅ ¡Planilla impecable! No se detectaron errores de carga de datos de paños o precios.")
+            st.success("✅ ¡Planilla impecable! No se detectaron errores de carga en la planilla.")
             
 # ==========================================
 # PESTAÑA 5: KPIs
 # ==========================================
-with tab_kpi:
+if SECCION_ACTIVA == SECCIONES[4]:
     if not df.empty:
         st.subheader("📊 Panel de Control y KPIs del Taller")
         
@@ -1696,16 +1820,18 @@ with tab_kpi:
             with c_ref3:
                 st.caption("Todo lo que se venda por debajo de este promedio indica pérdida de rentabilidad frente al acuerdo. Lo que esté por encima es ganancia extra o venta de mayor margen.")
 
-        # Filtramos autos válidos (que tengan precio y paños para no dividir por cero)
-        df_kpi = df[(df['Precio'] > 0) & (df['Paños'] > 0)].copy()
+        # Autos válidos (con precio y paños para no dividir por cero), agrupados en el espejo SQLite
+        kpi_asesor = kpi_por(df_completo, 'Asesor', mes_filtro, termino_busqueda)
+        kpi_grupo = kpi_por(df_completo, 'Grupo', mes_filtro, termino_busqueda)
+        autos_kpi = int(kpi_grupo['Autos'].sum())
         
-        if not df_kpi.empty:
+        if autos_kpi > 0:
             
             # --- TARJETAS GLOBALES ---
             st.markdown("### 📈 Indicadores Globales del Período")
-            ticket_promedio_global = df_kpi['Precio'].sum() / len(df_kpi)
-            intensidad_global = df_kpi['Paños'].sum() / len(df_kpi)
-            precio_prom_pano_global = df_kpi['Precio'].sum() / df_kpi['Paños'].sum()
+            ticket_promedio_global = kpi_grupo['Facturación_Total'].sum() / autos_kpi
+            intensidad_global = kpi_grupo['Paños_Totales'].sum() / autos_kpi
+            precio_prom_pano_global = kpi_grupo['Facturación_Total'].sum() / kpi_grupo['Paños_Totales'].sum()
             brecha_global = precio_prom_pano_global - valor_ref_neto
 
             c_g1, c_g2, c_g3, c_g4 = st.columns(4)
@@ -1716,7 +1842,7 @@ with tab_kpi:
             c_g1.markdown(f'<div class="metric-card"><div class="metric-title">Precio Prom. Real x Paño</div><div class="metric-value-money">{formato_pesos(precio_prom_pano_global)}</div><div style="color:{color_brecha}; font-weight:bold; font-size:0.9rem; margin-top:5px;">{signo_brecha}{formato_pesos(brecha_global)} vs Seguro</div></div>', unsafe_allow_html=True)
             c_g2.markdown(f'<div class="metric-card"><div class="metric-title">Ticket Promedio ($/Auto)</div><div class="metric-value-money" style="color:#00235d;">{formato_pesos(ticket_promedio_global)}</div></div>', unsafe_allow_html=True)
             c_g3.markdown(f'<div class="metric-card"><div class="metric-title">Intensidad (Paños/Auto)</div><div class="metric-value-number" style="color:#17a2b8;">{intensidad_global:.2f}</div></div>', unsafe_allow_html=True)
-            c_g4.markdown(f'<div class="metric-card"><div class="metric-title">Volumen (Autos Computados)</div><div class="metric-value-number" style="color:#6c757d;">{len(df_kpi)}</div></div>', unsafe_allow_html=True)
+            c_g4.markdown(f'<div class="metric-card"><div class="metric-title">Volumen (Autos Computados)</div><div class="metric-value-number" style="color:#6c757d;">{autos_kpi}</div></div>', unsafe_allow_html=True)
 
             st.markdown("<br>", unsafe_allow_html=True)
             
@@ -1730,20 +1856,10 @@ with tab_kpi:
 
             # --- TABLAS POR GRUPO Y ASESOR ---
             # KPI POR ASESOR
-            kpi_asesor = df_kpi.groupby('Asesor').agg(
-                Autos=('Patente', 'count'),
-                Paños_Totales=('Paños', 'sum'),
-                Facturación_Total=('Precio', 'sum')
-            ).reset_index()
             kpi_asesor['Precio_Promedio_Paño'] = kpi_asesor['Facturación_Total'] / kpi_asesor['Paños_Totales']
             kpi_asesor['Brecha'] = (kpi_asesor['Precio_Promedio_Paño'] - valor_ref_neto).apply(formato_alerta)
             
             # KPI POR GRUPO
-            kpi_grupo = df_kpi.groupby('Grupo').agg(
-                Autos=('Patente', 'count'),
-                Paños_Totales=('Paños', 'sum'),
-                Facturación_Total=('Precio', 'sum')
-            ).reset_index()
             kpi_grupo['Precio_Promedio_Paño'] = kpi_grupo['Facturación_Total'] / kpi_grupo['Paños_Totales']
             kpi_grupo['Brecha'] = (kpi_grupo['Precio_Promedio_Paño'] - valor_ref_neto).apply(formato_alerta)
 
@@ -1786,44 +1902,109 @@ with tab_kpi:
                 with st.container(border=True):
                     # Gráfico de Intensidad por Grupo
                     kpi_grupo['Intensidad'] = kpi_grupo['Paños_Totales'] / kpi_grupo['Autos']
-                    fig_intensidad = px.bar(
-                        kpi_grupo, x='Grupo', y='Intensidad', 
-                        text_auto='.2f', title='📦 Intensidad del Daño (Paños por Auto)',
-                        color_discrete_sequence=['#17a2b8']
-                    )
-                    fig_intensidad.update_layout(xaxis_title="", yaxis_title="Promedio de Paños")
+                    def armar_fig_intensidad(d):
+                        fig_intensidad = px.bar(
+                            d, x='Grupo', y='Intensidad', 
+                            text_auto='.2f', title='📦 Intensidad del Daño (Paños por Auto)',
+                            color_discrete_sequence=['#17a2b8']
+                        )
+                        fig_intensidad.update_layout(xaxis_title="", yaxis_title="Promedio de Paños")
+                        return fig_intensidad
+                    fig_intensidad = FIGURAS.obtener("kpi_intensidad", kpi_grupo[['Grupo', 'Intensidad']], armar_fig_intensidad)
                     st.plotly_chart(fig_intensidad, use_container_width=True)
 
             with c_graf2:
                 with st.container(border=True):
                     # Gráfico de Ticket Promedio por Asesor
                     kpi_asesor['Ticket_Promedio'] = kpi_asesor['Facturación_Total'] / kpi_asesor['Autos']
-                    fig_ticket = px.bar(
-                        kpi_asesor, x='Asesor', y='Ticket_Promedio', 
-                        text_auto='$.3s', title='💰 Ticket Promedio de Venta ($ por Auto)',
-                        color_discrete_sequence=['#28a745']
-                    )
-                    fig_ticket.update_layout(xaxis_title="", yaxis_title="Monto Promedio")
+                    def armar_fig_ticket(d):
+                        fig_ticket = px.bar(
+                            d, x='Asesor', y='Ticket_Promedio', 
+                            text_auto='$.3s', title='💰 Ticket Promedio de Venta ($ por Auto)',
+                            color_discrete_sequence=['#28a745']
+                        )
+                        fig_ticket.update_layout(xaxis_title="", yaxis_title="Monto Promedio")
+                        return fig_ticket
+                    fig_ticket = FIGURAS.obtener("kpi_ticket", kpi_asesor[['Asesor', 'Ticket_Promedio']], armar_fig_ticket)
                     st.plotly_chart(fig_ticket, use_container_width=True)
 
         else:
             st.warning("No hay suficientes datos válidos (con paños y precios mayores a cero) para calcular los KPIs de rendimiento.")
-            
+
+    # --- CONVERSIÓN DE TURNOS (ÍNDICE TURNOS ↔ TALLER) ---
+    vinculos_vista = VINCULOS['turnos'].loc[df_turnos_display.index]
+    if mes_filtro != "TODOS": vinculos_vista = vinculos_vista[vinculos_vista['Fecha'].dt.strftime('%Y-%m') == mes_filtro]
+    if not vinculos_vista.empty:
+        with st.container(border=True):
+            st.markdown("#### 🔗 Conversión de Turnos")
+            st.caption("Cada turno se vincula con su ingreso al taller por patente y fecha. La conversión se mide sobre los turnos ya resueltos (ingresaron o no se presentaron).")
+            conversion_asesor = metricas_turnos(vinculos_vista, 'Asesor')
+            total = conversion_asesor[['Turnos', 'Cancelados', 'Pendientes', 'No_Show', 'Ingresados']].sum()
+            resueltos_total = total['Ingresados'] + total['No_Show']
+            c_conv1, c_conv2, c_conv3, c_conv4 = st.columns(4)
+            c_conv1.metric("Turnos", int(total['Turnos']), f"{int(total['Cancelados'])} cancelados", delta_color="off")
+            c_conv2.metric("Conversión", f"{total['Ingresados'] / resueltos_total:.0%}" if resueltos_total else "-", f"{int(total['Pendientes'])} por llegar", delta_color="off")
+            c_conv3.metric("No-Show", f"{total['No_Show'] / resueltos_total:.0%}" if resueltos_total else "-", f"{int(total['No_Show'])} turnos", delta_color="off")
+            dias_ingreso = vinculos_vista['Dias_Hasta_Ingreso'].mean()
+            c_conv4.metric("Turno → Ingreso", f"{dias_ingreso:.1f} días" if pd.notna(dias_ingreso) else "-")
+            st.dataframe(conversion_asesor, hide_index=True, use_container_width=True, column_config={
+                "No_Show": st.column_config.NumberColumn("No-Show"), "Conversion": st.column_config.ProgressColumn("Conversión", format="percent", min_value=0, max_value=1),
+                "Tasa_No_Show": st.column_config.NumberColumn("% No-Show", format="percent"), "Dias_Hasta_Ingreso": st.column_config.NumberColumn("Días Turno → Ingreso", format="%.1f")})
+
+    # --- CICLO DE VIDA (HISTORIAL DIARIO DE ESTADOS) ---
+    with st.container(border=True):
+        st.markdown("#### ⏳ Ciclo de Vida en el Taller")
+        if PUNTERO_HISTORIAL is None or PUNTERO_HISTORIAL['primer_dia'] == PUNTERO_HISTORIAL['ultimo_dia']:
+            st.info("El historial diario de estados arrancó hoy: los tiempos por fase, las entregas por semana y el lead time aparecen a partir del segundo día registrado.")
+        else:
+            with medir("analisis_historial"): ciclo = analisis_historial(PUNTERO_HISTORIAL['ultimo_dia'], PUNTERO_HISTORIAL['actualizado'], hoy.date())
+            st.caption(f"{ciclo['dias']} días registrados desde el {datetime.fromisoformat(PUNTERO_HISTORIAL['primer_dia']).strftime('%d/%m/%Y')} · {ciclo['vehiculos']} vehículos. Es global: no aplica el filtro mensual. Los tramos que ya estaban abiertos el primer día no se cuentan.")
+            fases_ciclo = ciclo['fases'].replace({'Fase_Taller': {"": "(Sin fase)"}})
+            c_ciclo1, c_ciclo2 = st.columns(2)
+            with c_ciclo1:
+                st.plotly_chart(FIGURAS.obtener("ciclo_fases", fases_ciclo[['Fase_Taller', 'Dias_Promedio', 'Dias_P90']], lambda d: px.bar(
+                    d, x='Fase_Taller', y=['Dias_Promedio', 'Dias_P90'], barmode='group', title='🧭 Días por Fase (promedio y P90)', labels={'value': 'Días', 'Fase_Taller': '', 'variable': ''})), use_container_width=True)
+            with c_ciclo2:
+                st.plotly_chart(FIGURAS.obtener("ciclo_entregas", ciclo['rendimiento'], lambda d: px.line(
+                    d, x='Semana', y='Autos', color='Grupo', markers=True, title='🚚 Entregas por Semana y Grupo', labels={'Semana': '', 'Autos': 'Autos entregados'})), use_container_width=True)
+            c_ciclo3, c_ciclo4 = st.columns(2)
+            with c_ciclo3:
+                st.write("**Lead time (Ingreso → Entrega)**")
+                st.dataframe(ciclo['lead_time'], hide_index=True, use_container_width=True, column_config={
+                    "Dias_Promedio": st.column_config.NumberColumn("Días Prom.", format="%.1f"), "Dias_Mediana": st.column_config.NumberColumn("Mediana", format="%.0f"), "Dias_P90": st.column_config.NumberColumn("P90", format="%.0f")})
+            with c_ciclo4:
+                st.write("**Permanencia por Estado**")
+                st.dataframe(ciclo['estados'], hide_index=True, use_container_width=True, column_config={
+                    "Dias_Promedio": st.column_config.NumberColumn("Días Prom.", format="%.1f"), "Dias_Mediana": st.column_config.NumberColumn("Mediana", format="%.0f"), "Dias_P90": st.column_config.NumberColumn("P90", format="%.0f"),
+                    "Abiertos": st.column_config.NumberColumn("Hoy en el estado"), "Dias_Abiertos_Promedio": st.column_config.NumberColumn("Días (hoy) Prom.", format="%.1f")})
+
 # ==========================================
 # PESTAÑA 6: HISTÓRICOS
 # ==========================================
-with tab_hist:
+if SECCION_ACTIVA == SECCIONES[5]:
     if not df_completo.empty: 
         st.subheader("📅 Histórico Mensual")
-        df_hist = df_completo[df_completo['Mes_Hist'] != 'SIN FECHA'].sort_values('Mes_Hist')
-        if not df_hist.empty:
+        df_hist_agg = obtener_agregados_historicos(df_completo, VERSION_MAESTRO, hoy_ym)
+        if not df_hist_agg.empty:
             c_h1, c_h2 = st.columns(2)
             with c_h1:
-                pivot_panos = pd.pivot_table(df_hist, values='Paños', index='Mes_Hist', columns='Cliente', aggfunc='sum', fill_value=0)
+                pivot_panos = df_hist_agg.pivot_table(values='Paños', index='Mes_Hist', columns='Cliente', aggfunc='sum', fill_value=0)
                 st.dataframe(pivot_panos.style.format("{:.1f}"), use_container_width=True)
             with c_h2:
-                pivot_pesos = pd.pivot_table(df_hist, values='Precio', index='Mes_Hist', columns='Cliente', aggfunc='sum', fill_value=0)
+                pivot_pesos = df_hist_agg.pivot_table(values='Precio', index='Mes_Hist', columns='Cliente', aggfunc='sum', fill_value=0)
                 st.dataframe(pivot_pesos.style.format(lambda x: f"$ {x:,.0f}".replace(',', '.')), use_container_width=True)
             st.divider()
-            st.plotly_chart(px.bar(df_hist, x="Mes_Hist", y="Paños", color="Cliente", barmode="group", title="Paños Facturados/Proyectados por Mes"), use_container_width=True)
+            st.plotly_chart(FIGURAS.obtener("historico_mensual", df_hist_agg, lambda d: px.bar(d, x="Mes_Hist", y="Paños", color="Cliente", barmode="group", title="Paños Facturados/Proyectados por Mes")), use_container_width=True)
         else: st.info("No hay datos con fechas válidas para mostrar el historial.")
+
+# --- TIEMPO DE CÓMPUTO DE LA SECCIÓN Y VOLCADO DE LA MEDICIÓN ---
+pila_seccion.close()
+ms_seccion = MEDICION.etapas[-1]['ms']
+total_rerun = MEDICION.volcar(RUTA_LOG_RENDIMIENTO, SECCION_ACTIVA)
+st.session_state.ultima_medicion = (SECCION_ACTIVA, MEDICION.etapas + [total_rerun], dict(MEDICION.llamadas_api))
+log_taller.info("Sección %s calculada en %.1f ms (rerun %.1f ms, %d llamadas a Sheets)", SECCION_ACTIVA, ms_seccion, total_rerun['ms'], total_rerun['llamadas_api'])
+
+if PERFIL_RERUN is not None:
+    st.session_state.pop('perfil_activo', None)
+    log_taller.info("Perfil guardado: %s", guardar_perfil(PERFIL_RERUN, RUTA_PERFILES, SECCION_ACTIVA))
+    st.session_state.perfiles_pendientes -= 1
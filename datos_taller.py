@@ -0,0 +1,1560 @@
+"""Pipeline de datos del taller sin Streamlit: descarga de la planilla, normalización y agregados.
+
+app.py lo envuelve con st.cache_data; también se puede correr solo (cron, benchmarks):
+
+    python datos_taller.py kpis --mes 2026-03
+    python datos_taller.py snapshot [--arrow]
+    python datos_taller.py importtime --presupuesto-ms 1500
+    python datos_taller.py bench-csv --filas 10000 100000
+    python datos_taller.py bench-diff --filas 1000 5000 20000
+    python datos_taller.py historial [--dia 2026-03-31]
+    python datos_taller.py aceptar-layout [--pestana "GRUPO UNO"]
+    python datos_taller.py bench-historial --vehiculos 4000 --dias 365
+    python datos_taller.py bench-sesiones --sesiones 20 --filas 5000
+
+Las pruebas están en tests/ (python -m pytest tests).
+"""
+import argparse
+import ast
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, Counter
+from contextlib import closing, contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+log_taller = logging.getLogger("taller")
+
+# --- CONFIGURACIÓN DE GIDS Y VARIABLES ---
+ID_NUEVO_SHEET = "1yoJk6hD6YianjGHUofs7q-RvEBJOZg51tFMZx-GVxNg"
+URL_BASE = f"https://docs.google.com/spreadsheets/d/{ID_NUEVO_SHEET}/export?format=csv&gid="
+GID_TURNOS = "109364752" 
+
+GIDS = {"GRUPO UNO": "609774337", "GRUPO DOS": "1212138688", "GRUPO TRES": "527300176", "TERCEROS": "431495457", "PARABRISAS": "37356499"}
+MESES_ES = {'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8, 'septiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12}
+ASESORES_LISTA = ["SIN ASIGNAR", "CESAR OLIVA", "JAVIER GUTIERREZ", "ANDREA MARTINS"]
+
+# --- ALMACENAMIENTO LOCAL ---
+RUTA_DATOS_LOCALES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos_locales")
+RUTA_DB_HISTORICOS = os.path.join(RUTA_DATOS_LOCALES, "historicos.sqlite")
+RUTA_DB_ESPEJO = os.path.join(RUTA_DATOS_LOCALES, "espejo_taller.sqlite")
+RUTA_LAYOUTS = os.path.join(RUTA_DATOS_LOCALES, "layouts_hojas.json")
+RUTA_SNAPSHOTS = os.path.join(RUTA_DATOS_LOCALES, "snapshots")
+RUTA_SNAPSHOTS_ARROW = os.path.join(RUTA_DATOS_LOCALES, "arrow")
+RUTA_NOTAS_PORTAL = os.path.join(RUTA_DATOS_LOCALES, "portal_empresas.sqlite")
+RUTA_HISTORIAL_ESTADOS = os.path.join(RUTA_DATOS_LOCALES, "historial_estados")
+RUTA_LIBRO_ENTREGAS = os.path.join(RUTA_DATOS_LOCALES, "entregas_confirmadas.jsonl")
+
+# --- INSTRUMENTACIÓN DE RENDIMIENTO ---
+# Cada rerun (o corrida del CLI) arma una MedicionRerun con sus etapas (ms, delta de RSS, llamadas a Sheets).
+# El contexto es por hilo: cada sesión de Streamlit corre su script en su propio hilo.
+MAX_BYTES_LOG_RENDIMIENTO = 5 * 2**20
+
+def memoria_rss_mb():
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError): return 0.0
+
+class MedicionRerun:
+    def __init__(self):
+        self.etapas = []
+        self.llamadas_api = Counter()
+        self.inicio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nombre):
+        llamadas_previas, mem_previa, t0 = sum(self.llamadas_api.values()), memoria_rss_mb(), time.perf_counter()
+        try: yield
+        finally:
+            self.etapas.append({'etapa': nombre, 'ms': round((time.perf_counter() - t0) * 1000, 2),
+                                'mem_mb': round(memoria_rss_mb() - mem_previa, 2), 'llamadas_api': sum(self.llamadas_api.values()) - llamadas_previas})
+
+    def volcar(self, ruta, seccion):
+        total = {'etapa': 'rerun', 'ms': round((time.perf_counter() - self.inicio) * 1000, 2), 'mem_mb': 0.0, 'llamadas_api': sum(self.llamadas_api.values())}
+        marca = datetime.now().isoformat(timespec='seconds')
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            if os.path.exists(ruta) and os.path.getsize(ruta) > MAX_BYTES_LOG_RENDIMIENTO: os.replace(ruta, f"{ruta}.1")
+            with open(ruta, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps({'ts': marca, 'seccion': seccion, **e}, ensure_ascii=False) + "\n" for e in self.etapas + [total]))
+        except OSError as e: log_taller.warning("No se pudo escribir el log de rendimiento: %s", e)
+        return total
+
+_CONTEXTO_MEDICION = threading.local()
+
+def activar_medicion(medicion):
+    _CONTEXTO_MEDICION.actual = medicion
+
+def contar_llamada_api(tipo, cantidad=1):
+    medicion = getattr(_CONTEXTO_MEDICION, 'actual', None)
+    if medicion is not None: medicion.llamadas_api[tipo] += cantidad
+
+@contextmanager
+def medir(nombre):
+    medicion = getattr(_CONTEXTO_MEDICION, 'actual', None)
+    if medicion is None:
+        yield
+        return
+    with medicion.etapa(nombre): yield
+
+# --- FUNCIONES ---
+def parsear_fecha_español(texto):
+    if pd.isna(texto) or str(texto).strip() == "": return None 
+    texto = str(texto).lower().strip()
+    
+    # 1. Buscar formato con letras DD-MMM o DD/MMM (ej: 25-mar o 25/mar)
+    meses_abrev = {'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6,
+                   'jul': 7, 'ago': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dic': 12}
+    
+    match_abrev = re.search(r'(\d{1,2})[-/]([a-z]{3})', texto)
+    if match_abrev:
+        dia = int(match_abrev.groups()[0])
+        mes_str = match_abrev.groups()[1]
+        mes_num = meses_abrev.get(mes_str)
+        if mes_num:
+            return datetime(datetime.now().year, mes_num, dia)
+
+    # 2. Buscar formato normal DD/MM o DD-MM (ej: 25/03)
+    match_dm = re.match(r'^(\d{1,2})[-/](\d{1,2})$', texto)
+    if match_dm: return datetime(datetime.now().year, int(match_dm.groups()[1]), int(match_dm.groups()[0]))
+    
+    # 3. Intentar lectura automática
+    try:
+        res = pd.to_datetime(texto, dayfirst=True)
+        if pd.notna(res): return res.to_pydatetime()
+    except: pass
+    
+    # 4. Formato largo (ej: 25 de marzo de 2026)
+    try:
+        match = re.search(r'(\d+)\s+de\s+([a-z]+)\s+de\s+(\d+)', texto)
+        if match: return datetime(int(match.groups()[2]), MESES_ES.get(match.groups()[1], 1), int(match.groups()[0]))
+    except: pass
+    
+    return None
+
+def huella_frame(df_origen):
+    return hashlib.sha1(pd.util.hash_pandas_object(df_origen, index=False).values.tobytes()).hexdigest()[:12]
+
+def clasificar_abc(panos):
+    if panos <= 3: return 'A (1-3 paños)'
+    elif panos <= 7: return 'B (4-7 paños)'
+    else: return 'C (8+ paños)'
+
+def letra_columna(indice):
+    letra = ""
+    indice += 1
+    while indice > 0:
+        indice, resto = divmod(indice - 1, 26)
+        letra = chr(65 + resto) + letra
+    return letra
+
+# --- FIRMA DE FILAS DE TURNOS ---
+# Firma de los valores normalizados de una fila A..Q: la escritura optimista de app.py la compara antes de escribir.
+COLUMNAS_TURNOS_HOJA = "ABCDEFGHIJKLMNOPQ"
+VALORES_AFIRMATIVOS = ['SI', 'SÍ', 'TRUE', '1', 'X']
+
+def firma_turno(valores):
+    v = [str(x).strip() for x in valores] + [""] * (len(COLUMNAS_TURNOS_HOJA) - len(valores))
+    fecha = parsear_fecha_español(v[1])
+    normalizada = (v[0].upper(), fecha.strftime('%Y-%m-%d') if fecha else "", "".join(v[4].split()).upper(), v[5].upper(), v[8],
+                   v[12], v[13].upper() in VALORES_AFIRMATIVOS, v[14].upper() in VALORES_AFIRMATIVOS, v[15], v[16])
+    return hashlib.sha1(repr(normalizada).encode()).hexdigest()[:12]
+
+# --- ESCRITURA EN TURNOS CON CONTROL OPTIMISTA ---
+# Cada fila leída lleva su número de fila y una firma de sus valores normalizados. Antes de escribir se
+# relee en un solo batch_get lo que hay en esas filas: si la firma no coincide (alguien insertó/borró filas
+# o editó el turno) se ubica la fila por firma en una lectura completa; si no aparece, es un conflicto.
+# Verificar y escribir va bajo candado_turnos: entre las sesiones del proceso (hilos) y entre workers.
+RUTA_CANDADO_TURNOS = os.path.join(RUTA_DATOS_LOCALES, "turnos.lock")
+SEGUNDOS_ESPERA_TURNOS, SEGUNDOS_CANDADO_TURNOS = 60, 120
+_CANDADO_TURNOS_PROCESO = threading.Lock()
+
+@contextmanager
+def candado_turnos(ruta=RUTA_CANDADO_TURNOS):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with _CANDADO_TURNOS_PROCESO, candado_archivo(ruta, SEGUNDOS_ESPERA_TURNOS, SEGUNDOS_CANDADO_TURNOS): yield
+
+def escribir_turnos(hoja_destino, cambios, version_origen="", ruta_candado=RUTA_CANDADO_TURNOS):
+    """Aplica los cambios verificando cada fila; devuelve (aplicados, patentes en conflicto)."""
+    if not cambios: return 0, []
+    with candado_turnos(ruta_candado):
+        return _escribir_turnos_verificado(hoja_destino, cambios, version_origen)
+
+def _escribir_turnos_verificado(hoja_destino, cambios, version_origen):
+    rangos = [f"A{c['fila']}:Q{c['fila']}" for c in cambios]
+    leidas = hoja_destino.batch_get(rangos); contar_llamada_api('gspread')
+    desplazados = [c for c, valores in zip(cambios, leidas) if firma_turno(valores[0] if valores else []) != c['firma']]
+    en_conflicto = set()
+    if desplazados:
+        filas_por_firma = {}
+        contar_llamada_api('gspread')
+        for n, valores in enumerate(hoja_destino.get_values("A2:Q"), start=2):
+            filas_por_firma.setdefault(firma_turno(valores), []).append(n)
+        for c in desplazados:
+            candidatas = filas_por_firma.get(c['firma'], [])
+            if len(candidatas) == 1: c['fila'] = candidatas[0]
+            else: en_conflicto.add(id(c))
+    validos = [c for c in cambios if id(c) not in en_conflicto]
+    conflictos = [c['patente'] for c in cambios if id(c) in en_conflicto]
+    actualizaciones = [{'range': f"{col}{c['fila']}", 'values': [[valor]]} for c in validos if not c['eliminar'] for col, valor in c['celdas'].items()]
+    if actualizaciones: hoja_destino.batch_update(actualizaciones, value_input_option='USER_ENTERED'); contar_llamada_api('gspread')
+    filas_a_borrar = sorted({c['fila'] for c in validos if c['eliminar']}, reverse=True)
+    if filas_a_borrar:
+        contar_llamada_api('gspread')
+        hoja_destino.spreadsheet.batch_update({'requests': [{'deleteDimension': {'range': {'sheetId': hoja_destino.id, 'dimension': 'ROWS', 'startIndex': f - 1, 'endIndex': f}}} for f in filas_a_borrar]})
+    if conflictos: log_taller.warning("Conflicto de escritura en TURNOS (versión %s): %s", version_origen, ", ".join(conflictos))
+    return len(validos), conflictos
+
+# --- DIFERENCIAS DE EDICIÓN (st.data_editor) ---
+# Compara el frame editado contra el original por columnas enteras (no fila por fila) y devuelve sólo las
+# celdas que cambiaron de verdad: los nulos/None cuentan como "" y los números de ticket se comparan sin espacios.
+COMPARACION_TURNOS = {'Fecha': 'fecha', 'Asesor': 'texto', 'Observaciones': 'texto', 'Ticket': 'recortado', 'Referencia': 'recortado',
+                      'Recibido': 'bool', 'Fotos': 'bool', 'Cancelado': 'bool', 'Motivo_Cancelacion': 'texto', 'Eliminar': 'bool'}
+
+def normalizar_para_comparar(serie, tipo):
+    if tipo == 'fecha': return pd.to_datetime(serie, errors='coerce')
+    if tipo == 'bool': return serie.fillna(False).astype(bool)
+    texto = serie.astype(object).where(serie.notna(), "").astype(str)
+    return texto.str.strip() if tipo == 'recortado' else texto
+
+def diferenciar_ediciones(original, editado, comparacion):
+    """Changeset (idx, columna, anterior, nuevo) de las celdas distintas entre editado y original, alineados por índice."""
+    columnas = [c for c in comparacion if c in editado.columns and c in original.columns]
+    if editado.empty or not columnas: return pd.DataFrame(columns=['idx', 'columna', 'anterior', 'nuevo'])
+    base = original.loc[editado.index, columnas]
+    distintas = np.column_stack([
+        ~(a.eq(b) | (a.isna() & b.isna())).to_numpy(dtype=bool)
+        for a, b in ((normalizar_para_comparar(base[c], comparacion[c]), normalizar_para_comparar(editado[c], comparacion[c])) for c in columnas)])
+    filas, cols = np.nonzero(distintas)
+    return pd.DataFrame({'idx': editado.index[filas], 'columna': np.asarray(columnas, dtype=object)[cols],
+                         'anterior': base.to_numpy(dtype=object)[filas, cols], 'nuevo': editado[columnas].to_numpy(dtype=object)[filas, cols]})
+
+# --- DESCARGA CONDICIONAL DE PESTAÑAS ---
+# Por URL se guardan los validadores de la última respuesta (ETag, Last-Modified) y el sha1 del cuerpo.
+# Si el servidor contesta 304, o 200 con el mismo cuerpo (la exportación de Sheets no siempre manda
+# validadores), la pestaña no cambió y se reutiliza lo ya parseado y normalizado.
+_VALIDADORES_CSV = {}
+CONTADORES_DESCARGA = Counter()
+
+def descargar_csv(url, timeout=30):
+    """Devuelve (cuerpo, huella). Ante un 304 el cuerpo es el de la descarga anterior."""
+    previo = _VALIDADORES_CSV.get(url, {})
+    encabezados = {'If-None-Match': previo.get('etag'), 'If-Modified-Since': previo.get('modificado')}
+    pedido = urllib.request.Request(url, headers={k: v for k, v in encabezados.items() if v})
+    contar_llamada_api('csv')
+    try:
+        with urllib.request.urlopen(pedido, timeout=timeout) as respuesta:
+            cuerpo = respuesta.read()
+            etag, modificado = respuesta.headers.get('ETag'), respuesta.headers.get('Last-Modified')
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or 'cuerpo' not in previo: raise
+        CONTADORES_DESCARGA['no_modificadas'] += 1
+        return previo['cuerpo'], previo['huella']
+    CONTADORES_DESCARGA['bytes'] += len(cuerpo)
+    huella = hashlib.sha1(cuerpo).hexdigest()[:12]
+    _VALIDADORES_CSV[url] = {'etag': etag, 'modificado': modificado, 'huella': huella, 'cuerpo': cuerpo}
+    if huella == previo.get('huella'): CONTADORES_DESCARGA['cuerpo_igual'] += 1
+    return cuerpo, huella
+
+# --- PARSEO DE CSV (PYARROW) ---
+# pyarrow.csv con todas las columnas como texto (sin inferencia: "007" sigue siendo "007") y los mismos
+# nulos que pandas, así el resultado es igual al de read_csv(dtype=str) pero multihilo y sin pasar por objetos
+# de Python. Las columnas quedan como str de pandas, que ya está respaldado por Arrow.
+NULOS_CSV = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+MAX_COLUMNAS_CSV = 512
+
+def nombres_cabecera_pandas(cabecera):
+    # Igual que read_csv: celdas vacías -> "Unnamed: i", repetidas -> "X.1", "X.2"...
+    nombres, usados = [], set()
+    for i, c in enumerate(cabecera):
+        base = c if isinstance(c, str) else f"Unnamed: {i}"
+        nombre, k = base, 0
+        while nombre in usados: k += 1; nombre = f"{base}.{k}"
+        usados.add(nombre); nombres.append(nombre)
+    return nombres
+
+def leer_csv(cuerpo, encabezado=True, motor='pyarrow'):
+    if motor == 'pandas': return pd.read_csv(io.BytesIO(cuerpo), dtype=str, header=0 if encabezado else None)
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    try:
+        tabla = pa_csv.read_csv(pa.BufferReader(cuerpo), read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+                                parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                                convert_options=pa_csv.ConvertOptions(column_types={f"f{i}": pa.string() for i in range(MAX_COLUMNAS_CSV)},
+                                                                      null_values=NULOS_CSV, strings_can_be_null=True))
+    except pa.ArrowInvalid:
+        # Filas de largo desparejo o CSV vacío: el parser de pandas los tolera (o da el error de siempre)
+        return leer_csv(cuerpo, encabezado, 'pandas')
+    d = tabla.to_pandas()
+    d.columns = range(len(d.columns))
+    if not encabezado: return d
+    cabecera = d.iloc[0].tolist() if len(d) else [None] * len(d.columns)
+    d = d.iloc[1:].reset_index(drop=True)
+    d.columns = nombres_cabecera_pandas(cabecera)
+    return d
+
+# Último frame parseado/normalizado por pestaña; la clave incluye el día porque las fechas sin año
+# y los vencimientos por defecto dependen de hoy
+_TURNOS_NORMALIZADOS = {}
+_PESTANAS_PARSEADAS = {}
+_PESTANAS_NORMALIZADAS = {}
+
+# --- CARGA DE TURNOS ---
+def cargar_turnos():
+    columnas_base = ['Tipo', 'Fecha', 'Hora', 'Vehiculo', 'Patente', 'Asesor', 'Precio', 'Paños', 'Observaciones', 'Tiempo_Entrega', 'Cliente', 'Seguro', 'Ticket', 'Recibido', 'Fotos', 'Referencia', 'Cancelado', 'Motivo_Cancelacion', 'Eliminar', 'Fila_Hoja', 'Firma_Fila']
+    if GID_TURNOS == "PONER_AQUI_GID_TURNOS": return pd.DataFrame(columns=columnas_base)
+    try:
+        with medir("csv:TURNOS"):
+            cuerpo, huella = descargar_csv(f"{URL_BASE}{GID_TURNOS}")
+        clave = (huella, datetime.now().date())
+        if clave in _TURNOS_NORMALIZADOS:
+            CONTADORES_DESCARGA['parseos_omitidos'] += 1
+            return _TURNOS_NORMALIZADOS[clave].copy(deep=False)
+        d = leer_csv(cuerpo)
+        d.columns = d.columns.str.strip().str.upper()
+        d['FIRMA_FILA'] = [firma_turno(valores) for valores in d.iloc[:, :len(COLUMNAS_TURNOS_HOJA)].fillna('').to_numpy().tolist()]
+        d['FILA_HOJA'] = np.arange(len(d)) + 2  # Fila 1 = encabezados
+        if 'PATENTE' in d.columns: d = d.dropna(subset=['PATENTE']); d = d[d['PATENTE'].str.strip() != ""]
+        filas = []
+        
+        col_recibido = next((c for c in d.columns if 'RECIBID' in c), None)
+        col_fotos = next((c for c in d.columns if 'FOTO' in c), None)
+        col_turno = next((c for c in d.columns if 'TURNO' in c), 'TURNO')
+        
+        # Identificar la columna Q (Motivo). Puede que no tenga header
+        col_motivo = next((c for c in d.columns if 'MOTIVO' in c or 'CANCELACION' in c), None)
+        if not col_motivo and len(d.columns) >= 17:
+            col_motivo = d.columns[16] # 0-indexed, 16 es la Q
+            
+        for _, row in d.iterrows():
+            col_fecha = next((c for c in d.columns if 'FECH' in c), None)
+            fecha_turno = parsear_fecha_español(row.get(col_fecha, '')) or datetime.now()
+            asesor_raw = str(row.get('ASESOR', 'SIN ASIGNAR')).strip().upper()
+            if asesor_raw not in ASESORES_LISTA: asesor_raw = "SIN ASIGNAR"
+            col_tiempo = next((c for c in d.columns if 'TIEMPO' in c), None)
+            
+            val_recibido = str(row.get(col_recibido, '')).strip().upper() if col_recibido else ""
+            bool_recibido = val_recibido in ['SI', 'SÍ', 'TRUE', '1', 'X']
+            
+            val_fotos = str(row.get(col_fotos, '')).strip().upper() if col_fotos else ""
+            bool_fotos = val_fotos in ['SI', 'SÍ', 'TRUE', '1', 'X']
+            
+            val_ticket = str(row.get('N° TICKET', '')).strip()
+            if val_ticket == 'nan': val_ticket = ""
+            val_referencia = str(row.get('N° REFERENCIA', '')).strip()
+            if val_referencia == 'nan': val_referencia = ""
+            
+            val_motivo_str = str(row.get(col_motivo, '')).replace('nan', '').strip() if col_motivo else ""
+            
+            val_turno_str = str(row.get(col_turno, '')).strip().upper()
+            
+            # Lógica de estados en columna A (Reconoce 'C' o 'CANCELADO')
+            es_cancelado = val_turno_str in ["CANCELADO", "C"]
+            if val_turno_str == "N" or val_turno_str == "NO":
+                tipo_turno = '🚶‍♂️ SIN TURNO'
+            else:
+                tipo_turno = '📅 PROGRAMADO'
+            
+            filas.append({
+                'Tipo': tipo_turno, 'Fecha': fecha_turno.date(), 'Hora': str(row.get('HORA TURNO', row.get('HORAS', ''))).strip(),
+                'Vehiculo': str(row.get('VEHICULO', '')).upper(), 'Patente': str(row.get('PATENTE', '')).upper(),
+                'Asesor': asesor_raw, 'Precio': str(row.get('PRECIO', '')).strip(), 'Paños': str(row.get('PAÑOS', '')).strip(),
+                'Observaciones': str(row.get('OBSERVACIONES', '')).strip(), 'Tiempo_Entrega': str(row.get(col_tiempo, '')) if col_tiempo else "",
+                'Cliente': str(row.get('CLIENTE', '')).upper(), 'Seguro': str(row.get('SEGURO', '')).upper(),
+                'Ticket': val_ticket, 'Referencia': val_referencia,
+                'Recibido': bool_recibido, 'Fotos': bool_fotos, 
+                'Cancelado': es_cancelado, 'Motivo_Cancelacion': val_motivo_str, 'Eliminar': False,
+                'Fila_Hoja': int(row['FILA_HOJA']), 'Firma_Fila': row['FIRMA_FILA']
+            })
+        df_turnos = pd.DataFrame(filas)
+        df_turnos.attrs['version'] = huella_frame(df_turnos)
+        _TURNOS_NORMALIZADOS.clear(); _TURNOS_NORMALIZADOS[clave] = df_turnos
+        return df_turnos.copy(deep=False)
+    except: return pd.DataFrame(columns=columnas_base)
+
+# --- COMPILADOR DE LAYOUT DE PESTAÑAS ---
+GRUPOS_POSICIONALES = ["GRUPO UNO", "GRUPO DOS", "GRUPO TRES"]
+PATRON_CABECERA = 'ESTADO|DOMINIO|PATENTE|CLIENTE|COMPAÑIA|PRECIO|MANO DE OBRA'
+
+# Los GRUPO tienen columnas fijas por posición (0-indexed)
+COLUMNAS_FIJAS_GRUPO = {0: 'FECHA_INGRESO_TALLER', 6: 'DIAS_TRABAJO', 7: 'FECHA_TICKET', 8: 'FECHA_PROMESA_I', 9: 'HORA_ENTREGA', 11: 'OBSERVACIONES_TALLER', 15: 'EMPRESA_TALLER', 19: 'ESTADO_TALLER', 20: 'FASE_TALLER', 21: 'ESTADO_FAC'}
+
+# TERCEROS / PARABRISAS: la primera regla que coincide decide; las marcadas como únicas sólo se asignan una vez
+REGLAS_COLUMNAS = [
+    (lambda c: 'ESTADO FAC' in c or 'ESTADOFAC' in c or c == 'FAC', 'ESTADO_FAC', False),
+    (lambda c: 'ESTADO TALLER' in c or 'ESTADOTALLER' in c or c == 'ESTADO', 'ESTADO_TALLER', False),
+    (lambda c: 'FASE' in c, 'FASE_TALLER', False),
+    (lambda c: 'COMPAÑIA' in c or 'SEGURO' in c or 'EMPRESA' in c or 'CLIENTE' in c, 'EMPRESA_TALLER', True),
+    (lambda c: 'OBSERVACION' in c, 'OBSERVACIONES_TALLER', False),
+    (lambda c: 'PROMESA' in c or 'FECH/PROM' in c, 'FECHA_PROMESA_I', False),
+    (lambda c: 'TICKET' in c, 'FECHA_TICKET', False),
+    (lambda c: 'INGRESO' in c or c == 'FECHA', 'FECHA_INGRESO_TALLER', False),
+    (lambda c: 'HORA' in c, 'HORA_ENTREGA', False),
+    (lambda c: 'DOMINIO' in c or 'PATENTE' in c, 'PATENTE', False),
+    (lambda c: 'PRECIO' in c or 'MONTO' in c or 'TOTAL' in c or 'FRANQUICIA' in c or 'MANO DE OBRA' in c, 'PRECIO', True),
+    (lambda c: 'COSTO' in c or 'REPUESTO' in c, 'COSTO', True),
+    (lambda c: 'TERCERO' in c or 'ASESOR' in c, 'ASESOR', True),
+    (lambda c: c == 'MES', 'MES', False),
+    (lambda c: 'MARCA' in c or 'VEHIC' in c, 'VEHICULO', False),
+    (lambda c: 'PAÑO' in c, 'PAÑOS', True),
+]
+
+# Campos que consume la normalización; el resto de las columnas de la planilla no se cargan
+CAMPOS_MAESTRO = {'PATENTE', 'VEHICULO', 'ASESOR', 'PAÑOS', 'PRECIO', 'COSTO', 'MES', 'DIAS_TRABAJO', 'FECHA_INGRESO_TALLER', 'FECHA_TICKET', 'FECHA_PROMESA_I', 'HORA_ENTREGA', 'OBSERVACIONES_TALLER', 'EMPRESA_TALLER', 'ESTADO_TALLER', 'FASE_TALLER', 'ESTADO_FAC'}
+CAMPOS_REQUERIDOS = ['PATENTE', 'ESTADO_TALLER', 'FECHA_PROMESA_I', 'PRECIO', 'PAÑOS']
+MAX_PLANES_COMPILADOS = 64
+_PLANES_COMPILADOS = OrderedDict()
+
+def detectar_fila_cabecera(d_raw):
+    filas = d_raw.head(15).fillna("").astype(str).agg(" ".join, axis=1).str.upper()
+    coincide = filas.str.contains(PATRON_CABECERA, regex=True).to_numpy()
+    return int(np.argmax(coincide)) if coincide.any() else 0
+
+def normalizar_cabecera(fila):
+    valores = fila.fillna("").astype(str).str.strip().str.upper()
+    return tuple(f"VACIA_{j}" if v in ('', 'NAN', 'NONE') else v for j, v in enumerate(valores))
+
+def compilar_plan_columnas(huella_layout, tipo_layout, _cabecera):
+    # Se compila una sola vez por huella de cabecera: qué columnas leer y con qué nombre
+    clave_plan = (huella_layout, tipo_layout)
+    if clave_plan in _PLANES_COMPILADOS: return _PLANES_COMPILADOS[clave_plan]
+    if tipo_layout == 'POSICIONAL':
+        nombres = [COLUMNAS_FIJAS_GRUPO.get(j, c) for j, c in enumerate(_cabecera)]
+    else:
+        renames = {}
+        for c in _cabecera:
+            if c in renames: continue
+            for predicado, destino, unico in REGLAS_COLUMNAS:
+                if predicado(c):
+                    if not (unico and destino in renames.values()): renames[c] = destino
+                    break
+        nombres = [renames.get(c, c) for c in _cabecera]
+
+    indices, nombres_plan, letras = [], [], {}
+    for j, nombre in enumerate(nombres):
+        if nombre in letras: continue
+        letras[nombre] = letra_columna(j)
+        if nombre in CAMPOS_MAESTRO or 'CHASIS' in nombre or 'VIN' in nombre:
+            indices.append(j)
+            nombres_plan.append(nombre)
+    faltantes = [c for c in CAMPOS_REQUERIDOS if c not in nombres_plan]
+    if tipo_layout == 'POSICIONAL' and len(_cabecera) <= max(COLUMNAS_FIJAS_GRUPO):
+        faltantes.append(f"columnas fijas hasta la {letra_columna(max(COLUMNAS_FIJAS_GRUPO))}")
+    plan = {'indices': tuple(indices), 'nombres': tuple(nombres_plan), 'letras': {c: letras[c] for c in nombres_plan}, 'faltantes': tuple(faltantes)}
+    _PLANES_COMPILADOS[clave_plan] = plan
+    while len(_PLANES_COMPILADOS) > MAX_PLANES_COMPILADOS: _PLANES_COMPILADOS.popitem(last=False)
+    return plan
+
+# El último layout aceptado de cada pestaña queda en RUTA_LAYOUTS, compartido por todos los procesos. Si la
+# cabecera cambia se guarda la nueva con la aceptada en 'anterior' y la hora del cambio: el aviso se muestra en
+# cada carga (de cualquier worker) hasta que alguien acepta la estructura nueva (aceptar_layout).
+def _leer_layouts(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+def _actualizar_layouts(ruta, actualizar):
+    # Leer-modificar-escribir bajo candado entre procesos; el archivo se reemplaza entero, nunca queda a medias
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with candado_archivo(f"{ruta}.lock"):
+        conocidos = _leer_layouts(ruta)
+        actualizar(conocidos)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f: json.dump(conocidos, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, ruta)
+    return conocidos
+
+def _registro_layout(previo, huella_layout, cabecera):
+    actual = {'huella': huella_layout, 'cabecera': list(cabecera)}
+    if not previo: return actual
+    aceptado = previo.get('anterior') or {'huella': previo['huella'], 'cabecera': previo['cabecera']}
+    if aceptado['huella'] == huella_layout: return actual  # Sin cambios, o volvió a la estructura aceptada
+    if previo['huella'] == huella_layout: return previo  # Cambio ya registrado, todavía sin aceptar
+    return {**actual, 'anterior': aceptado, 'cambio': datetime.now().isoformat(timespec='seconds')}
+
+def verificar_layout(pestana, huella_layout, cabecera, plan, ruta=RUTA_LAYOUTS):
+    """Registra la cabecera de la pestaña (los cambios quedan pendientes de aceptar, ver avisos_cambio_layout)
+    y devuelve los avisos de campos clave faltantes."""
+    previo = _leer_layouts(ruta).get(pestana)
+    if _registro_layout(previo, huella_layout, cabecera) != previo:
+        def registrar(conocidos): conocidos[pestana] = _registro_layout(conocidos.get(pestana), huella_layout, cabecera)
+        try:
+            registro = _actualizar_layouts(ruta, registrar)[pestana]
+            if registro.get('cambio') and registro != previo: log_taller.warning(aviso_cambio_layout(pestana, registro))
+        except (OSError, TimeoutError) as e: log_taller.warning("No se pudo guardar el layout de %s: %s", pestana, e)
+    avisos = [f"La pestaña {pestana} no tiene: {', '.join(plan['faltantes'])}."] if plan['faltantes'] else []
+    for aviso in avisos: log_taller.warning(aviso)
+    return avisos
+
+def aviso_cambio_layout(pestana, registro):
+    agregadas = [c for c in registro['cabecera'] if c not in registro['anterior']['cabecera'] and not c.startswith('VACIA_')]
+    quitadas = [c for c in registro['anterior']['cabecera'] if c not in registro['cabecera'] and not c.startswith('VACIA_')]
+    return (f"La pestaña {pestana} cambió de estructura el {registro['cambio'].replace('T', ' ')} (agregadas: {', '.join(agregadas) or '-'}; "
+            f"quitadas: {', '.join(quitadas) or '-'}). Revisar el mapeo de columnas y aceptar la estructura nueva.")
+
+def avisos_cambio_layout(ruta=RUTA_LAYOUTS):
+    return [aviso_cambio_layout(p, r) for p, r in _leer_layouts(ruta).items() if r.get('anterior')]
+
+def aceptar_layout(pestanas=None, ruta=RUTA_LAYOUTS):
+    """Da por buenas las estructuras nuevas (de todas las pestañas, o de las indicadas); devuelve cuáles se aceptaron."""
+    aceptadas = []
+    def aceptar(conocidos):
+        for pestana, registro in conocidos.items():
+            if registro.get('anterior') and (pestanas is None or pestana in pestanas):
+                conocidos[pestana] = {'huella': registro['huella'], 'cabecera': registro['cabecera']}
+                aceptadas.append(pestana)
+    if _leer_layouts(ruta): _actualizar_layouts(ruta, aceptar)
+    return aceptadas
+
+def normalizar_pestana_maestro(d, col_chasis_global):
+    filas = []
+    for _, row in d.iterrows():
+        f_fin = parsear_fecha_español(row.get('FECHA_PROMESA_I', ''))
+        f_fin_disp = f_fin.date() if f_fin else None
+        if not f_fin: f_fin = datetime.now() + timedelta(days=3650) 
+        
+        mes_hist = f_fin.strftime('%Y-%m') if f_fin.year < 2030 else "SIN FECHA"
+        if row.get('GRUPO_ORIGEN') in ['PARABRISAS', 'TERCEROS']:
+            mes_str = str(row.get('MES', '')).strip().lower()
+            for m_name, m_num in MESES_ES.items():
+                if m_name in mes_str:
+                    mes_hist = f"{datetime.now().year}-{m_num:02d}"
+                    break
+
+        f_ingreso = parsear_fecha_español(row.get('FECHA_INGRESO_TALLER', ''))
+        f_ticket = parsear_fecha_español(row.get('FECHA_TICKET', ''))
+        
+        try:
+            t_panos = str(row.get('PAÑOS', '0')).replace(',', '.')
+            if t_panos.lower() == 'nan' or not t_panos.strip(): t_panos = '0'
+            panos = float(re.findall(r"[-+]?\d*\.\d+|\d+", t_panos)[0]) if re.findall(r"[-+]?\d*\.\d+|\d+", t_panos) else 0.0
+        except: panos = 0.0
+        
+        try:
+            t_dias = str(row.get('DIAS_TRABAJO', '0')).replace(',', '.')
+            if t_dias.lower() == 'nan' or not t_dias.strip() or 'VACIA' in t_dias: t_dias = '0'
+            dias_rep = float(re.findall(r"[-+]?\d*\.\d+|\d+", t_dias)[0]) if re.findall(r"[-+]?\d*\.\d+|\d+", t_dias) else 0.0
+        except: dias_rep = 0.0
+
+        precio_raw = str(row.get('PRECIO', '0')).replace('$', '').replace('.', '').replace(',', '.').strip()
+        try: precio_val = float(precio_raw) if precio_raw else 0.0
+        except: precio_val = 0.0
+
+        costo_raw = str(row.get('COSTO', '0')).replace('$', '').replace('.', '').replace(',', '.').strip()
+        try: costo_val = float(costo_raw) if costo_raw else 0.0
+        except: costo_val = 0.0
+        
+        estado_fac_raw = str(row.get('ESTADO_FAC', '')).replace('.', '').strip().upper()
+        
+        estado = str(row.get('ESTADO_TALLER', '')).replace('nan', '').strip().upper() or "SIN ESTADO"
+        cliente = str(row.get('EMPRESA_TALLER', 'PARTICULAR')).replace('nan', '').strip().upper() or "PARTICULAR"
+        asesor = str(row.get('ASESOR', '')).strip().upper()
+        if asesor == 'NAN' or not asesor: asesor = "SIN ASIGNAR"
+        fase = str(row.get('FASE_TALLER', '')).replace('nan', '').strip().upper()
+        if not fase or fase == 'VACIA_20': fase = "SIN FASE ASIGNADA"
+        hora_entrega = str(row.get('HORA_ENTREGA', '')).replace('nan', '').strip()
+        chasis_val = str(row.get(col_chasis_global, '')).strip().upper() if col_chasis_global else ""
+
+        filas.append({
+            'Grupo': row.get('GRUPO_ORIGEN'), 'Asesor': asesor, 'Cliente': cliente,
+            'Patente': str(row.get('PATENTE', '')), 'Vehiculo': str(row.get('VEHICULO', '')), 'Chasis': chasis_val,
+            'Inicio': f_fin - timedelta(days=max(1, int(panos))), 'Fin': f_fin, 'Fecha_Promesa_Disp': f_fin_disp, 
+            'Fecha_Ingreso': f_ingreso.date() if f_ingreso else None, 'Fecha_Ticket': f_ticket.date() if f_ticket else None,
+            'Hora_Entrega': hora_entrega,
+            'Mes_Hist': mes_hist, 'Paños': panos, 'Dias_Reparacion': dias_rep, 'Tipo_ABC': clasificar_abc(panos),
+            'Estado_Fac': estado_fac_raw, 
+            'Estado_Taller': estado, 'Fase_Taller': fase, 
+            'Precio': precio_val, 'Costo': costo_val,
+            'Observaciones': str(row.get('OBSERVACIONES_TALLER', '')).replace('nan', '').strip(),
+            'Fila_Hoja': int(row.get('FILA_HOJA')),
+            'Promesa_Txt': str(row.get('FECHA_PROMESA_I', '')).replace('nan', '').strip(),
+            'Ingreso_Txt': str(row.get('FECHA_INGRESO_TALLER', '')).replace('nan', '').strip()
+        })
+    return pd.DataFrame(filas)
+
+def leer_pestana_maestro(n, cuerpo):
+    d_raw = leer_csv(cuerpo, encabezado=False)
+    idx_header = detectar_fila_cabecera(d_raw)
+    cabecera = normalizar_cabecera(d_raw.iloc[idx_header])
+    tipo_layout = 'POSICIONAL' if n in GRUPOS_POSICIONALES else 'POR_NOMBRE'
+    huella_layout = hashlib.sha1(f"{tipo_layout}|{'|'.join(cabecera)}".encode()).hexdigest()[:12]
+    plan = compilar_plan_columnas(huella_layout, tipo_layout, cabecera)
+
+    # Un solo select + rename posicional según el plan compilado
+    d = d_raw.iloc[idx_header + 1:, list(plan['indices'])]
+    d.columns = list(plan['nombres'])
+    d = d.reset_index(drop=True)
+    
+    if tipo_layout == 'POR_NOMBRE' and 'MES' in d.columns:
+        d['MES'] = d['MES'].replace(r'^\s*$', pd.NA, regex=True).ffill()
+    d['FILA_HOJA'] = d.index + idx_header + 2
+
+    if 'PATENTE' in d.columns: 
+        d = d.dropna(subset=['PATENTE'])
+        d = d[d['PATENTE'].str.strip() != ""]
+        d['GRUPO_ORIGEN'] = n
+    else: d = None
+    return {'d': d, 'huella_layout': huella_layout, 'cabecera': cabecera, 'plan': plan}
+
+def cargar_maestro():
+    pestanas = {}
+    columnas_hoja = {}
+    avisos_layout = []
+    for n, gid in GIDS.items():
+        try:
+            with medir(f"csv:{n}"):
+                cuerpo, huella = descargar_csv(f"{URL_BASE}{gid}")
+            previa = _PESTANAS_PARSEADAS.get(gid)
+            if previa is not None and previa['huella'] == huella: CONTADORES_DESCARGA['parseos_omitidos'] += 1
+            else: previa = _PESTANAS_PARSEADAS[gid] = {'huella': huella, **leer_pestana_maestro(n, cuerpo)}
+            avisos_layout.extend(verificar_layout(n, previa['huella_layout'], previa['cabecera'], previa['plan']))
+            columnas_hoja[n] = previa['plan']['letras']
+            if previa['d'] is not None: pestanas[gid] = previa
+        except Exception as e: 
+            print(f"Error en pestaña {n}: {e}")
+            pass
+        
+    if not pestanas:
+        df_vacio = pd.DataFrame()
+        df_vacio.attrs['avisos_layout'] = avisos_layout
+        return df_vacio
+
+    # Cada pestaña se normaliza contra la unión de columnas de todas (igual que si estuvieran concatenadas);
+    # si no cambió su contenido, ni esa unión, ni el día, se reutiliza la normalización anterior
+    columnas_union = list(dict.fromkeys(c for p in pestanas.values() for c in p['d'].columns))
+    col_chasis_global = next((c for c in columnas_union if 'CHASIS' in c or 'VIN' in c), None)
+    partes = []
+    for gid, p in pestanas.items():
+        clave = (p['huella'], tuple(columnas_union), datetime.now().date())
+        if _PESTANAS_NORMALIZADAS.get(gid, (None,))[0] != clave:
+            _PESTANAS_NORMALIZADAS[gid] = (clave, normalizar_pestana_maestro(p['d'].reindex(columns=columnas_union), col_chasis_global))
+        if not _PESTANAS_NORMALIZADAS[gid][1].empty: partes.append(_PESTANAS_NORMALIZADAS[gid][1])
+    df_maestro = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    df_maestro.attrs['columnas_hoja'] = columnas_hoja
+    df_maestro.attrs['avisos_layout'] = avisos_layout
+    # Versión de contenido: si la planilla no cambió entre recargas, los cachés derivados se reutilizan
+    df_maestro.attrs['version'] = huella_frame(df_maestro)
+    return df_maestro
+
+# --- ESPEJO LOCAL EN SQLITE (CONSULTAS INDEXADAS) ---
+# Cada versión de datos se vuelca una sola vez a una tabla propia e inmutable (vehiculos_<versión>,
+# turnos_<versión>), así sesiones con versiones distintas nunca se pisan. Los filtros devuelven la
+# columna 'pos' (posición en el DataFrame de origen) para recortar el frame cacheado sin reconvertir tipos.
+VERSIONES_ESPEJO_A_CONSERVAR = 4
+
+def _fecha_iso(serie):
+    return pd.to_datetime(serie, errors='coerce').dt.strftime('%Y-%m-%d').to_numpy()
+
+ARMADORES_ESPEJO = {
+    'vehiculos': lambda d: pd.DataFrame({
+        'pos': np.arange(len(d)), 'Grupo': d['Grupo'].to_numpy(), 'Asesor': d['Asesor'].to_numpy(), 'Cliente': d['Cliente'].to_numpy(),
+        'Patente': d['Patente'].to_numpy(), 'Chasis': d['Chasis'].to_numpy(), 'Mes_Hist': d['Mes_Hist'].to_numpy(),
+        'Fecha': _fecha_iso(d['Fecha_Promesa_Disp']), 'Paños': d['Paños'].to_numpy(), 'Precio': d['Precio'].to_numpy(),
+        'Costo': d['Costo'].to_numpy(), 'Estado_Fac': d['Estado_Fac'].to_numpy(), 'Estado_Taller': d['Estado_Taller'].to_numpy()
+    }),
+    'turnos': lambda d: pd.DataFrame({
+        'pos': np.arange(len(d)), 'Fecha': _fecha_iso(d['Fecha']), 'Asesor': d['Asesor'].to_numpy(),
+        'Patente': d['Patente'].to_numpy(), 'Tipo': d['Tipo'].to_numpy(), 'Cancelado': d['Cancelado'].to_numpy()
+    })
+}
+INDICES_ESPEJO = {'vehiculos': ['Patente', 'Mes_Hist', 'Fecha', 'Grupo'], 'turnos': ['Patente', 'Fecha', 'Asesor']}
+
+def conectar_espejo():
+    os.makedirs(RUTA_DATOS_LOCALES, exist_ok=True)
+    con = sqlite3.connect(RUTA_DB_ESPEJO, timeout=30, isolation_level=None)
+    con.execute("CREATE TABLE IF NOT EXISTS versiones_espejo (Tipo TEXT, Tabla TEXT PRIMARY KEY, Creada TEXT)")
+    return con
+
+def tabla_espejo(tipo, df_origen):
+    tabla = f"{tipo}_{df_origen.attrs.get('version') or huella_frame(df_origen)}"
+    consulta_existe = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    with closing(conectar_espejo()) as con:
+        if con.execute(consulta_existe, (tabla,)).fetchone(): return tabla
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if not con.execute(consulta_existe, (tabla,)).fetchone():
+                df_tabla = ARMADORES_ESPEJO[tipo](df_origen)
+                columnas_sql = ", ".join(f'"{c}"' for c in df_tabla.columns)
+                con.execute(f'CREATE TABLE "{tabla}" ({columnas_sql})')
+                filas = df_tabla.astype(object).where(df_tabla.notna(), None).itertuples(index=False, name=None)
+                con.executemany(f'INSERT INTO "{tabla}" VALUES ({", ".join("?" * len(df_tabla.columns))})', filas)
+                for col in INDICES_ESPEJO[tipo]:
+                    con.execute(f'CREATE INDEX "ix_{tabla}_{col}" ON "{tabla}" ("{col}")')
+                con.execute("INSERT INTO versiones_espejo VALUES (?, ?, ?)", (tipo, tabla, datetime.now().isoformat()))
+                viejas = con.execute("SELECT Tabla FROM versiones_espejo WHERE Tipo = ? ORDER BY Creada DESC LIMIT -1 OFFSET ?", (tipo, VERSIONES_ESPEJO_A_CONSERVAR)).fetchall()
+                for (vieja,) in viejas:
+                    con.execute(f'DROP TABLE IF EXISTS "{vieja}"')
+                    con.execute("DELETE FROM versiones_espejo WHERE Tabla = ?", (vieja,))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    return tabla
+
+def consultar_espejo(sql, params=()):
+    with closing(conectar_espejo()) as con:
+        return pd.read_sql_query(sql, con, params=list(params))
+
+def condiciones_maestro(mes_filtro, termino=""):
+    condiciones, params = [], []
+    if mes_filtro != "TODOS":
+        condiciones.append("Mes_Hist IN (?, 'SIN FECHA')"); params.append(mes_filtro)
+    if termino:
+        condiciones.append("(instr(Patente, ?) > 0 OR instr(Chasis, ?) > 0)"); params += [termino, termino]
+    return (" WHERE " + " AND ".join(condiciones)) if condiciones else "", params
+
+def seleccionar_maestro(df_maestro, mes_filtro, termino=""):
+    if df_maestro.empty: return df_maestro
+    where, params = condiciones_maestro(mes_filtro, termino)
+    pos = consultar_espejo(f'SELECT pos FROM "{tabla_espejo("vehiculos", df_maestro)}"{where} ORDER BY pos', params)['pos']
+    return df_maestro.iloc[pos.to_numpy()]
+
+def seleccionar_turnos(df_turnos, f_desde, f_hasta, asesor="TODOS", termino=""):
+    if df_turnos.empty: return df_turnos.copy()
+    sql = f'SELECT pos FROM "{tabla_espejo("turnos", df_turnos)}" WHERE Fecha BETWEEN ? AND ?'
+    params = [f_desde.strftime('%Y-%m-%d'), f_hasta.strftime('%Y-%m-%d')]
+    if asesor != "TODOS":
+        sql += " AND Asesor = ?"; params.append(asesor)
+    if termino:
+        sql += " AND instr(Patente, ?) > 0"; params.append(termino)
+    pos = consultar_espejo(sql + " ORDER BY pos", params)['pos']
+    return df_turnos.iloc[pos.to_numpy()]
+
+def kpi_por(df_maestro, columna, mes_filtro, termino=""):
+    # Vehículos con precio y paños cargados, agrupados por Asesor o Grupo
+    where, params = condiciones_maestro(mes_filtro, termino)
+    where = (where + " AND" if where else " WHERE") + ' Precio > 0 AND "Paños" > 0'
+    return consultar_espejo(f'''SELECT {columna}, COUNT(Patente) AS Autos, TOTAL("Paños") AS "Paños_Totales", TOTAL(Precio) AS "Facturación_Total"
+        FROM "{tabla_espejo("vehiculos", df_maestro)}"{where} GROUP BY {columna} ORDER BY {columna}''', params)
+
+SQL_ESTADO_RESUMEN = """CASE WHEN instr(Estado_Taller, 'DETENIDO') > 0 THEN 'En Taller (Otros)'
+    WHEN Estado_Fac = 'FAC' THEN 'Facturado (FAC)' WHEN Estado_Fac = 'SI' THEN 'Aprobado (SI)' ELSE 'En Taller (Otros)' END"""
+
+def resumen_facturacion(df_maestro, mes_filtro, termino=""):
+    # Totales por (Propios/Terceros, Estado_Resumen) en una sola consulta agrupada
+    where, params = condiciones_maestro(mes_filtro, termino)
+    df_res = consultar_espejo(f'''SELECT CASE WHEN Grupo = 'TERCEROS' THEN 'TERCEROS' ELSE 'PROPIOS' END AS Origen, {SQL_ESTADO_RESUMEN} AS Estado_Resumen,
+        TOTAL("Paños") AS "Paños", TOTAL(Precio) AS Precio, TOTAL(Costo) AS Costo, COUNT(*) AS Autos
+        FROM "{tabla_espejo("vehiculos", df_maestro)}"{where} GROUP BY 1, 2''', params)
+    return df_res.set_index(['Origen', 'Estado_Resumen'])
+
+# --- ALMACÉN DE AGREGADOS MENSUALES (HISTÓRICOS) ---
+def conectar_historicos():
+    os.makedirs(RUTA_DATOS_LOCALES, exist_ok=True)
+    con = sqlite3.connect(RUTA_DB_HISTORICOS)
+    con.execute('CREATE TABLE IF NOT EXISTS agregados_mes (Mes_Hist TEXT, Cliente TEXT, "Paños" REAL, Precio REAL, PRIMARY KEY (Mes_Hist, Cliente))')
+    con.execute('CREATE TABLE IF NOT EXISTS meses_cerrados (Mes_Hist TEXT PRIMARY KEY, Congelado_En TEXT)')
+    return con
+
+def reiniciar_historicos():
+    with closing(conectar_historicos()) as con:
+        with con:
+            con.execute("DELETE FROM agregados_mes")
+            con.execute("DELETE FROM meses_cerrados")
+
+def agregar_historicos(_df_maestro, mes_actual):
+    # Los meses cerrados (anteriores a mes_actual) se congelan en SQLite la primera vez que se ven
+    # y después se leen de ahí; sólo se vuelven a agrupar (en el espejo) el mes en curso y los meses nuevos.
+    if _df_maestro.empty: return pd.DataFrame(columns=['Mes_Hist', 'Cliente', 'Paños', 'Precio'])
+    tabla = tabla_espejo("vehiculos", _df_maestro)
+    with closing(conectar_historicos()) as con:
+        con.execute("ATTACH DATABASE ? AS espejo", (RUTA_DB_ESPEJO,))
+        agrupado = pd.read_sql_query(f'''SELECT Mes_Hist, Cliente, TOTAL("Paños") AS "Paños", TOTAL(Precio) AS Precio FROM espejo."{tabla}"
+            WHERE Mes_Hist != 'SIN FECHA' AND Mes_Hist NOT IN (SELECT Mes_Hist FROM meses_cerrados) GROUP BY Mes_Hist, Cliente''', con)
+        
+        a_congelar = agrupado[agrupado['Mes_Hist'] < mes_actual]
+        if not a_congelar.empty:
+            sello = datetime.now().isoformat(timespec='seconds')
+            with con:
+                con.executemany("INSERT OR REPLACE INTO agregados_mes VALUES (?, ?, ?, ?)", a_congelar.itertuples(index=False, name=None))
+                con.executemany("INSERT OR REPLACE INTO meses_cerrados VALUES (?, ?)", [(m, sello) for m in a_congelar['Mes_Hist'].unique()])
+        df_congelado = pd.read_sql_query("SELECT * FROM agregados_mes", con)
+
+    df_abierto = agrupado[agrupado['Mes_Hist'] >= mes_actual]
+    return pd.concat([df_congelado, df_abierto], ignore_index=True).sort_values(['Mes_Hist', 'Cliente']).reset_index(drop=True)
+
+# --- ÍNDICE TURNOS ↔ TALLER ---
+# Un turno y su orden en el taller sólo comparten la patente, tipeada a mano en dos planillas. El índice se arma
+# una vez por par de versiones: misma patente normalizada e ingreso al taller dentro de una ventana alrededor del
+# turno; gana el ingreso más cercano y cada orden queda vinculada a un solo turno.
+DIAS_VINCULO_ANTES, DIAS_VINCULO_DESPUES = 7, 45
+ETAPAS_TURNO = ['cancelado', 'no_show', 'reservado', 'recibido', 'en_taller', 'terminado', 'entregado']
+ETAPAS_INGRESADO = ['recibido', 'en_taller', 'terminado', 'entregado']
+
+def normalizar_patente(serie):
+    return serie.fillna('').str.upper().str.replace(r'[^A-Z0-9]', '', regex=True)
+
+def mascara_turno_recibido(d):
+    # Recibido se considera cuando tiene Ticket o Ref y checkboxes OK
+    return ((d['Ticket'].str.strip() != "") | (d['Referencia'].str.strip() != "")) & (d['Recibido'] == True) & (d['Fotos'] == True)
+
+def indice_turnos_taller(df_turnos, df_maestro, hoy=None):
+    """Vincula turnos y órdenes del taller. Devuelve {'turnos': un registro por turno (mismo índice que df_turnos)
+    con Idx_Taller, Dias_Hasta_Ingreso y Etapa; 'taller': Idx_Turno y Fecha_Turno, sólo para las órdenes con turno}."""
+    hoy = pd.Timestamp(hoy or date.today())
+    turnos = pd.DataFrame({'Clave': normalizar_patente(df_turnos['Patente']), 'Fecha': pd.to_datetime(df_turnos['Fecha'], errors='coerce')}, index=df_turnos.index)
+    taller = pd.DataFrame({'Clave': normalizar_patente(df_maestro['Patente']), 'Ingreso': pd.to_datetime(df_maestro['Fecha_Ingreso'], errors='coerce'),
+                           'Estado': df_maestro['Estado_Taller']}, index=df_maestro.index)
+    candidatos = turnos[turnos['Clave'] != ""].rename_axis('Idx_Turno').reset_index().merge(taller[taller['Clave'] != ""].rename_axis('Idx_Taller').reset_index(), on='Clave')
+    candidatos['Dias'] = (candidatos['Ingreso'] - candidatos['Fecha']).dt.days
+    candidatos = candidatos[candidatos['Dias'].between(-DIAS_VINCULO_ANTES, DIAS_VINCULO_DESPUES)]
+    # Más cercano primero (a igual distancia, el ingreso posterior al turno); cada orden se queda con su mejor turno
+    # y después cada turno con la mejor orden que le quedó
+    candidatos = candidatos.assign(Distancia=candidatos['Dias'].abs()).sort_values(['Distancia', 'Dias'], ascending=[True, False], kind='stable')
+    vinculos = candidatos.drop_duplicates('Idx_Taller').drop_duplicates('Idx_Turno')
+
+    por_turno = vinculos.set_index('Idx_Turno').reindex(df_turnos.index)
+    enlazado = por_turno['Idx_Taller'].notna().to_numpy()
+    estado = por_turno['Estado'].fillna("")
+    etapa = np.select(
+        [enlazado & estado.str.contains("ENTREGADO").to_numpy(), enlazado & estado.str.contains("TERM").to_numpy(), enlazado,
+         df_turnos['Cancelado'].to_numpy(dtype=bool), mascara_turno_recibido(df_turnos).to_numpy(dtype=bool), (turnos['Fecha'] < hoy).to_numpy()],
+        ['entregado', 'terminado', 'en_taller', 'cancelado', 'recibido', 'no_show'], 'reservado')
+    resultado_turnos = pd.DataFrame({
+        'Fecha': turnos['Fecha'], 'Asesor': df_turnos['Asesor'], 'Idx_Taller': por_turno['Idx_Taller'].astype('Int64'),
+        'Dias_Hasta_Ingreso': por_turno['Dias'].astype('Int64'), 'Etapa': pd.Categorical(etapa, categories=ETAPAS_TURNO)
+    }, index=df_turnos.index)
+    resultado_taller = vinculos.set_index('Idx_Taller')[['Idx_Turno', 'Fecha']].rename(columns={'Fecha': 'Fecha_Turno'}).sort_index()
+    return {'turnos': resultado_turnos, 'taller': resultado_taller}
+
+def metricas_turnos(vinculos_turnos, por='Asesor'):
+    # Conversión sobre los turnos ya resueltos (vinieron o no); los cancelados y los que todavía no llegaron no cuentan
+    conteo = pd.crosstab(vinculos_turnos[por], vinculos_turnos['Etapa'], dropna=False).reindex(columns=ETAPAS_TURNO, fill_value=0)
+    ingresados = conteo[ETAPAS_INGRESADO].sum(axis=1)
+    resueltos = (ingresados + conteo['no_show']).where(lambda s: s > 0)
+    return pd.DataFrame({
+        'Turnos': conteo.sum(axis=1), 'Cancelados': conteo['cancelado'], 'Pendientes': conteo['reservado'], 'No_Show': conteo['no_show'],
+        'Ingresados': ingresados, 'Entregados': conteo['entregado'], 'Conversion': ingresados / resueltos, 'Tasa_No_Show': conteo['no_show'] / resueltos,
+        'Dias_Hasta_Ingreso': vinculos_turnos.groupby(por)['Dias_Hasta_Ingreso'].mean().astype(float)
+    }).rename_axis(por).reset_index()
+
+# --- PORTAL DE EMPRESAS (app.py y api_portal.py) ---
+# Empresas del grupo por patrón de Cliente; el portal las lista por fecha promesa
+EMPRESAS_PORTAL = {"AUTOSOL": "SOL", "AUTOLUX": "LUX", "CIEL / AUTOCIEL": "CIEL"}
+PATRON_EMPRESAS_GRUPO = "SOL|LUX|CIEL"
+
+def vehiculos_empresa(df_maestro, empresa="TODAS"):
+    if df_maestro.empty: return df_maestro
+    d = df_maestro[df_maestro['Cliente'].str.contains(EMPRESAS_PORTAL.get(empresa, PATRON_EMPRESAS_GRUPO), case=False, na=False)]
+    return d.sort_values(by='Fecha_Promesa_Disp', ascending=True, na_position='last')
+
+def contadores_portal(df_vista):
+    estado = df_vista['Estado_Taller']
+    return {'en_proceso': int(estado.str.contains("PROCESO", na=False).sum()), 'detenidos': int(estado.str.contains("DETENIDO", na=False).sum()),
+            'terminados': int(estado.str.contains("TERM", na=False).sum())}
+
+# Lo que cargan los concesionarios (ingreso y asesor del concesionario, observaciones) no existe en la planilla:
+# se guarda en SQLite por patente y se carga una vez a un frame indexado por patente. Cada guardado es una sola
+# transacción con sólo las celdas que cambiaron; si otro proceso escribió, el mtime del archivo fuerza la relectura.
+COLUMNAS_PORTAL = {'Fecha Ingreso Concesionario': 'fecha_ingreso_conc', 'Asesor Concesionario': 'asesor_conc', 'Observaciones': 'observaciones'}
+COMPARACION_PORTAL = {'Fecha Ingreso Concesionario': 'fecha', 'Asesor Concesionario': 'texto', 'Observaciones': 'texto'}
+
+class NotasPortal:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        with self._lock: self._cargar()
+
+    def _conectar(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        con = sqlite3.connect(self.ruta)
+        con.execute('CREATE TABLE IF NOT EXISTS notas_portal (patente TEXT PRIMARY KEY, fecha_ingreso_conc TEXT, asesor_conc TEXT, observaciones TEXT, actualizado TEXT)')
+        return con
+
+    def _cargar(self):
+        with closing(self._conectar()) as con:
+            notas = pd.read_sql_query(f"SELECT patente, {', '.join(COLUMNAS_PORTAL.values())} FROM notas_portal", con, index_col='patente')
+        notas['fecha_ingreso_conc'] = pd.to_datetime(notas['fecha_ingreso_conc'], errors='coerce').dt.date
+        self._notas = notas.rename(columns={v: k for k, v in COLUMNAS_PORTAL.items()})
+        self._marca = os.path.getmtime(self.ruta)
+
+    def notas(self):
+        with self._lock:
+            if os.path.getmtime(self.ruta) != self._marca: self._cargar()
+            return self._notas
+
+    def guardar(self, cambios):
+        """cambios: changeset con columnas patente, columna, nuevo (ver diferenciar_ediciones)."""
+        valor_sql = lambda v: None if v is None or (not isinstance(v, str) and pd.isna(v)) else v.isoformat() if isinstance(v, (date, datetime)) else str(v)
+        sello = datetime.now().isoformat(timespec='seconds')
+        with self._lock, closing(self._conectar()) as con:
+            with con:
+                con.executemany("INSERT OR IGNORE INTO notas_portal (patente) VALUES (?)", [(p,) for p in cambios['patente'].unique()])
+                for columna, grupo in cambios.groupby('columna'):
+                    con.executemany(f"UPDATE notas_portal SET {COLUMNAS_PORTAL[columna]} = ?, actualizado = ? WHERE patente = ?",
+                                    [(valor_sql(v), sello, p) for p, v in zip(grupo['patente'], grupo['nuevo'])])
+            self._cargar()
+        return len(cambios)
+
+# --- ALMACÉN DE TURNOS COMPARTIDO (POR VERSIÓN) ---
+# Un único frame de turnos por versión para todo el proceso; cada sesión guarda sólo la versión que está
+# mirando (y sus ediciones pendientes viven en el estado de los st.data_editor). Los frames publicados son
+# de sólo lectura: derivar con filtros/iloc/assign, nunca asignar columnas sobre ellos.
+VERSIONES_TURNOS_A_CONSERVAR = 3
+
+class AlmacenTurnos:
+    def __init__(self, maximo_versiones=VERSIONES_TURNOS_A_CONSERVAR):
+        self.maximo_versiones = maximo_versiones
+        self._versiones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publicar(self, df_turnos):
+        version = df_turnos.attrs.get('version') or huella_frame(df_turnos)
+        with self._lock:
+            if version not in self._versiones:
+                self._versiones[version] = df_turnos
+                while len(self._versiones) > self.maximo_versiones: self._versiones.popitem(last=False)
+            self._versiones.move_to_end(version)
+            return version, self._versiones[version]
+
+    def obtener(self, version):
+        with self._lock:
+            return self._versiones.get(version)
+
+# --- LIBRO DE ENTREGAS CONFIRMADAS (COMPARTIDO ENTRE SESIONES Y PROCESOS) ---
+# Log append-only en disco + dict en memoria (patente -> fecha de confirmación). La primera línea lleva la
+# generación del archivo, que cambia en cada compactación: cada proceso relee sólo lo que se agregó desde la
+# última vez, o todo si la generación no es la que leyó (el inodo no sirve: os.replace puede reusarlo).
+# Agregar y compactar van bajo un candado de archivo, y antes de compactar se relee el archivo entero. Las confirmaciones se olvidan pasados DIAS_RETENCION_ENTREGAS: para entonces la
+# planilla ya debería decir ENTREGADO.
+DIAS_RETENCION_ENTREGAS = 30
+LINEAS_MINIMAS_COMPACTACION = 200
+
+class LibroEntregas:
+    def __init__(self, ruta, dias_retencion=DIAS_RETENCION_ENTREGAS, lineas_minimas_compactacion=LINEAS_MINIMAS_COMPACTACION):
+        self.ruta = ruta
+        self.dias_retencion = dias_retencion
+        self.lineas_minimas_compactacion = lineas_minimas_compactacion
+        self.compactaciones = 0
+        self._entregas, self._lineas, self._leido, self._marca, self._generacion = {}, 0, 0, None, None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        with self._lock, candado_archivo(f"{self.ruta}.lock"):
+            self._recargar(completo=True)
+            self._compactar()
+
+    def _limite(self):
+        return (datetime.now() - timedelta(days=self.dias_retencion)).isoformat(timespec='seconds')
+
+    @staticmethod
+    def _leer_generacion(f):
+        try: return json.loads(f.readline()).get('generacion')
+        except (ValueError, AttributeError): return None  # Archivo vacío o sin cabecera
+
+    def _recargar(self, completo=False):
+        try:
+            e = os.stat(self.ruta)
+            if not completo and (e.st_ino, e.st_size, e.st_mtime_ns) == self._marca: return
+            f = open(self.ruta, 'rb')
+        except FileNotFoundError:
+            self._entregas, self._lineas, self._leido, self._marca, self._generacion = {}, 0, 0, None, None
+            return
+        with f:
+            e = os.fstat(f.fileno())
+            generacion = self._leer_generacion(f)
+            if completo or generacion is None or generacion != self._generacion or e.st_size < self._leido:
+                # Otro proceso compactó (o no hay cabecera): se relee entero
+                self._entregas, self._lineas, self._leido, self._generacion = {}, 0, 0, generacion
+            f.seek(self._leido)
+            datos = f.read()
+        leido = datos[:datos.rfind(b"\n") + 1]  # Una línea a medio escribir se lee en la próxima recarga
+        for linea in leido.splitlines():
+            try: registro = json.loads(linea)
+            except ValueError: continue  # Línea truncada por un corte a mitad de escritura
+            if 'patente' not in registro: continue  # Cabecera
+            self._entregas[registro['patente']] = registro['fecha']
+            self._lineas += 1
+        self._leido += len(leido)
+        self._marca = (e.st_ino, e.st_size, e.st_mtime_ns)
+
+    def _compactar(self):
+        limite = self._limite()
+        self._entregas = {p: f for p, f in self._entregas.items() if f >= limite}
+        generacion = os.urandom(8).hex()
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'generacion': generacion}) + "\n")
+            f.writelines(json.dumps({'patente': p, 'fecha': fecha}) + "\n" for p, fecha in self._entregas.items())
+            f.flush(); os.fsync(f.fileno())
+        os.replace(temporal, self.ruta)
+        e = os.stat(self.ruta)
+        self._lineas, self._leido, self._generacion = len(self._entregas), e.st_size, generacion
+        self._marca = (e.st_ino, e.st_size, e.st_mtime_ns)
+        self.compactaciones += 1
+
+    def registrar(self, patentes):
+        fecha = datetime.now().isoformat(timespec='seconds')
+        nuevas = list(dict.fromkeys(patentes))
+        lineas = "".join(json.dumps({'patente': p, 'fecha': fecha}) + "\n" for p in nuevas).encode()
+        with self._lock, candado_archivo(f"{self.ruta}.lock"):
+            with open(self.ruta, 'a+b') as f:
+                # Si un corte dejó la última línea sin terminar, no se pega a la primera nueva
+                if f.tell() and os.pread(f.fileno(), 1, f.tell() - 1) != b"\n": f.write(b"\n")
+                f.write(lineas)
+                f.flush(); os.fsync(f.fileno())
+            self._recargar()
+            if self._lineas > max(self.lineas_minimas_compactacion, 2 * len(self._entregas)):
+                self._recargar(completo=True)  # Se reescribe el archivo compartido: sólo desde lo que hay en disco
+                self._compactar()
+        return len(nuevas)
+
+    def __contains__(self, patente):
+        with self._lock:
+            self._recargar()
+            fecha = self._entregas.get(patente)
+        return fecha is not None and fecha >= self._limite()
+
+    def patentes(self):
+        limite = self._limite()
+        with self._lock:
+            self._recargar()
+            return {p for p, f in self._entregas.items() if f >= limite}
+
+# --- SNAPSHOTS Y CLI ---
+def escribir_snapshot(df_origen, tipo, directorio=RUTA_SNAPSHOTS):
+    # Un archivo por versión de contenido; si ya existe no se reescribe
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{tipo}_{df_origen.attrs.get('version') or huella_frame(df_origen)}.pkl")
+    if not os.path.exists(ruta):
+        temporal = f"{ruta}.tmp"
+        df_origen.to_pickle(temporal)
+        os.replace(temporal, ruta)
+    return ruta
+
+# --- SNAPSHOTS COMPARTIDOS ENTRE PROCESOS (ARROW IPC) ---
+# Con varios procesos de Streamlit en el mismo host, uno solo descarga y publica <tipo>_<versión>.arrow y
+# después reemplaza el puntero <tipo>.json (os.replace es atómico). El resto mapea el archivo en memoria
+# de sólo lectura: las páginas las comparte el SO, así que hay una copia por host y no una por proceso.
+# Las columnas de texto (str de pyarrow) quedan sobre el mapa; fechas y numéricas con nulos se materializan.
+TTL_SNAPSHOTS_ARROW = 300
+SEGUNDOS_CANDADO_PUBLICACION = 120
+ESPERA_PRIMERA_PUBLICACION = 30
+ARROW_A_CONSERVAR = 3
+
+def leer_puntero_arrow(tipo, directorio=RUTA_SNAPSHOTS_ARROW):
+    try:
+        with open(os.path.join(directorio, f"{tipo}.json"), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+def _escribir_puntero_arrow(tipo, puntero, directorio):
+    ruta = os.path.join(directorio, f"{tipo}.json")
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f: json.dump(puntero, f)
+    os.replace(temporal, ruta)
+
+def invalidar_snapshot_arrow(tipo, directorio=RUTA_SNAPSHOTS_ARROW):
+    # Tras escribir en la planilla: el próximo pedido (de cualquier proceso) vuelve a descargar
+    try: os.remove(os.path.join(directorio, f"{tipo}.json"))
+    except FileNotFoundError: pass
+
+def publicar_snapshot_arrow(df_origen, tipo, directorio=RUTA_SNAPSHOTS_ARROW):
+    import pyarrow as pa  # diferido: no suma al arranque de app.py
+    os.makedirs(directorio, exist_ok=True)
+    version = df_origen.attrs.get('version') or huella_frame(df_origen)
+    archivo = f"{tipo}_{version}.arrow"
+    ruta = os.path.join(directorio, archivo)
+    if not os.path.exists(ruta):
+        # Los attrs (versión, columnas de la hoja, avisos) viajan en la metadata del esquema
+        tabla = pa.Table.from_pandas(df_origen, preserve_index=False)
+        tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}), b'taller_attrs': json.dumps({**df_origen.attrs, 'version': version}).encode()})
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with pa.OSFile(temporal, 'wb') as destino, pa.ipc.new_file(destino, tabla.schema) as escritor: escritor.write_table(tabla)
+        os.replace(temporal, ruta)
+    _escribir_puntero_arrow(tipo, {'version': version, 'archivo': archivo, 'filas': len(df_origen), 'publicado': time.time()}, directorio)
+
+    # Las versiones viejas se borran; un proceso que todavía las tenga mapeadas conserva el inodo hasta soltarlo
+    previos = sorted((e for e in os.scandir(directorio) if e.name.startswith(f"{tipo}_") and e.name.endswith(".arrow") and e.name != archivo), key=lambda e: e.stat().st_mtime)
+    for entrada in previos[:max(len(previos) - (ARROW_A_CONSERVAR - 1), 0)]:
+        try: os.remove(entrada.path)
+        except OSError: pass
+    return version
+
+def abrir_snapshot_arrow(tipo, version, directorio=RUTA_SNAPSHOTS_ARROW):
+    import pyarrow as pa
+    # El mapa queda abierto mientras viva el frame: sus buffers lo referencian
+    tabla = pa.ipc.open_file(pa.memory_map(os.path.join(directorio, f"{tipo}_{version}.arrow"), 'r')).read_all()
+    df_mapeado = tabla.to_pandas(split_blocks=True)
+    df_mapeado.attrs.update(json.loads((tabla.schema.metadata or {}).get(b'taller_attrs', b'{}')))
+    return df_mapeado
+
+@contextmanager
+def candado_archivo(ruta, espera=10.0, vencimiento=30.0):
+    # Candado bloqueante entre procesos con O_EXCL para escrituras cortas; si quedó huérfano se pisa pasado el plazo
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)); break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(ruta) > vencimiento: os.remove(ruta); continue
+            except FileNotFoundError: continue
+            if time.monotonic() > limite: raise TimeoutError(f"No se pudo tomar el candado {ruta}")
+            time.sleep(0.002)
+    try: yield
+    finally:
+        try: os.remove(ruta)
+        except FileNotFoundError: pass
+
+@contextmanager
+def candado_publicacion(tipo, directorio=RUTA_SNAPSHOTS_ARROW):
+    # Candado entre procesos con O_EXCL; si quedó huérfano (proceso muerto) se pisa pasado el plazo
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{tipo}.lock")
+    obtenido = False
+    for _ in range(2):
+        try:
+            os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)); obtenido = True; break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(ruta) < SEGUNDOS_CANDADO_PUBLICACION: break
+                os.remove(ruta)
+            except FileNotFoundError: pass
+    try: yield obtenido
+    finally:
+        if obtenido:
+            try: os.remove(ruta)
+            except FileNotFoundError: pass
+
+def asegurar_snapshot_arrow(tipo, cargador, ttl=TTL_SNAPSHOTS_ARROW, directorio=RUTA_SNAPSHOTS_ARROW):
+    """Devuelve (puntero, df_local): el puntero al snapshot vigente, publicándolo si está vencido y este proceso
+    gana el candado. df_local sólo viene cuando no hay nada publicado y hubo que cargar sin compartir."""
+    puntero = leer_puntero_arrow(tipo, directorio)
+    if puntero is not None and time.time() - puntero['publicado'] <= ttl: return puntero, None
+
+    with candado_publicacion(tipo, directorio) as publicador:
+        if publicador:
+            # Otro proceso pudo haber publicado mientras esperábamos el candado
+            puntero = leer_puntero_arrow(tipo, directorio)
+            if puntero is not None and time.time() - puntero['publicado'] <= ttl: return puntero, None
+            df_nuevo = cargador()
+            if df_nuevo.empty:
+                # Falló la descarga: se sigue sirviendo la versión anterior (sin reintentar hasta el próximo TTL)
+                if puntero is None: return None, df_nuevo
+                _escribir_puntero_arrow(tipo, {**puntero, 'publicado': time.time()}, directorio)
+                return puntero, None
+            publicar_snapshot_arrow(df_nuevo, tipo, directorio)
+            return leer_puntero_arrow(tipo, directorio), None
+
+    # Otro proceso está publicando: mientras tanto sirve lo anterior o, si es la primera vez, lo espera
+    limite = time.time() + ESPERA_PRIMERA_PUBLICACION
+    while puntero is None and time.time() < limite:
+        time.sleep(0.2)
+        puntero = leer_puntero_arrow(tipo, directorio)
+    return (puntero, None) if puntero is not None else (None, cargador())
+
+# --- HISTORIAL DIARIO DE ESTADOS (DELTAS EN PARQUET) ---
+# La planilla sólo tiene el estado actual. Una vez por día (y en cada versión nueva del maestro) se guarda un
+# parquet con las filas que cambiaron respecto del día anterior, más las bajas; estados_actual.parquet tiene el
+# estado completo para comparar sin reconstruir. Un vehículo es (Grupo, Patente, Fecha_Ingreso): un regreso al
+# taller es otro vehículo.
+CLAVES_HISTORIAL = ['Grupo', 'Patente', 'Fecha_Ingreso']
+CAMPOS_HISTORIAL = ['Estado_Taller', 'Fase_Taller', 'Paños']
+BAJA_HISTORIAL = "(BAJA)"
+
+def estado_vehiculos(df_maestro):
+    d = pd.DataFrame({
+        'Grupo': df_maestro['Grupo'].fillna(""), 'Patente': normalizar_patente(df_maestro['Patente']),
+        'Fecha_Ingreso': pd.to_datetime(df_maestro['Fecha_Ingreso'], errors='coerce').astype('datetime64[ms]'),
+        'Estado_Taller': df_maestro['Estado_Taller'].fillna(""), 'Fase_Taller': df_maestro['Fase_Taller'].fillna(""),
+        'Paños': df_maestro['Paños'].fillna(0).astype('float32')
+    })
+    return d[d['Patente'] != ""].drop_duplicates(CLAVES_HISTORIAL, keep='last').reset_index(drop=True)
+
+def _escribir_parquet(df_origen, ruta):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    df_origen.to_parquet(temporal, index=False, compression='zstd')
+    os.replace(temporal, ruta)
+
+def leer_puntero_historial(directorio=RUTA_HISTORIAL_ESTADOS):
+    try:
+        with open(os.path.join(directorio, "historial.json"), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+def registrar_estado_diario(df_maestro, dia=None, directorio=RUTA_HISTORIAL_ESTADOS):
+    """Guarda el delta del día contra el último estado registrado. Se puede llamar varias veces en el mismo día:
+    el delta del día se combina (gana el último valor). Devuelve el puntero del historial."""
+    dia = (dia or date.today()).isoformat()
+    actual = estado_vehiculos(df_maestro)
+    with candado_publicacion('historial', directorio) as publicador:
+        puntero = leer_puntero_historial(directorio)
+        if not publicador or (puntero and puntero['ultimo_dia'] > dia): return puntero
+        ruta_actual = os.path.join(directorio, "estados_actual.parquet")
+        previo = pd.read_parquet(ruta_actual) if puntero else actual.iloc[:0]
+
+        comparado = actual.merge(previo, on=CLAVES_HISTORIAL, how='outer', suffixes=('', '_previo'), indicator=True)
+        distinto = np.logical_or.reduce([(comparado[c] != comparado[f"{c}_previo"]).to_numpy() for c in CAMPOS_HISTORIAL])
+        cambios = comparado[(comparado['_merge'] == 'left_only') | ((comparado['_merge'] == 'both') & distinto)][CLAVES_HISTORIAL + CAMPOS_HISTORIAL]
+        bajas = comparado[comparado['_merge'] == 'right_only']
+        bajas = bajas[CLAVES_HISTORIAL].assign(**{c: bajas[f"{c}_previo"] for c in CAMPOS_HISTORIAL})
+        delta = pd.concat([cambios.assign(Baja=False), bajas.assign(Baja=True)], ignore_index=True)
+
+        ruta_dia = os.path.join(directorio, f"estados_{dia}.parquet")
+        if os.path.exists(ruta_dia): delta = pd.concat([pd.read_parquet(ruta_dia), delta], ignore_index=True).drop_duplicates(CLAVES_HISTORIAL, keep='last')
+        if not delta.empty or not os.path.exists(ruta_dia): _escribir_parquet(delta, ruta_dia)
+        _escribir_parquet(actual, ruta_actual)
+        puntero = {'ultimo_dia': dia, 'primer_dia': (puntero or {}).get('primer_dia', dia), 'vehiculos': len(actual), 'cambios_dia': len(delta), 'actualizado': time.time()}
+        temporal = os.path.join(directorio, f"historial.json.{os.getpid()}.tmp")
+        with open(temporal, 'w', encoding='utf-8') as f: json.dump(puntero, f)
+        os.replace(temporal, os.path.join(directorio, "historial.json"))
+        return puntero
+
+def leer_historial(directorio=RUTA_HISTORIAL_ESTADOS):
+    import pyarrow as pa, pyarrow.parquet as pq  # diferido: no suma al arranque de app.py
+    archivos = sorted(e.name for e in os.scandir(directorio) if e.name.startswith("estados_2") and e.name.endswith(".parquet")) if os.path.isdir(directorio) else []
+    if not archivos: return pd.DataFrame({'Dia': pd.Series(dtype='datetime64[ms]'), 'Grupo': pd.Series(dtype=str), 'Patente': pd.Series(dtype=str), 'Fecha_Ingreso': pd.Series(dtype='datetime64[ms]'),
+                                          'Estado_Taller': pd.Series(dtype=str), 'Fase_Taller': pd.Series(dtype=str), 'Paños': pd.Series(dtype='float32'), 'Baja': pd.Series(dtype=bool)})
+    tablas = [pq.read_table(os.path.join(directorio, a)) for a in archivos]
+    dias = np.repeat(pd.to_datetime([a[len("estados_"):-len(".parquet")] for a in archivos]).to_numpy(), [t.num_rows for t in tablas])
+    historial = pa.concat_tables(tablas, promote_options='default').to_pandas()
+    historial.insert(0, 'Dia', dias)
+    return historial
+
+def _tramos(h, columna, hoy):
+    # Un tramo empieza cuando el vehículo aparece o cambia `columna`; termina en el próximo cambio (o sigue abierto)
+    valor = h[columna].where(~h['Baja'], BAJA_HISTORIAL)
+    inicio = (h['Id'] != h['Id'].shift()) | (valor != valor.shift())
+    tramos = h.loc[inicio, ['Id', 'Dia', 'Grupo', 'Fecha_Ingreso', 'Paños']].assign(Valor=valor[inicio])
+    siguiente = tramos['Dia'].shift(-1).where(tramos['Id'] == tramos['Id'].shift(-1))
+    tramos['Abierto'] = siguiente.isna()
+    tramos['Dias'] = (siguiente.fillna(hoy) - tramos['Dia']).dt.days
+    tramos['Previo'] = tramos['Valor'].shift().where(tramos['Id'] == tramos['Id'].shift())
+    return tramos[tramos['Valor'] != BAJA_HISTORIAL]
+
+def _permanencia(tramos, columna):
+    cerrados = tramos[~tramos['Abierto']].groupby('Valor')['Dias']
+    abiertos = tramos[tramos['Abierto']].groupby('Valor')['Dias']
+    return pd.DataFrame({
+        'Tramos': cerrados.size(), 'Dias_Promedio': cerrados.mean(), 'Dias_Mediana': cerrados.median(), 'Dias_P90': cerrados.quantile(0.9),
+        'Abiertos': abiertos.size(), 'Dias_Abiertos_Promedio': abiertos.mean()
+    }).fillna({'Tramos': 0, 'Abiertos': 0}).astype({'Tramos': int, 'Abiertos': int}).rename_axis(columna).reset_index()
+
+def analizar_historial(historial, hoy=None):
+    """Permanencia por Fase_Taller y Estado_Taller, entregas por grupo y semana, y lead time de ingreso a entrega.
+    Los tramos que ya estaban abiertos el primer día del historial no cuentan: no se sabe cuándo empezaron."""
+    hoy = pd.Timestamp(hoy or date.today())
+    h = historial.assign(Id=historial.groupby(CLAVES_HISTORIAL, dropna=False, sort=False).ngroup()).sort_values(['Id', 'Dia'], kind='stable')
+    primer_dia = h['Dia'].min()
+    fases, estados = _tramos(h, 'Fase_Taller', hoy), _tramos(h, 'Estado_Taller', hoy)
+    fases, estados = fases[fases['Dia'] > primer_dia], estados[estados['Dia'] > primer_dia]
+
+    entregado = estados['Valor'].str.contains("ENTREGADO")
+    entregas = estados[entregado & ~estados['Previo'].fillna("").str.contains("ENTREGADO")].drop_duplicates('Id')
+    entregas = entregas.assign(Semana=entregas['Dia'].dt.to_period('W').dt.start_time, Lead_Time=(entregas['Dia'] - entregas['Fecha_Ingreso']).dt.days)
+    rendimiento = entregas.groupby(['Semana', 'Grupo']).agg(Autos=('Id', 'size'), Paños=('Paños', 'sum')).reset_index()
+    lead = entregas.dropna(subset=['Lead_Time']).groupby('Grupo')['Lead_Time']
+    lead_time = pd.DataFrame({'Entregados': lead.size(), 'Dias_Promedio': lead.mean(), 'Dias_Mediana': lead.median(), 'Dias_P90': lead.quantile(0.9)}).reset_index()
+    return {'fases': _permanencia(fases, 'Fase_Taller'), 'estados': _permanencia(estados, 'Estado_Taller'), 'rendimiento': rendimiento, 'lead_time': lead_time,
+            'dias': int(h['Dia'].nunique()), 'vehiculos': int(h['Id'].nunique())}
+
+def _imprimir_kpis(df_maestro, mes_filtro, termino):
+    pd.set_option('display.width', 160)
+    resumen = resumen_facturacion(df_maestro, mes_filtro, termino)
+    print(f"== Facturación ({mes_filtro}) ==")
+    print(resumen.to_string() if not resumen.empty else "(sin datos)")
+    for columna in ['Asesor', 'Grupo']:
+        print(f"\n== KPI por {columna} ==")
+        kpi = kpi_por(df_maestro, columna, mes_filtro, termino)
+        print(kpi.to_string(index=False) if not kpi.empty else "(sin datos)")
+
+# --- BENCHMARK DE PARSEO CSV ---
+# Cada caso corre en un subproceso propio para que el RSS y el pico de memoria no se contaminen entre sí
+def csv_sintetico(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 365, filas), unit='D')
+    d = pd.DataFrame({
+        'INGRESO': fechas.strftime('%d/%m/%Y'), 'PATENTE': [f"AB{i:06d}" for i in range(filas)],
+        'VEHICULO': rng.choice(['FIAT CRONOS', 'VW GOL', 'TOYOTA HILUX', 'FORD RANGER'], filas),
+        'ASESOR': rng.choice(ASESORES_LISTA, filas), 'PAÑOS': rng.integers(0, 12, filas).astype(str),
+        'PRECIO': [f"$ {p:,}".replace(',', '.') for p in rng.integers(0, 900, filas) * 1000],
+        'TICKET': rng.choice(['', '00123', '04567'], filas), 'PROMESA': (fechas + pd.Timedelta(days=7)).strftime('%d/%m/%Y'),
+        'CLIENTE': rng.choice(['AUTOSOL', 'CIEL', 'PARTICULAR'], filas), 'N° CHASIS': [f"9BW{i:09d}" for i in range(filas)],
+        'ESTADO': rng.choice(['EN PROCESO', 'DETENIDO', 'ENTREGADO'], filas), 'FAC': rng.choice(['FAC', 'SI', ''], filas),
+        'OBSERVACIONES': rng.choice(['', 'cliente pide "urgente", llamar', 'falta repuesto\nllega el lunes'], filas),
+    })
+    return ("titulo" + "," * (len(d.columns) - 1) + "\n" + d.to_csv(index=False)).encode()
+
+def _caso_bench_csv(motor, ruta, repeticiones):
+    import pyarrow.csv  # noqa: F401  (los dos motores arrancan con pyarrow ya importado)
+    with open(ruta, 'rb') as f: cuerpo = f.read()
+    rss_previo = memoria_rss_mb()
+    tiempos = []
+    for i in range(repeticiones):
+        t0 = time.perf_counter()
+        d = leer_csv(cuerpo, encabezado=False, motor=motor)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        if i == 0: rss_resultado, frame_mb = memoria_rss_mb() - rss_previo, d.memory_usage(deep=True).sum() / 2**20
+        del d
+    print(json.dumps({'ms': round(min(tiempos), 1), 'rss_mb': round(rss_resultado, 1), 'frame_mb': round(frame_mb, 1)}))
+
+def bench_csv(tamanos, repeticiones=3):
+    import tempfile
+    print(f"{'filas':>8} {'motor':>8} {'MB csv':>7} {'ms':>9} {'RSS MB':>7} {'frame MB':>9}")
+    for filas in tamanos:
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f: f.write(csv_sintetico(filas))
+        try:
+            for motor in ('pandas', 'pyarrow'):
+                salida = subprocess.run([sys.executable, os.path.abspath(__file__), "bench-csv", "--caso", motor, f.name, "--repeticiones", str(repeticiones)],
+                                        capture_output=True, text=True, check=True).stdout
+                r = json.loads(salida.strip().splitlines()[-1])
+                print(f"{filas:>8} {motor:>8} {os.path.getsize(f.name) / 2**20:>7.1f} {r['ms']:>9.1f} {r['rss_mb']:>7.1f} {r['frame_mb']:>9.1f}")
+        finally: os.remove(f.name)
+    return 0
+
+# --- BENCHMARK DEL DIFF DE EDITORES ---
+def turnos_sinteticos(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        'Fecha': list((pd.Timestamp('2026-03-01') + pd.to_timedelta(rng.integers(0, 60, filas), unit='D')).date),
+        'Patente': [f"AB{i:06d}" for i in range(filas)], 'Asesor': rng.choice(ASESORES_LISTA, filas),
+        'Ticket': rng.choice(['', '00123', '04567 '], filas), 'Referencia': rng.choice(['', 'R-1'], filas),
+        'Observaciones': rng.choice(['', 'llamar antes'], filas), 'Recibido': rng.random(filas) < 0.5, 'Fotos': rng.random(filas) < 0.5,
+        'Cancelado': False, 'Motivo_Cancelacion': '', 'Eliminar': False})
+
+def _diferencias_por_fila(original, editado):
+    # Lo que hacían los botones de guardado antes: iterrows y una cadena de comparaciones por fila
+    cambiadas = []
+    for idx, row in editado.iterrows():
+        row_orig = original.loc[idx]
+        if (row['Fecha'] != row_orig['Fecha'] or row['Recibido'] != row_orig['Recibido'] or row['Fotos'] != row_orig['Fotos'] or
+            str(row['Ticket']).strip() != str(row_orig['Ticket']).strip() or str(row['Referencia']).strip() != str(row_orig['Referencia']).strip() or
+            row['Asesor'] != row_orig['Asesor'] or row['Cancelado'] != row_orig['Cancelado'] or
+            str(row.get('Motivo_Cancelacion', '')) != str(row_orig.get('Motivo_Cancelacion', '')) or
+            str(row.get('Observaciones', '')) != str(row_orig.get('Observaciones', ''))): cambiadas.append(idx)
+    return cambiadas
+
+def bench_diff(tamanos, fraccion_editada=0.01, repeticiones=3):
+    print(f"{'filas':>8} {'editadas':>9} {'por fila ms':>12} {'vectorizado ms':>15} {'celdas':>7}")
+    for filas in tamanos:
+        original = turnos_sinteticos(filas)
+        editado = original.copy()
+        rng = np.random.default_rng(1)
+        tocadas = rng.choice(filas, max(1, int(filas * fraccion_editada)), replace=False)
+        editado.loc[tocadas, 'Recibido'] = ~editado.loc[tocadas, 'Recibido']
+        editado.loc[tocadas[::2], 'Ticket'] = "99999"
+        tiempos = {}
+        for nombre, funcion in (('fila', lambda: _diferencias_por_fila(original, editado)), ('vector', lambda: diferenciar_ediciones(original, editado, COMPARACION_TURNOS))):
+            muestras = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter(); resultado = funcion(); muestras.append((time.perf_counter() - t0) * 1000)
+            tiempos[nombre] = (min(muestras), resultado)
+        assert sorted(tiempos['fila'][1]) == sorted(tiempos['vector'][1]['idx'].unique())
+        print(f"{filas:>8} {len(tocadas):>9} {tiempos['fila'][0]:>12.1f} {tiempos['vector'][0]:>15.1f} {len(tiempos['vector'][1]):>7}")
+    return 0
+
+# --- BENCHMARK DE SESIONES CONCURRENTES (TURNOS COMPARTIDOS VS COPIA POR SESIÓN) ---
+def _rerun_turnos(df_turnos, asesor, copiar):
+    # Lo que hace cada rerun con los turnos: antes una .copy() para mostrar; ahora se filtra el frame publicado
+    df_display = df_turnos.copy() if copiar else df_turnos
+    return df_display[df_display['Fecha'].between(date(2026, 3, 10), date(2026, 3, 20)) & (df_display['Asesor'] == asesor)]
+
+def _memoria_asignada():
+    import pyarrow as pa
+    import tracemalloc
+    return tracemalloc.get_traced_memory()[0] + pa.total_allocated_bytes()  # Las columnas str viven en el pool de Arrow
+
+def _sesiones_concurrentes(modo, publicado, sesiones, reruns):
+    import pickle
+    from concurrent.futures import ThreadPoolExecutor
+    almacen = AlmacenTurnos()
+    estados = [{} for _ in range(sesiones)]
+    latencias = {'carga': [], 'rerun': []}
+    def sesion(n):
+        estado = estados[n]
+        for _ in range(reruns):
+            t0 = time.perf_counter()
+            if modo == "copia":
+                # st.cache_data entrega a cada sesión su propia copia (pickle) y la sesión la guardaba en session_state
+                tipo = 'rerun' if 'memoria_turnos' in estado else 'carga'
+                if tipo == 'carga': estado['memoria_turnos'] = pickle.loads(pickle.dumps(publicado))
+                _rerun_turnos(estado['memoria_turnos'], ASESORES_LISTA[n % len(ASESORES_LISTA)], True)
+            else:
+                df_turnos = almacen.obtener(estado.get('memoria_turnos_version'))
+                tipo = 'rerun' if df_turnos is not None else 'carga'
+                if tipo == 'carga': estado['memoria_turnos_version'], df_turnos = almacen.publicar(pickle.loads(pickle.dumps(publicado)))
+                _rerun_turnos(df_turnos, ASESORES_LISTA[n % len(ASESORES_LISTA)], False)
+            latencias[tipo].append((time.perf_counter() - t0) * 1000)
+    with ThreadPoolExecutor(sesiones) as ejecutor: list(ejecutor.map(sesion, range(sesiones)))
+    return (almacen, estados), latencias
+
+def _caso_bench_sesiones(modo, publicado, sesiones, reruns):
+    import gc, tracemalloc
+    _, latencias = _sesiones_concurrentes(modo, publicado, sesiones, reruns)  # Latencias sin tracemalloc (lo frena)
+    gc.collect(); tracemalloc.start(); antes = _memoria_asignada()
+    try:
+        retenido, _ = _sesiones_concurrentes(modo, publicado, sesiones, reruns)
+        gc.collect(); retenida = _memoria_asignada() - antes
+    finally: tracemalloc.stop()
+    del retenido  # Estado de las sesiones y, en modo compartido, el almacén del proceso
+    return retenida / sesiones / 2**20, np.median(latencias['carga']), *np.percentile(latencias['rerun'], [50, 95])
+
+def bench_sesiones(sesiones=20, filas=5000, reruns=5):
+    publicado = turnos_sinteticos(filas)
+    publicado.attrs['version'] = huella_frame(publicado)
+    print(f"{sesiones} sesiones concurrentes x {reruns} reruns, {filas} turnos")
+    print(f"{'modo':>12} {'MB retenidos/sesión':>20} {'carga p50 ms':>13} {'rerun p50 ms':>13} {'rerun p95 ms':>13}")
+    for modo in ("copia", "compartido"):
+        mb, carga, p50, p95 = _caso_bench_sesiones(modo, publicado, sesiones, reruns)
+        print(f"{modo:>12} {mb:>20.2f} {carga:>13.1f} {p50:>13.1f} {p95:>13.1f}")
+    return 0
+
+# --- BENCHMARK DEL HISTORIAL DE ESTADOS ---
+FASES_SINTETICAS = ['DESARME', 'CHAPA', 'PREPARACION', 'PINTURA', 'ARMADO', 'PULIDO']
+
+def maestros_diarios_sinteticos(vehiculos, dias, semilla=0):
+    # Cada vehículo entra un día, recorre las fases (a veces detenido), espera la entrega y sale de la planilla a los 30 días
+    rng = np.random.default_rng(semilla)
+    inicio = pd.Timestamp('2026-01-01')
+    entrada = rng.integers(-20, dias, vehiculos)
+    duraciones = np.column_stack([rng.integers(1, 6, (vehiculos, len(FASES_SINTETICAS))), rng.integers(1, 4, vehiculos), np.full(vehiculos, 30)])
+    limites = entrada[:, None] + np.cumsum(duraciones, axis=1)
+    detenido = rng.random(vehiculos) < 0.15
+    base = pd.DataFrame({'Grupo': rng.choice(['GRUPO UNO', 'GRUPO DOS', 'GRUPO TRES'], vehiculos), 'Patente': [f"AB{i:06d}" for i in range(vehiculos)],
+                         'Fecha_Ingreso': (inicio + pd.to_timedelta(entrada, unit='D')).date, 'Paños': rng.integers(1, 12, vehiculos).astype(float)})
+    fases = np.array(FASES_SINTETICAS + ['', ''])
+    for dia in range(dias):
+        etapa = (dia >= limites).sum(axis=1)
+        presente = (entrada <= dia) & (etapa < duraciones.shape[1])
+        estado = np.where(etapa < len(FASES_SINTETICAS), np.where(detenido & (etapa == 2), "DETENIDO", "EN PROCESO"),
+                          np.where(etapa == len(FASES_SINTETICAS), "TERM PEND ENTREG", "ENTREGADO"))
+        yield (inicio + pd.Timedelta(days=dia)).date(), base[presente].assign(Estado_Taller=estado[presente], Fase_Taller=fases[etapa[presente]])
+
+def bench_historial(vehiculos, dias):
+    import shutil, tempfile
+    directorio = tempfile.mkdtemp(prefix="historial_")
+    try:
+        t0 = time.perf_counter()
+        filas_completas = 0
+        for dia, df_dia in maestros_diarios_sinteticos(vehiculos, dias):
+            registrar_estado_diario(df_dia, dia, directorio)
+            filas_completas += len(df_dia)
+        ms_registro = (time.perf_counter() - t0) * 1000
+        deltas = [e for e in os.scandir(directorio) if e.name.startswith("estados_2")]
+        t0 = time.perf_counter(); historial = leer_historial(directorio); ms_lectura = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter(); analisis = analizar_historial(historial, pd.Timestamp('2026-01-01') + pd.Timedelta(days=dias)); ms_analisis = (time.perf_counter() - t0) * 1000
+        print(f"{dias} días, {vehiculos} vehículos: {filas_completas} filas en snapshots completos -> {len(historial)} filas en deltas "
+              f"({sum(e.stat().st_size for e in deltas) / 1024:.0f} KB en {len(deltas)} archivos)")
+        print(f"registro {ms_registro / dias:.1f} ms/día | lectura {ms_lectura:.0f} ms | análisis {ms_analisis:.0f} ms")
+        print(analisis['fases'].to_string(index=False))
+        print(analisis['lead_time'].to_string(index=False))
+    finally: shutil.rmtree(directorio, ignore_errors=True)
+    return 0
+
+# Módulos que app.py debe importar recién al primer uso, y presupuesto del arranque en frío
+MODULOS_DIFERIDOS = ('plotly.express', 'gspread')
+PRESUPUESTO_IMPORTS_MS = 1500
+
+def imports_de_nivel_superior(ruta_script):
+    arbol = ast.parse(open(ruta_script, encoding='utf-8').read())
+    modulos = []
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Import): modulos += [a.name for a in nodo.names]
+        elif isinstance(nodo, ast.ImportFrom) and nodo.level == 0: modulos.append(nodo.module)
+    return list(dict.fromkeys(modulos))
+
+def medir_imports(modulos, directorio):
+    # -X importtime escribe "import time: self [us] | cumulative [us] | módulo" en stderr; la indentación marca el anidamiento
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modulos)}"],
+                            cwd=directorio, capture_output=True, text=True, check=True).stderr
+    tiempos = {}
+    for linea in salida.splitlines():
+        partes = linea.split("|")
+        if len(partes) != 3 or not partes[1].strip().isdigit(): continue
+        tiempos.setdefault(partes[2].strip(), (int(partes[1]) / 1000, len(partes[2]) - len(partes[2].lstrip()) <= 1))
+    return tiempos
+
+def verificar_arranque(ruta_script, presupuesto_ms=PRESUPUESTO_IMPORTS_MS):
+    modulos = imports_de_nivel_superior(ruta_script)
+    tiempos = medir_imports(modulos, os.path.dirname(os.path.abspath(ruta_script)))
+    raices = sorted(((ms, m) for m, (ms, es_raiz) in tiempos.items() if es_raiz), reverse=True)
+    total_ms = sum(ms for ms, _ in raices)
+    print(f"Imports de nivel superior de {os.path.basename(ruta_script)}: {', '.join(modulos)}")
+    for ms, m in raices[:10]: print(f"  {ms:8.1f} ms  {m}")
+    print(f"Total: {total_ms:.0f} ms (presupuesto {presupuesto_ms} ms)")
+    problemas = [f"{m} se importa al arrancar" for m in MODULOS_DIFERIDOS if m in tiempos]
+    if total_ms > presupuesto_ms: problemas.append(f"el arranque supera el presupuesto por {total_ms - presupuesto_ms:.0f} ms")
+    for p in problemas: print(f"FALLA: {p}")
+    return 1 if problemas else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline de datos del taller (sin interfaz).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_kpis = sub.add_parser("kpis", help="Descarga, normaliza e imprime los totales de Facturación y los KPI por asesor y grupo")
+    p_kpis.add_argument("--mes", default=datetime.now().strftime('%Y-%m'), help="YYYY-MM o TODOS (por defecto, el mes actual)")
+    p_kpis.add_argument("--busqueda", default="", help="Filtra por dominio o chasis")
+    p_snapshot = sub.add_parser("snapshot", help="Descarga, normaliza y guarda los frames en datos_locales/snapshots")
+    p_snapshot.add_argument("--arrow", action="store_true", help="Publica en datos_locales/arrow para los procesos de Streamlit")
+    p_imports = sub.add_parser("importtime", help="Mide (python -X importtime) los imports de arranque de app.py contra el presupuesto")
+    p_imports.add_argument("--script", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"))
+    p_imports.add_argument("--presupuesto-ms", type=float, default=PRESUPUESTO_IMPORTS_MS)
+    p_bench = sub.add_parser("bench-csv", help="Compara el parseo CSV de pandas y pyarrow (tiempo y memoria residente)")
+    p_bench.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000])
+    p_bench.add_argument("--repeticiones", type=int, default=3)
+    p_bench.add_argument("--caso", nargs=2, metavar=("MOTOR", "RUTA"), help=argparse.SUPPRESS)
+    p_diff = sub.add_parser("bench-diff", help="Compara el diff de editores fila por fila contra el vectorizado")
+    p_diff.add_argument("--filas", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    p_historial = sub.add_parser("historial", help="Registra el estado del día en datos_locales/historial_estados (para cron) e imprime el análisis")
+    p_historial.add_argument("--dia", type=date.fromisoformat, default=None, help="YYYY-MM-DD (por defecto, hoy)")
+    p_bench_hist = sub.add_parser("bench-historial", help="Registra un año sintético de estados diarios y mide lectura y análisis")
+    p_bench_hist.add_argument("--vehiculos", type=int, default=4000)
+    p_bench_hist.add_argument("--dias", type=int, default=365)
+    p_layout = sub.add_parser("aceptar-layout", help="Acepta la estructura nueva de las pestañas que cambiaron de cabecera (deja de avisar)")
+    p_layout.add_argument("--pestana", nargs="+", default=None)
+    p_sesiones = sub.add_parser("bench-sesiones", help="Memoria y latencia de N sesiones concurrentes: turnos compartidos vs copia por sesión")
+    p_sesiones.add_argument("--sesiones", type=int, default=20)
+    p_sesiones.add_argument("--filas", type=int, default=5000)
+    args = parser.parse_args(argv)
+    if args.comando == "bench-diff": return bench_diff(args.filas)
+    if args.comando == "aceptar-layout":
+        for aviso in avisos_cambio_layout(): print(aviso)
+        print(f"Aceptadas: {', '.join(aceptar_layout(args.pestana)) or 'ninguna (no había cambios pendientes)'}")
+        return 0
+    if args.comando == "bench-sesiones": return bench_sesiones(args.sesiones, args.filas)
+    if args.comando == "bench-historial": return bench_historial(args.vehiculos, args.dias)
+    if args.comando == "importtime": return verificar_arranque(args.script, args.presupuesto_ms)
+    if args.comando == "bench-csv":
+        if args.caso: return _caso_bench_csv(args.caso[0], args.caso[1], args.repeticiones) or 0
+        return bench_csv(args.filas, args.repeticiones)
+
+    medicion = MedicionRerun()
+    activar_medicion(medicion)
+    with medicion.etapa("carga_turnos"): df_turnos = cargar_turnos()
+    with medicion.etapa("carga_maestro"): df_maestro = cargar_maestro()
+    for aviso in avisos_cambio_layout() + df_maestro.attrs.get('avisos_layout', []): print(f"AVISO: {aviso}")
+    if df_maestro.empty:
+        print("No se pudieron cargar datos de la planilla.")
+        return 1
+
+    if args.comando == "kpis":
+        with medicion.etapa("kpis"): _imprimir_kpis(df_maestro, args.mes, args.busqueda.upper().strip())
+    elif args.comando == "historial":
+        with medicion.etapa("historial"):
+            puntero = registrar_estado_diario(df_maestro, args.dia)
+            # Sin puntero: otro proceso tiene el candado y todavía no terminó la primera publicación
+            if puntero is None: print("Historial: publicación en curso (otro proceso tiene el candado); no hay historial para analizar todavía")
+            else:
+                print(f"Historial: {puntero['cambios_dia']} cambios el {puntero['ultimo_dia']} ({puntero['vehiculos']} vehículos, desde el {puntero['primer_dia']})")
+                analisis = analizar_historial(leer_historial())
+                for clave in ('fases', 'estados', 'lead_time'): print(f"\n== {clave} ==\n" + analisis[clave].to_string(index=False))
+    else:
+        with medicion.etapa("snapshot"):
+            for tipo, df_origen in (('turnos', df_turnos), ('vehiculos', df_maestro)):
+                if args.arrow: print(f"{tipo}: {len(df_origen)} filas -> {tipo}_{publicar_snapshot_arrow(df_origen, tipo)}.arrow")
+                else: print(f"{tipo}: {len(df_origen)} filas -> {escribir_snapshot(df_origen, tipo)}")
+    print("\n" + " | ".join(f"{e['etapa']} {e['ms']:.0f} ms" for e in medicion.etapas) + f" | llamadas a Sheets: {sum(medicion.llamadas_api.values())}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
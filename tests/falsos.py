@@ -0,0 +1,90 @@
+"""Planilla TURNOS en memoria para las pruebas: la parte de la API de gspread que usa escribir_turnos y,
+con servidor_exportacion, su exportación CSV por HTTP (lo que lee descargar_csv)."""
+import csv
+import io
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from datos_taller import COLUMNAS_TURNOS_HOJA, firma_turno
+
+class HojaFalsa:
+    """La planilla también es `spreadsheet` (borrado de filas). Cada llamada demora `latencia` s para que
+    escrituras sin orden se pisen como en la real."""
+    id = 0
+
+    def __init__(self, filas, latencia=0.0):
+        self.filas = [list(f) for f in filas]  # Sin encabezados: la fila n de la hoja es filas[n - 2]
+        self.latencia = latencia
+        self.spreadsheet = self
+        self.version = 1  # Sube con cada escritura: ETag y Last-Modified de la exportación
+        self._lock = threading.Lock()
+
+    def batch_get(self, rangos):
+        time.sleep(self.latencia)
+        with self._lock:
+            return [[list(self.filas[n - 2])] if 0 <= n - 2 < len(self.filas) else [] for n in (int(r.split(':')[0][1:]) for r in rangos)]
+
+    def get_values(self, rango):
+        time.sleep(self.latencia)
+        with self._lock: return [list(f) for f in self.filas]
+
+    def batch_update(self, cuerpo, value_input_option=None):
+        time.sleep(self.latencia)
+        with self._lock:
+            self.version += 1
+            if isinstance(cuerpo, dict):  # spreadsheet.batch_update: borrado de filas
+                for pedido in cuerpo['requests']: del self.filas[pedido['deleteDimension']['range']['startIndex'] - 1]
+                return
+            for actualizacion in cuerpo:
+                columna, n = actualizacion['range'][0], int(actualizacion['range'][1:])
+                self.filas[n - 2][COLUMNAS_TURNOS_HOJA.index(columna)] = actualizacion['values'][0][0]
+
+    def exportar_csv(self):
+        with self._lock:
+            salida = io.StringIO()
+            csv.writer(salida, lineterminator="\n").writerows([ENCABEZADO_TURNOS] + self.filas)
+            return salida.getvalue().encode(), self.version
+
+    def fila_de(self, patente):
+        with self._lock: return next((f for f in self.filas if f[4] == patente), None)
+
+ENCABEZADO_TURNOS = ["TURNO", "FECHA TURNO", "HORA TURNO", "VEHICULO", "PATENTE", "ASESOR", "PRECIO", "PAÑOS", "OBSERVACIONES", "TIEMPO ENTREGA (DIAS)",
+                     "CLIENTE", "SEGURO", "N° TICKET", "RECIBIDO", "FOTOS", "N° REFERENCIA", "MOTIVO CANCELACION"]
+
+def fila_turno(i):
+    return ["SI", "02/03/2026", "09:00", "GOL", f"AB{i:04d}CD", "CESAR OLIVA", "1000", "2", f"obs {i}", "3", "CIEL", "", "", "", "", "", ""]
+
+def cambio_leido(hoja, patente, celdas=None, eliminar=False):
+    # Como lo arma app.py al leer: fila y firma de la versión que vio la sesión
+    n, valores = next((n, f) for n, f in enumerate(hoja.filas, start=2) if f[4] == patente)
+    return {'fila': n, 'firma': firma_turno(valores), 'patente': patente, 'celdas': celdas or {}, 'eliminar': eliminar}
+
+# --- EXPORTACIÓN CSV POR HTTP ---
+# modo 'etag' / 'fecha': manda ese validador y contesta 304 si el pedido lo repite;
+# 'ignora': manda ambos pero siempre contesta 200 con el cuerpo (como la exportación de Sheets)
+def servidor_exportacion(hoja, modo):
+    class Exportacion(BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+
+        def do_GET(self):
+            cuerpo, version = hoja.exportar_csv()
+            etag, modificado = f'"v{version}"', formatdate(1_700_000_000 + version * 60, usegmt=True)
+            no_modificado = ((modo == 'etag' and self.headers.get('If-None-Match') == etag) or
+                             (modo == 'fecha' and self.headers.get('If-Modified-Since') == modificado))
+            with servidor.lock:
+                servidor.pedidos.update([304 if no_modificado else 200] + [h for h in ('If-None-Match', 'If-Modified-Since') if self.headers.get(h)])
+            self.send_response(304 if no_modificado else 200)
+            if modo in ('etag', 'ignora'): self.send_header('ETag', etag)
+            if modo in ('fecha', 'ignora'): self.send_header('Last-Modified', modificado)
+            if no_modificado: self.end_headers(); return
+            self.send_header('Content-Type', 'text/csv'); self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers(); self.wfile.write(cuerpo)
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Exportacion)
+    servidor.lock, servidor.pedidos = threading.Lock(), Counter()
+    servidor.url_base = f"http://127.0.0.1:{servidor.server_port}/export?format=csv&gid="
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
@@ -0,0 +1,76 @@
+"""descargar_csv y cargar_turnos contra la exportación CSV de una hoja en memoria servida por HTTP local."""
+from collections import Counter
+
+import pytest
+
+import datos_taller
+from datos_taller import CONTADORES_DESCARGA, descargar_csv
+from tests.falsos import HojaFalsa, fila_turno, servidor_exportacion
+
+@pytest.fixture
+def exportacion(monkeypatch):
+    # Devuelve (hoja, servidor) por modo; los validadores guardados no se comparten con otras pruebas
+    monkeypatch.setattr(datos_taller, '_VALIDADORES_CSV', {})
+    monkeypatch.setattr(datos_taller, '_TURNOS_NORMALIZADOS', {})
+    servidores = []
+    def crear(modo):
+        hoja = HojaFalsa([fila_turno(i) for i in range(50)])
+        servidores.append(servidor_exportacion(hoja, modo))
+        return hoja, servidores[-1]
+    yield crear
+    for servidor in servidores: servidor.shutdown(); servidor.server_close()
+
+def descargar(servidor, gid="0"):
+    # (cuerpo, huella, contadores de descargar_csv, pedidos vistos por el servidor) de una descarga
+    contadores, pedidos = Counter(CONTADORES_DESCARGA), Counter(servidor.pedidos)
+    cuerpo, huella = descargar_csv(f"{servidor.url_base}{gid}", timeout=5)
+    return cuerpo, huella, CONTADORES_DESCARGA - contadores, servidor.pedidos - pedidos
+
+def editar(hoja, texto):
+    hoja.batch_update([{'range': "I2", 'values': [[texto]]}])
+
+@pytest.mark.parametrize("modo, validador", [('etag', 'If-None-Match'), ('fecha', 'If-Modified-Since')])
+def test_servidor_que_honra_validadores(exportacion, modo, validador):
+    hoja, servidor = exportacion(modo)
+    cuerpo_1, huella_1, contadores, pedidos = descargar(servidor)
+    assert cuerpo_1 == hoja.exportar_csv()[0] and pedidos == Counter({200: 1}) and contadores['bytes'] == len(cuerpo_1)
+
+    # Sin cambios: 304 y se reutiliza el cuerpo anterior, sin bajar bytes
+    cuerpo_2, huella_2, contadores, pedidos = descargar(servidor)
+    assert pedidos == Counter({validador: 1, 304: 1})
+    assert (cuerpo_2, huella_2) == (cuerpo_1, huella_1) and contadores == Counter({'no_modificadas': 1})
+
+    # Cuerpo cambiado: 200 con huella nueva; sus validadores quedan para el pedido siguiente
+    editar(hoja, "editado")
+    cuerpo_3, huella_3, contadores, pedidos = descargar(servidor)
+    assert pedidos[200] == 1 and b"editado" in cuerpo_3 and huella_3 != huella_1
+    assert not contadores['no_modificadas'] and not contadores['cuerpo_igual']
+    assert descargar(servidor)[1:] == (huella_3, Counter({'no_modificadas': 1}), Counter({validador: 1, 304: 1}))
+
+def test_servidor_que_ignora_validadores(exportacion):
+    hoja, servidor = exportacion('ignora')
+    _, huella_1, _, _ = descargar(servidor)
+
+    # Se mandan los dos validadores, el servidor contesta 200 igual: el sha1 del cuerpo dice que no cambió
+    _, huella_2, contadores, pedidos = descargar(servidor)
+    assert pedidos == Counter({'If-None-Match': 1, 'If-Modified-Since': 1, 200: 1})
+    assert huella_2 == huella_1 and contadores['cuerpo_igual'] == 1
+
+    editar(hoja, "editado")
+    _, huella_3, contadores, _ = descargar(servidor)
+    assert huella_3 != huella_1 and not contadores['cuerpo_igual']
+
+def test_cargar_turnos_no_reparsea_si_no_cambio(exportacion, monkeypatch):
+    hoja, servidor = exportacion('etag')
+    monkeypatch.setattr(datos_taller, 'URL_BASE', servidor.url_base)
+    df_1 = datos_taller.cargar_turnos()
+    assert len(df_1) == 50
+
+    omitidos = CONTADORES_DESCARGA['parseos_omitidos']
+    df_2 = datos_taller.cargar_turnos()
+    assert CONTADORES_DESCARGA['parseos_omitidos'] == omitidos + 1 and servidor.pedidos[304] == 1
+    assert df_2.attrs['version'] == df_1.attrs['version']
+
+    editar(hoja, "editado")
+    df_3 = datos_taller.cargar_turnos()
+    assert df_3.attrs['version'] != df_1.attrs['version'] and "editado" in df_3['Observaciones'].tolist()
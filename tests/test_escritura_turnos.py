@@ -0,0 +1,62 @@
+"""escribir_turnos contra una hoja en memoria: filas corridas, conflictos y sesiones concurrentes."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from datos_taller import escribir_turnos
+from tests.falsos import HojaFalsa, cambio_leido, fila_turno
+
+BASE = [fila_turno(i) for i in range(400)]
+
+@pytest.fixture
+def candado(tmp_path):
+    return str(tmp_path / "turnos.lock")
+
+def test_fila_corrida_por_una_insercion(candado):
+    hoja = HojaFalsa(BASE)
+    cambio = cambio_leido(hoja, "AB0010CD", {'I': "editado"})
+    hoja.filas.insert(0, fila_turno(9000))
+    assert escribir_turnos(hoja, [cambio], ruta_candado=candado) == (1, [])
+    assert hoja.fila_de("AB0010CD")[8] == "editado" and hoja.fila_de("AB0011CD")[8] == "obs 11"
+
+def test_filas_corridas_por_un_borrado(candado):
+    hoja = HojaFalsa(BASE)
+    cambios = [cambio_leido(hoja, "AB0010CD", {'I': "editado"}), cambio_leido(hoja, "AB0020CD", eliminar=True)]
+    del hoja.filas[3]
+    assert escribir_turnos(hoja, cambios, ruta_candado=candado) == (2, [])
+    assert hoja.fila_de("AB0010CD")[8] == "editado"
+    assert hoja.fila_de("AB0020CD") is None and hoja.fila_de("AB0019CD") and hoja.fila_de("AB0021CD")
+
+def test_firma_duplicada_es_conflicto(candado):
+    # La fila original se corrió y su firma aparece dos veces: no se sabe cuál es, no se escribe nada
+    hoja = HojaFalsa(BASE)
+    cambio = cambio_leido(hoja, "AB0010CD", {'I': "editado"})
+    hoja.filas.insert(0, list(BASE[10]))
+    assert escribir_turnos(hoja, [cambio], ruta_candado=candado) == (0, ["AB0010CD"])
+    assert all(f[8] == "obs 10" for f in hoja.filas if f[4] == "AB0010CD")
+
+def test_turno_editado_por_otro_es_conflicto(candado):
+    hoja = HojaFalsa(BASE)
+    cambio = cambio_leido(hoja, "AB0010CD", {'I': "editado"})
+    hoja.filas[10][5] = "JAVIER GUTIERREZ"
+    assert escribir_turnos(hoja, [cambio], ruta_candado=candado) == (0, ["AB0010CD"])
+    assert hoja.fila_de("AB0010CD")[8] == "obs 10"
+
+@pytest.mark.parametrize("hilos", [2, 8])
+def test_sesiones_concurrentes_serializadas_por_candado_turnos(candado, hilos):
+    # Todas arman sus cambios sobre la misma versión y escriben a la vez; cada una borra un turno propio
+    # (corriendo las filas de las demás) y edita otros diez
+    hoja = HojaFalsa(BASE, latencia=0.002)
+    propios = [[f"AB{i:04d}CD" for i in range(h, len(BASE), hilos)][:11] for h in range(hilos)]
+    lotes = [[cambio_leido(hoja, p[0], eliminar=True)] + [cambio_leido(hoja, q, {'I': f"hilo {h}"}) for q in p[1:]] for h, p in enumerate(propios)]
+    barrera = threading.Barrier(hilos)
+    def sesion(lote):
+        barrera.wait()
+        return escribir_turnos(hoja, lote, ruta_candado=candado)
+    with ThreadPoolExecutor(hilos) as ejecutor: resultados = list(ejecutor.map(sesion, lotes))
+    assert resultados == [(11, [])] * hilos
+    assert len(hoja.filas) == len(BASE) - hilos
+    for h, p in enumerate(propios):
+        assert hoja.fila_de(p[0]) is None
+        assert [hoja.fila_de(q)[8] for q in p[1:]] == [f"hilo {h}"] * 10
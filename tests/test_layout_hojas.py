@@ -0,0 +1,57 @@
+"""Registro compartido de layouts de pestañas: el aviso de cambio dura hasta aceptarlo y no se pierden pestañas."""
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from datos_taller import aceptar_layout, avisos_cambio_layout, verificar_layout
+
+SIN_FALTANTES = {'faltantes': ()}
+CABECERA = ("INGRESO", "PATENTE", "ESTADO", "PRECIO")
+CABECERA_NUEVA = ("INGRESO", "PATENTE", "ESTADO", "MONTO")
+
+def test_cambio_avisa_hasta_aceptarlo(tmp_path):
+    ruta = str(tmp_path / "layouts.json")
+    assert verificar_layout("GRUPO UNO", "h1", CABECERA, SIN_FALTANTES, ruta) == []
+    assert avisos_cambio_layout(ruta) == []  # La primera vez es la referencia, no un cambio
+
+    verificar_layout("GRUPO UNO", "h2", CABECERA_NUEVA, SIN_FALTANTES, ruta)
+    for _ in range(3):  # Otras cargas (u otros workers) con la cabecera nueva siguen avisando
+        verificar_layout("GRUPO UNO", "h2", CABECERA_NUEVA, SIN_FALTANTES, ruta)
+        [aviso] = avisos_cambio_layout(ruta)
+        assert "GRUPO UNO" in aviso and "agregadas: MONTO" in aviso and "quitadas: PRECIO" in aviso
+
+    assert aceptar_layout(ruta=ruta) == ["GRUPO UNO"]
+    verificar_layout("GRUPO UNO", "h2", CABECERA_NUEVA, SIN_FALTANTES, ruta)
+    assert avisos_cambio_layout(ruta) == []
+
+def test_volver_a_la_estructura_aceptada_deja_de_avisar(tmp_path):
+    ruta = str(tmp_path / "layouts.json")
+    verificar_layout("TERCEROS", "h1", CABECERA, SIN_FALTANTES, ruta)
+    verificar_layout("TERCEROS", "h2", CABECERA_NUEVA, SIN_FALTANTES, ruta)
+    verificar_layout("TERCEROS", "h3", CABECERA_NUEVA + ("FASE",), SIN_FALTANTES, ruta)
+    [aviso] = avisos_cambio_layout(ruta)
+    assert "agregadas: MONTO, FASE" in aviso  # Contra la última aceptada, no contra la intermedia
+    verificar_layout("TERCEROS", "h1", CABECERA, SIN_FALTANTES, ruta)
+    assert avisos_cambio_layout(ruta) == []
+
+def test_aceptar_solo_las_indicadas_y_faltantes(tmp_path):
+    ruta = str(tmp_path / "layouts.json")
+    for pestana in ("GRUPO UNO", "GRUPO DOS"):
+        verificar_layout(pestana, "h1", CABECERA, SIN_FALTANTES, ruta)
+        verificar_layout(pestana, "h2", CABECERA_NUEVA, SIN_FALTANTES, ruta)
+    assert aceptar_layout(["GRUPO DOS"], ruta) == ["GRUPO DOS"]
+    assert [a.split()[2:4] for a in avisos_cambio_layout(ruta)] == [["GRUPO", "UNO"]]
+    assert verificar_layout("GRUPO DOS", "h2", CABECERA_NUEVA, {'faltantes': ('PAÑOS',)}, ruta) == ["La pestaña GRUPO DOS no tiene: PAÑOS."]
+
+def _worker(ruta, n):
+    # Cada proceso alterna la cabecera de su pestaña; el resto de las pestañas no se tiene que perder
+    for i in range(30):
+        verificar_layout(f"P{n}", f"h{i % 2}", CABECERA if i % 2 == 0 else CABECERA_NUEVA, SIN_FALTANTES, ruta)
+        avisos_cambio_layout(ruta)
+
+def test_workers_en_paralelo_no_pisan_pestanas_ajenas(tmp_path):
+    ruta = str(tmp_path / "layouts.json")
+    with ProcessPoolExecutor(4) as ejecutor: list(ejecutor.map(_worker, [ruta] * 4, range(4)))
+    with open(ruta, encoding="utf-8") as f: conocidos = json.load(f)
+    assert sorted(conocidos) == ["P0", "P1", "P2", "P3"]
+    assert all(r['huella'] == "h1" and r['anterior']['huella'] == "h0" for r in conocidos.values())
+    assert not [p for p in tmp_path.iterdir() if p.suffix in (".tmp", ".lock")]
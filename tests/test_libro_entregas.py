@@ -0,0 +1,52 @@
+"""LibroEntregas con varias instancias y varios procesos escribiendo sobre el mismo archivo."""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from datos_taller import LibroEntregas
+
+def _escritor(ruta, n_proceso, registros, lote):
+    # Cada lote se confirma tres veces para que el log crezca más rápido que las patentes y se compacte seguido
+    libro = LibroEntregas(ruta, lineas_minimas_compactacion=20)
+    for i in range(0, registros, lote):
+        patentes = [f"P{n_proceso:02d}-{j:05d}" for j in range(i, min(i + lote, registros))]
+        for _ in range(3): libro.registrar(patentes)
+    return libro.compactaciones, libro.patentes()
+
+@pytest.mark.parametrize("ronda", range(3))
+def test_escritores_en_paralelo_no_pierden_confirmaciones(tmp_path, ronda):
+    procesos, registros = 4, 300
+    ruta = str(tmp_path / "entregas.jsonl")
+    observador = LibroEntregas(ruta)  # Abierto antes: tiene que ver lo que agregan los demás procesos
+    with ProcessPoolExecutor(procesos) as ejecutor:
+        resultados = list(ejecutor.map(_escritor, [ruta] * procesos, range(procesos), [registros] * procesos, [3] * procesos))
+    esperadas = {f"P{n:02d}-{j:05d}" for n in range(procesos) for j in range(registros)}
+    assert sum(c for c, _ in resultados) > procesos  # Hubo compactaciones además de la de apertura
+    assert LibroEntregas(ruta).patentes() == esperadas
+    assert observador.patentes() == esperadas
+    for n, (_, vistas) in enumerate(resultados):
+        assert {p for p in esperadas if p.startswith(f"P{n:02d}-")} <= vistas
+
+def test_compactacion_ajena_se_detecta_por_generacion(tmp_path):
+    ruta = str(tmp_path / "entregas.jsonl")
+    atrasado, activo = LibroEntregas(ruta, lineas_minimas_compactacion=4), LibroEntregas(ruta, lineas_minimas_compactacion=4)
+    atrasado.registrar(["AA000AA"])
+    for i in range(10):
+        for _ in range(3): activo.registrar([f"BB{i:03d}BB", "AA000AA"])  # Varias compactaciones que el atrasado no ve
+    assert activo.compactaciones > 2
+    assert "BB009BB" in atrasado
+    for _ in range(20): atrasado.registrar(["CC000CC"])  # Compacta: tiene que partir de lo que hay en disco, no de su dict
+    assert atrasado.compactaciones > 1
+    assert LibroEntregas(ruta).patentes() == {"AA000AA", "CC000CC"} | {f"BB{i:03d}BB" for i in range(10)}
+
+def test_linea_truncada_y_archivo_sin_cabecera(tmp_path):
+    ruta = tmp_path / "entregas.jsonl"
+    ruta.write_text(json.dumps({'patente': "AA000AA", 'fecha': "2099-01-01T00:00:00"}) + "\n" + '{"patente": "BB0', encoding='utf-8')
+    libro = LibroEntregas(str(ruta))
+    assert libro.patentes() == {"AA000AA"}
+    assert json.loads(ruta.read_text(encoding='utf-8').splitlines()[0]).keys() == {'generacion'}
+    libro.registrar(["CC000CC"])
+    assert LibroEntregas(str(ruta)).patentes() == {"AA000AA", "CC000CC"}
+    assert not [n for n in os.listdir(tmp_path) if n.endswith((".tmp", ".lock"))]